@@ -17,7 +17,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from qsweepy.instrument_drivers.instrument import Instrument
+from qsweepy.instrument_drivers.instrument import Instrument, SCPITransport
 from matplotlib import pyplot as plt
 import visa
 import types
@@ -48,7 +48,9 @@ class AgilentE5071C(Instrument):
         Instrument.__init__(self, name, tags=['physical'])
 
         self._address = address
-        self._visainstrument = visa.ResourceManager().open_resource(self._address)# no term_chars for GPIB!!!!!
+        # FORM:DATA REAL is the 64-bit binary format of the E5071C
+        self._visainstrument = SCPITransport(visa.ResourceManager().open_resource(self._address),
+                                             trace_format='FORM:DATA REAL;:FORM:BORD SWAP')# no term_chars for GPIB!!!!!
 
         self._zerospan = False
         self._freqpoints = 0
@@ -199,10 +201,7 @@ class AgilentE5071C(Instrument):
 
     def init(self):
         #self._visainstrument.write(":TRIG:SING")
-        self._visainstrument.write(":STAT:OPER:ENAB 16")
-        self._visainstrument.write(":STAT:QUES:ENAB 16")
-        self._visainstrument.write("*SRE 128")
-        self._visainstrument.write("*TRG")
+        self._visainstrument.write(":STAT:OPER:ENAB 16;:STAT:QUES:ENAB 16;*SRE 128;*TRG")
         #self._visainstrument.ask("*OPC?")
         #if self._zerospan:
         #  self._visainstrument.write('INIT1;*wai')
@@ -314,7 +313,7 @@ class AgilentE5071C(Instrument):
         else: return False
 
     def get_data(self):
-        data = self._visainstrument.query_binary_values("CALCulate:DATA? SDATA", datatype=u'f')
+        data = self._visainstrument.query_trace("CALCulate:DATA? SDATA")
         data_size = numpy.size(data)
         datareal = numpy.array(data[0:data_size:2])
         dataimag = numpy.array(data[1:data_size:2])
@@ -344,10 +343,7 @@ class AgilentE5071C(Instrument):
         #data = self._visainstrument.ask_for_values(':FORMAT REAL,32;CALC:DATA? SDATA;',format=visa.double)
         #data = self._visainstrument.ask_for_values('FORM:DATA REAL; FORM:BORD SWAPPED; CALC%i:SEL:DATA:SDAT?'%(self._ci), format = visa.double)
         #test
-        self._visainstrument.write("FORM:DATA REAL32;")
-        self._visainstrument.write("FORM:BORD SWAP")
-
-        values = self._visainstrument.query_binary_values("CALC1:DATA:SDAT?")
+        values = self._visainstrument.query_trace("CALC1:DATA:SDAT?")
         return numpy.array(values)[0:-1:2] + 1j*numpy.array(values)[1::2]
 
     def get_sweep_time(self):
@@ -524,12 +520,11 @@ class AgilentE5071C(Instrument):
         return {'S-parameter':data}
 
     def set_xlim(self, start, stop):
-        logging.debug(__name__ + ' : setting start freq to %s Hz' % start)
-        self._visainstrument.write('SENS{:d}:FREQ:SPAN {:e}'.format(self._ci,stop-start))
-        self._visainstrument.write('SENS%i:FREQ:STAR %f' % (self._ci,start))
-
-        logging.debug(__name__ + ' : setting stop freq to %s Hz' % stop)
-        self._visainstrument.write('SENS%i:FREQ:STOP %f' % (self._ci,stop))
+        logging.debug(__name__ + ' : setting start freq to %s Hz, stop freq to %s Hz' % (start, stop))
+        with self._visainstrument.batch():
+            self._visainstrument.write('SENS{:d}:FREQ:SPAN {:e}'.format(self._ci,stop-start))
+            self._visainstrument.write('SENS%i:FREQ:STAR %f' % (self._ci,start))
+            self._visainstrument.write('SENS%i:FREQ:STOP %f' % (self._ci,stop))
 
     def get_xlim(self):
         start = self.get_startfreq();
@@ -16,7 +16,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA	 02110-1301	 USA
 
-from qsweepy.instrument_drivers.instrument import Instrument
+from qsweepy.instrument_drivers.instrument import Instrument, SCPITransport
 import visa
 import types
 import logging
@@ -45,7 +45,7 @@ class Agilent_E8257D(Instrument):
 
 		# Add some global constants
 		self._address = address
-		self._visainstrument = visa.ResourceManager().open_resource(self._address)
+		self._visainstrument = SCPITransport(visa.ResourceManager().open_resource(self._address))
 
 		self.add_parameter('power',
 			flags=Instrument.FLAG_GETSET, units='dBm', minval=-20, maxval=18, type=float)
@@ -17,13 +17,14 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from qsweepy.instrument_drivers.instrument import Instrument
+from qsweepy.instrument_drivers.instrument import Instrument, SCPITransport
 from matplotlib import pyplot as plt
 import visa
 import types
 import logging
-from time import sleep
+from time import sleep, perf_counter
 import numpy
+from qsweepy.instrument_drivers.vna_segments import *
 
 
 class Agilent_N5242A(Instrument):
@@ -49,7 +50,7 @@ class Agilent_N5242A(Instrument):
         Instrument.__init__(self, name, tags=['physical'])
 
         self._address = address
-        self._visainstrument = visa.ResourceManager().open_resource(self._address)# no term_chars for GPIB!!!!!
+        self._visainstrument = SCPITransport(visa.ResourceManager().open_resource(self._address))# no term_chars for GPIB!!!!!
 
         self._zerospan = False
         self._freqpoints = 0
@@ -57,6 +58,10 @@ class Agilent_N5242A(Instrument):
         self._start = 0
         self._stop = 0
         self._nop = 0
+        # segmented sweep definition, see set_segments()
+        self._segments = None
+        # estimated sweep duration, the status is only polled after 90% of it has passed
+        self._last_sweep_duration = 0
 
 
         # Implement parameters
@@ -308,7 +313,7 @@ class Agilent_N5242A(Instrument):
         else: return False
 
     def get_data(self):
-        data = self._visainstrument.query_binary_values("CALCulate:DATA? SDATA", datatype=u'f')
+        data = self._visainstrument.query_trace("CALCulate:DATA? SDATA")
         data_size = numpy.size(data)
         datareal = numpy.array(data[0:data_size:2])
         dataimag = numpy.array(data[1:data_size:2])
@@ -324,25 +329,26 @@ class Agilent_N5242A(Instrument):
         Output:
             'AmpPha':_ Amplitude and Phase
         '''
-        #Clear status, initiate measurement
-        self.write("*CLS")
-        self.init()
-        #Set bit in ESR when operation complete
-
-        self.write("*OPC")
-        #self.write("*OPC?")
+        #Clear status, initiate measurement and set bit in ESR when operation complete, all in one transaction
+        start = perf_counter()
+        self.write("*CLS;:INIT:IMM;*OPC")
         #Wait until ready and let plots to handle events (mouse drag and so on)
-        #print(self.ask("*ESR?"))
+        expected_remaining = 0.9*self._last_sweep_duration - (perf_counter() - start)
+        if expected_remaining > 0:
+            sleep(expected_remaining)
+        last_busy = None
         while int(self.ask("*ESR?"))==0:
+            last_busy = perf_counter() - start
             sleep(0.002)
+        #The sweep ended after the last busy status. If it was already done at the first check, the estimate
+        #was too long and is halved.
+        self._last_sweep_duration = last_busy if last_busy is not None else 0.5*self._last_sweep_duration
 
-
-        self._visainstrument.write(':FORMAT REAL,32; FORMat:BORDer SWAP;')
         #data = self._visainstrument.ask_for_values(':FORMAT REAL,32; FORMat:BORDer SWAP;*CLS; CALC:DATA? SDATA;*OPC',format=visa.single)
         #data = self._visainstrument.ask_for_values(':FORMAT REAL,32;CALC:DATA? SDATA;',format=visa.double)
         #data = self._visainstrument.ask_for_values('FORM:DATA REAL; FORM:BORD SWAPPED; CALC%i:SEL:DATA:SDAT?'%(self._ci), format = visa.double)
         #test
-        data = self._visainstrument.query_binary_values("CALCulate:DATA? SDATA", datatype=u'f')
+        data = self._visainstrument.query_trace("CALCulate:DATA? SDATA")
         data_size = numpy.size(data)
         datareal = numpy.array(data[0:data_size:2])
         dataimag = numpy.array(data[1:data_size:2])
@@ -528,6 +534,9 @@ class Agilent_N5242A(Instrument):
 
 #Frequency	
     def get_freqpoints(self):
+        if self._segments is not None:
+            self._freqpoints = segments_freqpoints(self._segments)
+            return self._freqpoints
         self._start = self.get_startfreq()
         self._stop = self.get_stopfreq()
         self._nop = self.get_nop()
@@ -535,6 +544,8 @@ class Agilent_N5242A(Instrument):
         return self._freqpoints
 
     def get_points(self):
+        if self._segments is not None:
+            return {'S-parameter':segments_points(self._segments)}
         return {'S-parameter':[('Frequency', self.get_freqpoints(), 'Hz')]}
 
     def get_dtype(self):
@@ -545,15 +556,45 @@ class Agilent_N5242A(Instrument):
 
     def measure(self):
         data = self.get_tracedata(format='realimag')
+        if self._segments is not None:
+            return {'S-parameter':segments_data(self._segments, data[0]+1j*data[1])}
         return {'S-parameter':(data[0]+1j*data[1])}
 
-    def set_xlim(self, start, stop):
-        logging.debug(__name__ + ' : setting start freq to %s Hz' % start)
-        self._visainstrument.write('SENS{:d}:FREQ:SPAN {:e}'.format(self._ci,stop-start))
-        self._visainstrument.write('SENS%i:FREQ:STAR %f' % (self._ci,start))
+    def set_segments(self, segments):
+        '''
+        Sets up a segmented sweep. All segments are measured with a single trigger and measure() returns them
+        as one block: segments that cover the same frequency window with different powers (or bandwidths) give
+        a 2-D power (bandwidth) vs frequency block, otherwise the trace covers the frequencies of all segments.
+
+        Input:
+            segments (list of dict): 'start', 'stop' (Hz), 'nop' and optionally 'power' (dBm) and 'bandwidth' (Hz)
+                of each segment; the channel power and bandwidth are used for segments that don't set them
+        '''
+        segments = normalize_segments(segments, power=self.get_power(), bandwidth=self.get_bandwidth())
+        segment_list = ','.join(['1,{:d},{:f},{:f},{:f},0,{:f}'.format(
+            segment['nop'], segment['start'], segment['stop'], segment['bandwidth'], segment['power'])
+            for segment in segments])
+        self._visainstrument.write('SENS{0:d}:SEGM:BWID:CONT ON;:SENS{0:d}:SEGM:POW:CONT ON;'
+                                   ':SENS{0:d}:SEGM:LIST SSTOP,{1:d},{2};:SENS{0:d}:SWE:TYPE SEGM'.format(
+                                   self._ci, len(segments), segment_list))
+        self._segments = segments
+
+    def clear_segments(self):
+        '''
+        Returns from a segmented sweep to a linear frequency sweep
+        '''
+        self._visainstrument.write('SENS%i:SWE:TYPE LIN' % self._ci)
+        self._segments = None
+
+    def get_segments(self):
+        return self._segments
 
-        logging.debug(__name__ + ' : setting stop freq to %s Hz' % stop)
-        self._visainstrument.write('SENS%i:FREQ:STOP %f' % (self._ci,stop))
+    def set_xlim(self, start, stop):
+        logging.debug(__name__ + ' : setting start freq to %s Hz, stop freq to %s Hz' % (start, stop))
+        with self._visainstrument.batch():
+            self._visainstrument.write('SENS{:d}:FREQ:SPAN {:e}'.format(self._ci,stop-start))
+            self._visainstrument.write('SENS%i:FREQ:STAR %f' % (self._ci,start))
+            self._visainstrument.write('SENS%i:FREQ:STOP %f' % (self._ci,stop))
 
     def get_xlim(self):
         start = self.get_startfreq();
@@ -805,6 +846,8 @@ class Agilent_N5242A(Instrument):
         logging.debug(__name__ + ' : setting sweep mode to "%s"' % mode)
         if mode.upper() in ["LIN", "LOG", "POW", "CW", "SEGM", "PHASE"]:
             self._visainstrument.write('SENS:SWE:TYPE %s' % mode.upper())
+            if mode.upper() != "SEGM":
+                self._segments = None
         else:
             raise ValueError('set_sweep_mode(mode): mode must be LIN | LOG | POW | CW | SEGM | PHASE')
 
@@ -1,4 +1,4 @@
-from qsweepy.instrument_drivers.instrument import Instrument
+from qsweepy.instrument_drivers.instrument import Instrument, SCPITransport
 import visa
 import types
 import logging
@@ -29,7 +29,7 @@ class Agilent_N9030A(Instrument):
 		Instrument.__init__(self, name, tags=['physical'])
 
 		self._address = address
-		self._visainstrument = visa.ResourceManager().open_resource(self._address)# no term_chars for GPIB!!!!!
+		self._visainstrument = SCPITransport(visa.ResourceManager().open_resource(self._address))# no term_chars for GPIB!!!!!
 		self._visainstrument.timeout = 400000
 		self._zerospan = False
 		self._freqpoints = 0
@@ -192,24 +192,22 @@ class Agilent_N9030A(Instrument):
 		Output:
 			'AmpPha':_ Amplitude and Phase
 		'''
-		#Clear status, initiate measurement
-		self.set_trigger_source("MAN")
-		self.write("*ESE 1")
-		self.write("*CLS")
-		self.init()
-			#Set bit in ESR when operation complete
-			
-		self.write("*OPC")
+		#Clear status, initiate measurement and set bit in ESR when operation complete, in as few writes as possible
+		with self._visainstrument.batch():
+			self.set_trigger_source("MAN")
+			self.write("*ESE 1")
+			self.write("*CLS")
+			self.init()
+			self.write("*OPC")
 		#Wait until ready and let plots to handle events (mouse drag and so on)
 		while int(self.ask("*ESR?"))==0:
 			plt.pause(0.05)
 		
-		self._visainstrument.write(':FORMAT REAL,32; FORMat:BORDer SWAP;')
 		#data = self._visainstrument.ask_for_values(':FORMAT REAL,32; FORMat:BORDer SWAP;*CLS; CALC:DATA? SDATA;*OPC',format=visa.single) 
 		#data = self._visainstrument.ask_for_values(':FORMAT REAL,32;CALC:DATA? SDATA;',format=visa.double) 
 		#data = self._visainstrument.ask_for_values('FORM:DATA REAL; FORM:BORD SWAPPED; CALC%i:SEL:DATA:SDAT?'%(self._ci), format = visa.double)      
 		#test
-		data = self._visainstrument.query_binary_values( "CALCulate:DATA?",datatype=u'f') 
+		data = self._visainstrument.query_trace("CALCulate:DATA?")
 		data_size = numpy.size(data)
 		datax = numpy.array(data[0:data_size:2])
 		datay = numpy.array(data[1:data_size:2])
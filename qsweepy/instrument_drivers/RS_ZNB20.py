@@ -17,13 +17,14 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from qsweepy.instrument_drivers.instrument import Instrument
+from qsweepy.instrument_drivers.instrument import Instrument, SCPITransport
 from matplotlib import pyplot as plt
 import visa
 import types
 import logging
-from time import sleep
+from time import sleep, perf_counter
 import numpy
+from qsweepy.instrument_drivers.vna_segments import *
 
 class RS_ZNB20(Instrument):
 	'''
@@ -47,7 +48,7 @@ class RS_ZNB20(Instrument):
 		Instrument.__init__(self, name, tags=['physical'])
 
 		self._address = address
-		self._visainstrument = visa.ResourceManager().open_resource(self._address)# no term_chars for GPIB!!!!!
+		self._visainstrument = SCPITransport(visa.ResourceManager().open_resource(self._address))# no term_chars for GPIB!!!!!
 		
 		self._zerospan = False
 		self._freqpoints = 0
@@ -55,6 +56,10 @@ class RS_ZNB20(Instrument):
 		self._start = 0
 		self._stop = 0
 		self._nop = 0
+		# segmented sweep definition, see set_segments()
+		self._segments = None
+		# estimated sweep duration, the status is only polled after 90% of it has passed
+		self._last_sweep_duration = 0
 
 		# Implement parameters
 		#Sweep
@@ -305,7 +310,7 @@ class RS_ZNB20(Instrument):
 		else: return False 
 		
 	def get_data(self):
-		data = self._visainstrument.query_binary_values("CALCulate:DATA? SDATA", datatype=u'f') 
+		data = self._visainstrument.query_trace("CALCulate:DATA? SDATA")
 		data_size = numpy.size(data)
 		datareal = numpy.array(data[0:data_size:2])
 		dataimag = numpy.array(data[1:data_size:2])
@@ -321,22 +326,26 @@ class RS_ZNB20(Instrument):
 		Output:
 			'AmpPha':_ Amplitude and Phase
 		'''
-		#Clear status, initiate measurement
-		self.write("*CLS")
-		self.init()
-		#Set bit in ESR when operation complete
-		
-		self.write("*OPC")
+		#Clear status, initiate measurement and set bit in ESR when operation complete, all in one transaction
+		start = perf_counter()
+		self.write("*CLS;:INIT:IMM;*OPC")
 		#Wait until ready and let plots to handle events (mouse drag and so on)
+		expected_remaining = 0.9*self._last_sweep_duration - (perf_counter() - start)
+		if expected_remaining > 0:
+			sleep(expected_remaining)
+		last_busy = None
 		while int(self.ask("*ESR?"))==0:
+			last_busy = perf_counter() - start
 			sleep(0.002)
-			
-		self._visainstrument.write(':FORMAT REAL,32; FORMat:BORDer SWAP;')
+		#The sweep ended after the last busy status. If it was already done at the first check, the estimate
+		#was too long and is halved.
+		self._last_sweep_duration = last_busy if last_busy is not None else 0.5*self._last_sweep_duration
+
 		#data = self._visainstrument.ask_for_values(':FORMAT REAL,32; FORMat:BORDer SWAP;*CLS; CALC:DATA? SDATA;*OPC',format=visa.single) 
 		#data = self._visainstrument.ask_for_values(':FORMAT REAL,32;CALC:DATA? SDATA;',format=visa.double) 
 		#data = self._visainstrument.ask_for_values('FORM:DATA REAL; FORM:BORD SWAPPED; CALC%i:SEL:DATA:SDAT?'%(self._ci), format = visa.double)	  
 		#test
-		data = self._visainstrument.query_binary_values("CALCulate:DATA? SDATA", datatype=u'f') 
+		data = self._visainstrument.query_trace("CALCulate:DATA? SDATA")
 		data_size = numpy.size(data)
 		datareal = numpy.array(data[0:data_size:2])
 		dataimag = numpy.array(data[1:data_size:2])
@@ -522,6 +531,9 @@ class RS_ZNB20(Instrument):
 		
 #Frequency	
 	def get_freqpoints(self):
+		if self._segments is not None:
+			self._freqpoints = segments_freqpoints(self._segments)
+			return self._freqpoints
 		self._start = self.get_startfreq()
 		self._stop = self.get_stopfreq()
 		self._nop = self.get_nop()
@@ -529,6 +541,8 @@ class RS_ZNB20(Instrument):
 		return self._freqpoints
 	
 	def get_points(self):
+		if self._segments is not None:
+			return {'S-parameter':segments_points(self._segments)}
 		return {'S-parameter':[('Frequency', self.get_freqpoints(), 'Hz')]}
 		
 	def get_dtype(self):
@@ -539,15 +553,47 @@ class RS_ZNB20(Instrument):
 
 	def measure(self):
 		data = self.get_tracedata(format='realimag')
+		if self._segments is not None:
+			return {'S-parameter':segments_data(self._segments, data[0]+1j*data[1])}
 		return {'S-parameter':(data[0]+1j*data[1])} 
 		
+	def set_segments(self, segments):
+		'''
+		Sets up a segmented sweep. All segments are measured with a single trigger and measure() returns them
+		as one block: segments that cover the same frequency window with different powers (or bandwidths) give
+		a 2-D power (bandwidth) vs frequency block, otherwise the trace covers the frequencies of all segments.
+
+		Input:
+			segments (list of dict): 'start', 'stop' (Hz), 'nop' and optionally 'power' (dBm) and 'bandwidth' (Hz)
+				of each segment; the channel power and bandwidth are used for segments that don't set them
+		'''
+		segments = normalize_segments(segments, power=self.get_power(), bandwidth=self.get_bandwidth())
+		commands = ['SENS{:d}:SEGM:DEL:ALL'.format(self._ci)]
+		for segment_id, segment in enumerate(segments, 1):
+			commands.append('SENS{0:d}:SEGM{1:d}:ADD;:SENS{0:d}:SEGM{1:d}:FREQ:STAR {2:f};:SENS{0:d}:SEGM{1:d}:FREQ:STOP {3:f};'
+							':SENS{0:d}:SEGM{1:d}:SWE:POIN {4:d};:SENS{0:d}:SEGM{1:d}:POW {5:f};'
+							':SENS{0:d}:SEGM{1:d}:BWID {6:f}'.format(self._ci, segment_id, segment['start'], segment['stop'],
+																	segment['nop'], segment['power'], segment['bandwidth']))
+		commands.append('SENS{:d}:SWE:TYPE SEGM'.format(self._ci))
+		self._visainstrument.write(';:'.join(commands))
+		self._segments = segments
+
+	def clear_segments(self):
+		'''
+		Returns from a segmented sweep to a linear frequency sweep
+		'''
+		self._visainstrument.write('SENS%i:SWE:TYPE LIN' % self._ci)
+		self._segments = None
+
+	def get_segments(self):
+		return self._segments
+
 	def set_xlim(self, start, stop):
-		logging.debug(__name__ + ' : setting start freq to %s Hz' % start)
-		self._visainstrument.write('SENS{:d}:FREQ:SPAN {:e}'.format(self._ci,stop-start)) 
-		self._visainstrument.write('SENS%i:FREQ:STAR %f' % (self._ci,start))   
-		
-		logging.debug(__name__ + ' : setting stop freq to %s Hz' % stop)
-		self._visainstrument.write('SENS%i:FREQ:STOP %f' % (self._ci,stop))  
+		logging.debug(__name__ + ' : setting start freq to %s Hz, stop freq to %s Hz' % (start, stop))
+		with self._visainstrument.batch():
+			self._visainstrument.write('SENS{:d}:FREQ:SPAN {:e}'.format(self._ci,stop-start))
+			self._visainstrument.write('SENS%i:FREQ:STAR %f' % (self._ci,start))
+			self._visainstrument.write('SENS%i:FREQ:STOP %f' % (self._ci,stop))
 		
 	def get_xlim(self):
 		start = self.get_startfreq();
@@ -799,6 +845,8 @@ class RS_ZNB20(Instrument):
 		logging.debug(__name__ + ' : setting sweep mode to "%s"' % mode)
 		if mode.upper() in ["LIN", "LOG", "POW", "CW", "SEGM", "PHASE"]:
 			self._visainstrument.write('SENS:SWE:TYPE %s' % mode.upper())
+			if mode.upper() != "SEGM":
+				self._segments = None
 		else:
 			raise ValueError('set_sweep_mode(mode): mode must be LIN | LOG | POW | CW | SEGM | PHASE')	
 	
@@ -18,6 +18,7 @@
 
 from ctypes import *
 from qsweepy.instrument_drivers.instrument import Instrument
+from qsweepy.instrument_drivers.spectrum_accumulator import SpectrumAccumulator
 from qsweepy.instrument_drivers._Spectrum_M3i2132.errors import errors as _spcm_errors
 import qsweepy.instrument_drivers._Spectrum_M3i2132.regs as _spcm_regs
 import pickle
@@ -1492,15 +1493,17 @@ class Spectrum_M3i2132(Instrument):
 		lSegsize = int(self.get_nop())
 		lnumber_of_segments = int(lMemsize / lSegsize)
 		
-		data = numpy.zeros((2, lnumber_of_segments*self.software_nums_multi, lSegsize), dtype=numpy.float)
-		
-		for i in range(self.software_averages):
-			for j in range(self.software_nums_multi):
-				self.start_with_trigger_and_waitready()
-				data[:,j*lnumber_of_segments:(j+1)*lnumber_of_segments,:] = \
-						self.readout_doublechannel_multimode_bin()/float(self.software_averages)
-				self.stop()
-		return {'Voltage':(data[0,:,:]+1j*data[1,:,:])}
+		# raw buffers are summed in the background while the card acquires the next one
+		accumulator = SpectrumAccumulator(lnumber_of_segments, lSegsize, self.software_nums_multi)
+		try:
+			for i in range(self.software_averages):
+				for j in range(self.software_nums_multi):
+					self.start_with_trigger_and_waitready()
+					accumulator.add(j, self.readout_raw_buffer(nr_of_channels=2))
+					self.stop()
+		finally:
+			accumulator.close()
+		return {'Voltage':accumulator.get_data(self.software_averages)}
 	
 	def readout_doublechannel_multimode_bin(self):
 		lMemsize = self.get_memsize()
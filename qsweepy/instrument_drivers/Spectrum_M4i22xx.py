@@ -7,6 +7,7 @@ from ctypes import *
 import numpy
 
 from qsweepy.instrument_drivers.instrument import Instrument
+from qsweepy.instrument_drivers.spectrum_accumulator import SpectrumAccumulator
 
 # load errors for easier access
 from qsweepy.instrument_drivers._Spectrum_M4i22xx.spcerr import * 
@@ -546,17 +547,20 @@ class Spectrum_M4i22xx(Instrument):
 		lSegsize = int(self.get_nop())
 		lnumber_of_segments = int(lMemsize / lSegsize)
 		
-		data = numpy.zeros((2, lnumber_of_segments*self.software_nums_multi, lSegsize), dtype=numpy.float)
+		# raw buffers are summed in the background while the card acquires the next one
+		accumulator = SpectrumAccumulator(lnumber_of_segments, lSegsize, self.software_nums_multi)
 		#print ('Start readout')
-		for i in range(self.software_averages):
-			for j in range(self.software_nums_multi):
-				#print ('Start hardware readout')
-				self.start()
-				#print ('Get data bin')
-				data[:,j*lnumber_of_segments:(j+1)*lnumber_of_segments,:] = self.get_data_bin()/float(self.software_averages)
-				self.stop()
-				#print ('Stop hardware readout')
-		return {'Voltage':(data[0,:,:]+1j*data[1,:,:])}
+		try:
+			for i in range(self.software_averages):
+				for j in range(self.software_nums_multi):
+					#print ('Start hardware readout')
+					self.start()
+					accumulator.add(j, self.readout_raw_buffer(nr_of_channels=2))
+					self.stop()
+					#print ('Stop hardware readout')
+		finally:
+			accumulator.close()
+		return {'Voltage':accumulator.get_data(self.software_averages)}
 		#print ('End readout')
 	
 	
@@ -35,6 +35,10 @@ class TSW14J56_evm_reducer():
 		self.devtype = 'SK'
 		self.result_source = 'avg_cov'
 		self.internal_avg = True
+		# discriminator counters read after the last capture, they are the starting values for the next one
+		self.counters = None
+		self.counters_capture_count = None
+		self.armed_counters = None
 		#self.avg_cov_mode = 'norm_cmplx' ## normalized results in complex Volts, IQ
 
 	def set_internal_avg(self, internal_avg):
@@ -98,29 +102,65 @@ class TSW14J56_evm_reducer():
 			opts.update({'resultnumbers': {'log': None}})
 		return (opts)
 
-	def measure(self):
-		result = {}
+	def read_counters(self):
+		counters = {}
 		if self.avg_cov:
-			avg_before =  {'avg_cov'+str(i):self.adc.get_cov_result_avg(i) for i in range(self.adc.num_covariances)}
+			counters['avg_cov'] = self.adc.get_cov_results_avg()
 		if self.resultnumber:
-			resultnumbers_before = self.adc.get_resultnumbers()
-		self.adc.capture(trig=self.trig, cov = (self.last_cov or self.avg_cov or self.resultnumber))
+			counters['resultnumbers'] = self.adc.get_resultnumbers()
+		return counters
+
+	def counters_before(self):
+		counter_names = set(['avg_cov']*self.avg_cov + ['resultnumbers']*self.resultnumber)
+		# the counters only change on capture, so the values read after the previous measurement can be reused
+		if self.counters is not None and self.counters_capture_count == self.adc.capture_count and \
+				counter_names <= set(self.counters.keys()):
+			return self.counters
+		return self.read_counters()
+
+	def read_results(self, before):
+		result = {}
+		after = self.read_counters()
+		self.counters = after
+		self.counters_capture_count = self.adc.capture_count
 		if self.output_raw:
 			result.update({'Voltage':self.adc.get_data()})
 		if self.last_cov:
-			result.update({'last_cov'+str(i):self.adc.get_cov_result(i)/self.cov_norms[i] for i in range(self.adc.num_covariances)})
+			cov_results = self.adc.get_cov_results()
+			result.update({'last_cov'+str(i):cov_results[i]/self.cov_norms[i] for i in range(self.adc.num_covariances)})
 		if self.avg_cov:
-			result_raw = {'avg_cov'+str(i):(self.adc.get_cov_result_avg(i)-avg_before['avg_cov'+str(i)])/self.cov_norms[i] for i in range(self.adc.num_covariances)}
+			result_raw = {'avg_cov'+str(i):(after['avg_cov'][i]-before['avg_cov'][i])/self.cov_norms[i] for i in range(self.adc.num_covariances)}
 			if self.avg_cov_mode == 'real':
 				result.update(result_raw)
 			elif self.avg_cov_mode == 'iq':
 				result.update({'avg_cov0': (result_raw['avg_cov0']+1j*result_raw['avg_cov1']),
 							   'avg_cov1': (result_raw['avg_cov2']+1j*result_raw['avg_cov3'])})
 		if self.resultnumber:
-			result.update({'resultnumbers': [a-b for a,b in zip(self.adc.get_resultnumbers(), resultnumbers_before)][:self.resultnumbers_dimension]})
+			result.update({'resultnumbers': [a-b for a,b in zip(after['resultnumbers'], before['resultnumbers'])][:self.resultnumbers_dimension]})
 
 		return (result)
 
+	def measure(self):
+		before = self.counters_before()
+		self.adc.capture(trig=self.trig, cov = (self.last_cov or self.avg_cov or self.resultnumber))
+		return self.read_results(before)
+
+	def arm(self):
+		'''
+		Starts a capture without waiting for it, the results are returned by collect(). Settings of the
+		reducer and of the board must not change between arm() and collect().
+		'''
+		self.armed_counters = self.counters_before()
+		self.adc.arm(trig=self.trig, cov = (self.last_cov or self.avg_cov or self.resultnumber))
+
+	def collect(self, timeout=None):
+		'''
+		Waits for the capture started by arm() and reads its results, like measure(). Raises TimeoutError if the
+		capture doesn't finish within timeout (defaults to the timeout of the board).
+		'''
+		self.adc.wait_capture(timeout=timeout)
+		return self.read_results(self.armed_counters)
+
 	def set_feature_iq(self, feature_id, feature):
 		#self.avg_cov_mode = 'norm_cmplx'
 		feature = feature[:self.adc.ram_size]/np.max(np.abs(feature[:self.adc.ram_size]))
@@ -161,11 +201,22 @@ class TSW14J56_evm():
 		self.nsegm = 1
 		#Capture timeout
 		self.timeout = 3
+		# Capture completion polling: the interval doubles from poll_interval_min up to poll_interval_max
+		self.poll_interval_min = 1e-4
+		self.poll_interval_max = 1e-2
+		self.armed = False
+		self.arm_time = None
+		self.last_capture_time = None
 		self.ram_size = 2048 #in words of 32
 		self.num_covariances = 4
 
 		self.usb_reboot_timeout = 10
 		self.debug_print = False
+		# Read consecutive registers with one USB transfer. Needs firmware that serves REG_READ requests
+		# longer than 4 bytes from consecutive registers.
+		self.block_reads = False
+		# Incremented on every capture and reset, used by the reducer to validate cached counter values
+		self.capture_count = 0
 		# self.fpga_firmware = "_ADS54J40/qubit_daq.rbf"
 		self.fpga_firmware = config.get_config()['TSW14J56_firmware']
 		self.adc_reducer_hooks = []
@@ -235,6 +286,7 @@ class TSW14J56_evm():
 
 	def system_reset(self):
 		self.write_reg(FX3_BASE, FX3_RST, 1)
+		self.capture_count += 1
 		return
 
 	def reset(self):
@@ -285,9 +337,41 @@ class TSW14J56_evm():
 		if(self.debug_print): print( "Read:", hex(Value), hex(Index), hex(data) )
 		return data
 
-	def capture(self, trig = "man", cov = False, fifo = True):
+	def read_reg_block(self, base, offset, count):
+		'''
+		Reads count consecutive 32-bit registers starting at base+offset (register offsets are spaced by 4)
+
+		Input:
+			base, offset: address of the first register
+			count: number of registers
+		Output:
+			data: raw big-endian register contents, 4*count bytes
+		'''
+		if self.block_reads:
+			Value, Index = mk_val_ind((base + offset)<<2)
+			data = bytes(self.dev.ctrl_transfer(vend_req_dir.RD, vend_req.REG_READ, Value, Index, 4*count))
+		else:
+			data = b''
+			for i in range(count):
+				Value, Index = mk_val_ind((base + offset + i*4)<<2)
+				data += bytes(self.dev.ctrl_transfer(vend_req_dir.RD, vend_req.REG_READ, Value, Index, 4))
+		if(self.debug_print): print( "Block read:", hex(base + offset), count )
+		return data
+
+	def read_int64_block(self, offset, subbase):
+		'''
+		Reads the 64-bit values of all discriminators stored as low words at CAP_BASE+offset+ncov*4 and
+		high words at CAP_BASE+offset+subbase+ncov*4 with a single block read.
+		'''
+		words = frombuffer(self.read_reg_block(CAP_BASE, offset, subbase//4 + self.num_covariances), dtype = uint32odd)
+		low = words[:self.num_covariances]
+		high = words[subbase//4:subbase//4 + self.num_covariances]
+		return frombuffer(stack([high, low], axis=1).astype(uint32odd).tobytes(), dtype = dtype(int64).newbyteorder('>'))
+
+	def arm(self, trig = "man", cov = False, fifo = True):
 		'''
-		Function starts data acquisition
+		Starts data acquisition and returns immediately, use capture_done() or wait_capture() to find out when it
+		has finished
 
 		Input:
 			trig: Way to trigger acquisition process: 'man' - after using the function, 'ext' - after external trigger occures
@@ -297,7 +381,6 @@ class TSW14J56_evm():
 		Output:
 			None
 		'''
-		start = time.time()
 		self.write_reg(CAP_BASE, CAP_SEGM_NUM, int(self.nsegm))
 		if (cov):
 			self.write_reg(CAP_BASE, COV_LEN, int(self.nsamp/8))
@@ -309,20 +392,61 @@ class TSW14J56_evm():
 			self.write_reg(CAP_BASE, CAP_CTRL, 1<<CAP_CTRL_START |fifo << FIFO_ST )
 		elif(trig == "ext"):
 			self.write_reg(CAP_BASE, CAP_CTRL, 1<<CAP_CTRL_START| 1<<CAP_CTRL_EXT_TRIG |cov << COV_ST |fifo << FIFO_ST)
-		else: return
+		else:
+			raise ValueError('Unknown trigger mode: {}'.format(trig))
+		self.arm_time = time.perf_counter()
+		self.armed = True
 
-		t1 = time.time()
-		while(1):
-			if( not( self.read_reg(CAP_BASE, CAP_CTRL) & 1<<CAP_CTRL_BUSY ) ):
-				break
-			else:
-				if(self.debug_print): print("Busy..")
+	def capture_done(self):
+		'''
+		Checks the busy bit of the capture controller (a single register read)
+		'''
+		return not (self.read_reg(CAP_BASE, CAP_CTRL) & 1<<CAP_CTRL_BUSY)
 
-			if(time.time()-t1>self.timeout):
-				print ("Capture failed")
-				self.write_reg(CAP_BASE, CAP_CTRL, 1 << CAP_CTRL_ABORT)
-				break
+	def wait_capture(self, timeout = None):
+		'''
+		Waits for the capture started by arm() to finish. The busy bit is polled with intervals growing from
+		poll_interval_min to poll_interval_max; the thread sleeps in between, so other threads (e.g. the
+		postprocessing of a pipelined sweep) run while the FPGA captures.
+
+		Input:
+			timeout: maximum time since arm() in seconds, defaults to self.timeout
+
+		Output:
+			duration of the capture in seconds
+
+		Raises TimeoutError if the capture hasn't finished in time, the capture is aborted in that case.
+		'''
+		if not self.armed:
+			raise RuntimeError('wait_capture() called without arm()')
+		if timeout is None:
+			timeout = self.timeout
+		interval = self.poll_interval_min
+		try:
+			while not self.capture_done():
+				if(self.debug_print): print("Busy..")
+				if time.perf_counter() - self.arm_time > timeout:
+					self.write_reg(CAP_BASE, CAP_CTRL, 1 << CAP_CTRL_ABORT)
+					raise TimeoutError('TSW14J56 capture did not finish in {} s'.format(timeout))
+				time.sleep(interval)
+				interval = minimum(interval * 2, self.poll_interval_max)
+		finally:
+			self.armed = False
+			self.capture_count += 1
 		if(self.debug_print): print("Done!")
+		self.last_capture_time = time.perf_counter() - self.arm_time
+		return self.last_capture_time
+
+	def capture(self, trig = "man", cov = False, fifo = True):
+		'''
+		Function starts data acquisition and waits for it to finish, see arm() for the arguments
+		'''
+		start = time.time()
+		self.arm(trig = trig, cov = cov, fifo = fifo)
+		try:
+			self.wait_capture()
+		except TimeoutError:
+			print ("Capture failed")
 
 		stop = time.time()
 		print('Time for capture', stop - start)
@@ -380,17 +504,14 @@ class TSW14J56_evm():
 		Input:
 			ncov: Number of OnChip Memory to write the data (From 0 to 3)
 		Output:
-			data: ...
+			data: list of nsamp arrays of the two int16 values stored in each word
 		'''
-		data_RAM = []
 		dty = dtype(int16)
 		dty = dty.newbyteorder('>')
 
-		for i in range(self.nsamp):
-			Value, Index = mk_val_ind((RAM_BASE + (i+ ncov*self.ram_size)*4)<<2)
-			data_RAM.append(frombuffer(self.dev.ctrl_transfer(vend_req_dir.RD, vend_req.REG_READ, Value, Index,4), dtype = dty))
+		data_RAM = frombuffer(self.read_reg_block(RAM_BASE, ncov*self.ram_size*4, self.nsamp), dtype = dty)
 
-		return (data_RAM)
+		return (list(reshape(data_RAM, (self.nsamp, 2))))
 
 	def set_threshold(self, thresh, ncov):
 		'''
@@ -466,6 +587,18 @@ class TSW14J56_evm():
 		print('Time of cow data transfer', stop - start)
 		return (q)
 
+	def get_cov_results(self):
+		'''
+		Last covariance coefficients of all discriminators, read with a single block read
+		'''
+		return self.read_int64_block(COV_RES_BASE, COV_RES_SUBBASE)
+
+	def get_cov_results_avg(self):
+		'''
+		Averaged covariance coefficients of all discriminators, read with a single block read
+		'''
+		return self.read_int64_block(COV_RESAVG_BASE, COV_RESAVG_SUBBASE)
+
 	def get_resultnumbers(self):
 		'''
 		Function returns amount of times each discrimination result happens
@@ -477,11 +610,8 @@ class TSW14J56_evm():
 		'''
 		dt = dtype(int32)
 		dt = dt.newbyteorder('>')
-		b0 = []
-		for i in range(16):
-			a,v = mk_val_ind((CAP_BASE + COV_NUMB_BASE + i*4)<<2)
-			b0.append(frombuffer(self.dev.ctrl_transfer(vend_req_dir.RD, vend_req.REG_READ,a,v,4 ), dtype = dt)[0])
-		return (b0)
+		b0 = frombuffer(self.read_reg_block(CAP_BASE, COV_NUMB_BASE, 16), dtype = dt)
+		return (list(b0))
 
 	def set_trig_src_period(self, period):
 		'''
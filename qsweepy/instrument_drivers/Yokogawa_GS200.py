@@ -17,7 +17,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from qsweepy.instrument_drivers.instrument import Instrument
+from qsweepy.instrument_drivers.instrument import Instrument, SCPITransport
 import visa
 import types
 import time
@@ -59,7 +59,7 @@ class Yokogawa_GS210(Instrument):
         Instrument.__init__(self, 'Yokogawa_GS210', tags=['physical'])
         self._address = address
         rm = visa.ResourceManager()
-        self._visainstrument = rm.open_resource(self._address)
+        self._visainstrument = SCPITransport(rm.open_resource(self._address))
 
         current_range = (-200e-3, 200e-3)
         voltage_range = (-32, 32)
@@ -99,13 +99,18 @@ class Yokogawa_GS210(Instrument):
         #self.set_current(0)
         #self.set_status(1)
 
+    def get_source_function(self):
+        '''Source function, "CURR" or "VOLT"'''
+        # always queried: the mode can be changed from the front panel or by another client
+        return self._visainstrument.ask(":SOUR:FUNC?").strip()
+
     def get_id(self):
         '''Get basic info on device'''
         return self._visainstrument.ask("*IDN?")
 
     def do_set_current(self, current):
         '''Set current'''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "VOLT\n"):
+        if (self.get_source_function() == "VOLT"):
             print("Tough luck, mode is voltage source, cannot set current.")
             return False
         else:
@@ -117,14 +122,14 @@ class Yokogawa_GS210(Instrument):
 
     def do_get_current(self):
         '''Get current'''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "VOLT\n"):
+        if (self.get_source_function() == "VOLT"):
             print("Tough luck, mode is voltage source, cannot get current.")
             return False
         return float(self._visainstrument.ask("SOUR:LEVEL?"))
 
     def do_set_voltage(self, voltage):
         '''Set voltage'''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "CURR\n"):
+        if (self.get_source_function() == "CURR"):
             print("Tough luck, mode is current source, cannot get voltage.")
             return False
         else:
@@ -136,7 +141,7 @@ class Yokogawa_GS210(Instrument):
 
     def do_get_voltage(self):
         '''Get voltage'''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "CURR\n"):
+        if (self.get_source_function() == "CURR"):
             print("Tough luck, mode is current source, cannot get voltage.")
             return False
         return float(self._visainstrument.ask("SOUR:LEVEL?"))
@@ -162,7 +167,7 @@ class Yokogawa_GS210(Instrument):
 
     def do_set_voltage_compliance(self, compliance):
         '''Set compliance voltage'''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "VOLT\n"):
+        if (self.get_source_function() == "VOLT"):
             print("Tough luck, mode is voltage source, cannot set voltage compliance.")
             return False
         self._visainstrument.write("SOUR:PROT:VOLT %e"%compliance)
@@ -173,7 +178,7 @@ class Yokogawa_GS210(Instrument):
 
     def do_set_current_compliance(self, compliance):
         '''Set compliance current'''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "CURR\n"):
+        if (self.get_source_function() == "CURR"):
             print("Tough luck, mode is current source, cannot set current compliance.")
             return False
         self._visainstrument.write("SOUR:PROT:CURR %e"%compliance)
@@ -185,13 +190,13 @@ class Yokogawa_GS210(Instrument):
 
     def do_set_range(self, maxval):
         '''Set current range in A'''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "CURR\n"):
+        if (self.get_source_function() == "CURR"):
             if not (maxval in self.current_ranges_supported):
                 print("Given current range is invalid. Please enter valid current range in !!!Amperes!!!\nValid ranges are (in A): {0}".format(self.current_ranges_supported))
                 return False
             else:
                 self._visainstrument.write("SOUR:RANG %e"%maxval)
-        if(self._visainstrument.ask(":SOUR:FUNC?") == "VOLT\n"):
+        if(self.get_source_function() == "VOLT"):
             if not (maxval in self.voltage_ranges_supported):
                 print("Given voltage range is invalid. Please enter valid voltage range in !!!Volts!!!\nValid ranges are (in A): {0}".format(self.voltage_ranges_supported))
                 return False
@@ -218,7 +223,7 @@ class Yokogawa_GS210(Instrument):
         Returns:
             True if the mode was changed, False otherwise
         '''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "VOLT\n"):
+        if (self.get_source_function() == "VOLT"):
             return False
         else:
             self._visainstrument.write(":SOUR:FUNC VOLT")
@@ -232,7 +237,7 @@ class Yokogawa_GS210(Instrument):
         Returns:
             True if the mode was changed, False otherwise
         '''
-        if (self._visainstrument.ask(":SOUR:FUNC?") == "CURR\n"):
+        if (self.get_source_function() == "CURR"):
             return False
         else:
             self._visainstrument.write(":SOUR:FUNC CURR")
@@ -241,7 +246,7 @@ class Yokogawa_GS210(Instrument):
 
     def set_current_limits(self, mincurrent = -1E-3, maxcurrent = 1E-3):
     	''' Sets a limits within the range if needed for safe sweeping'''
-    	if (self._visainstrument.ask(":SOUR:FUNC?") == "CURR\n"):
+    	if (self.get_source_function() == "CURR"):
     		if mincurrent >= -1.2*self.get_range():
        			self._mincurrent = mincurrent
     		else:
@@ -255,7 +260,7 @@ class Yokogawa_GS210(Instrument):
 
     def set_voltage_limits(self, minvoltage = -1E-3, maxvoltage = 1E-3):
     	''' Sets a voltage limits within the range if needed for safe sweeping'''
-    	if (self._visainstrument.ask(":SOUR:FUNC?") == "VOLT\n"):
+    	if (self.get_source_function() == "VOLT"):
     		if minvoltage >= -1*self.get_range():
        			self._minvoltage = minvoltage
     		else:
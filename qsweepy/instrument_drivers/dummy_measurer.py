@@ -0,0 +1,74 @@
+import numpy as np
+import time
+class DummyMeasurer:
+	'''
+	Has the pythonic interfaces of a measurer, but doesn't have an actual piece of hardware on the other end.
+	Acquisition and reduction take a configurable amount of time, which makes it usable for benchmarking sweeps.
+	'''
+	def __init__(self, nop=1024, acquisition_time=0., reduction_time=0., seed=None):
+		self.nop = nop
+		self.acquisition_time = acquisition_time
+		self.reduction_time = reduction_time
+		self.random = np.random.RandomState(seed)
+
+	def get_points(self):
+		return {'Voltage': [('Sample', np.arange(self.nop), '')]}
+	def get_dtype(self):
+		return {'Voltage': complex}
+	def get_opts(self):
+		return {'Voltage': {}}
+
+	def acquire(self):
+		'''
+		Simulates the instrument integrating: sleeps acquisition_time and returns a raw trace.
+		'''
+		time.sleep(self.acquisition_time)
+		return self.random.randn(self.nop)+1j*self.random.randn(self.nop)
+	def reduce(self, data):
+		'''
+		Simulates host-side postprocessing of a raw trace: sleeps reduction_time.
+		'''
+		time.sleep(self.reduction_time)
+		return {'Voltage': data}
+	def measure(self):
+		return self.reduce(self.acquire())
+
+
+class DummyResonator:
+	'''
+	Synthetic resonator with flux-dependent frequency, measured by a single-point VNA.
+	Serves as a test target for two-tone-like current-vs-frequency maps: the response is flat background
+	everywhere except for a narrow dip along the resonator dispersion curve.
+	'''
+	def __init__(self, f_max=7e9, f_min=6.9e9, period=1e-3, sweet_spot=0., q=1e4, qc=2e4, noise=0.):
+		self.f_max = f_max
+		self.f_min = f_min
+		self.period = period
+		self.sweet_spot = sweet_spot
+		self.q = q
+		self.qc = qc
+		self.noise = noise
+		self.current = 0.
+		self.frequency = f_max
+
+	def set_current(self, current):
+		self.current = current
+	def set_frequency(self, frequency):
+		self.frequency = frequency
+
+	def get_resonator_frequency(self, current):
+		return self.f_min+(self.f_max-self.f_min)*np.abs(np.cos(np.pi*(current-self.sweet_spot)/self.period))
+
+	def get_points(self):
+		return {'S21': []}
+	def get_dtype(self):
+		return {'S21': complex}
+	def get_opts(self):
+		return {'S21': {}}
+
+	def measure(self):
+		fr = self.get_resonator_frequency(self.current)
+		s21 = 1-(self.q/self.qc)/(1+2j*self.q*(self.frequency-fr)/fr)
+		if self.noise:
+			s21 += self.noise*(np.random.randn()+1j*np.random.randn())
+		return {'S21': np.asarray(s21)}
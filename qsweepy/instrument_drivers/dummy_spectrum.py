@@ -0,0 +1,27 @@
+import numpy as np
+import ctypes
+import time
+
+
+class DummySpectrumDMA:
+	'''
+	Stand-in for the DMA readout of the Spectrum M3i/M4i digitizers: every acquisition takes dma_time and returns
+	a freshly allocated ctypes int8 buffer of segments*nop interleaved samples of each channel, like
+	readout_raw_buffer() after start(). The samples are random; the last acquired records are kept in records
+	(as int8 arrays of shape (segments, nop, channels)) so that averages can be checked.
+	'''
+	def __init__(self, segments, nop, channels=2, dma_time=0., seed=None):
+		self.segments = segments
+		self.nop = nop
+		self.channels = channels
+		self.dma_time = dma_time
+		self.random = np.random.RandomState(seed)
+		self.records = []
+
+	def acquire(self):
+		time.sleep(self.dma_time)
+		record = self.random.randint(-128, 128, size=(self.segments, self.nop, self.channels)).astype(np.int8)
+		self.records.append(record)
+		buffer = (ctypes.c_int8*record.size)()
+		ctypes.memmove(buffer, record.ctypes.data, record.size)
+		return buffer
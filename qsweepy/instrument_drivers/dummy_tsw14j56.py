@@ -0,0 +1,74 @@
+import numpy as np
+import threading
+import time
+from qsweepy.instrument_drivers._ADS54J40.usb_intf import vend_req, endpoints
+from qsweepy.instrument_drivers._ADS54J40.reg_intf import *
+
+
+class DummyTSW14J56USB:
+	'''
+	pyusb-compatible stand-in for the TSW14J56 board: a register model behind ctrl_transfer() that counts USB
+	transfers. A REG_READ of more than 4 bytes returns consecutive registers (offset stride 4), which is what
+	TSW14J56_evm.read_reg_block expects from firmware with block reads.
+
+	Starting a capture sets the busy bit for capture_time and then updates the discriminator counters and
+	covariance results with random values, so that the capture and readout code of the driver can be run
+	without hardware.
+	'''
+	def __init__(self, capture_time=1e-3, num_covariances=4, seed=None):
+		self.registers = {}
+		self.capture_time = capture_time
+		self.num_covariances = num_covariances
+		self.random = np.random.RandomState(seed)
+		self.transfers = 0
+		self.captures = 0
+
+	@staticmethod
+	def address(value, index):
+		return ((int(value) << 16) | int(index)) >> 2
+
+	def get(self, base, offset):
+		return self.registers.get(base + offset, 0)
+	def put(self, base, offset, value):
+		self.registers[base + offset] = int(value) & 0xffffffff
+
+	def ctrl_transfer(self, request_type, request, value, index, data_or_length):
+		self.transfers += 1
+		address = self.address(value, index)
+		if request == vend_req.REG_READ:
+			words = [self.registers.get(address + i*4, 0) for i in range(data_or_length//4)]
+			return np.asarray(words, dtype='>u4').tobytes()
+		elif request == vend_req.REG_WRITE:
+			self.registers[address] = int.from_bytes(bytes(data_or_length), byteorder='big')
+			if address == CAP_BASE + CAP_CTRL and self.registers[address] & (1 << CAP_CTRL_START):
+				self.start_capture()
+			elif address == CAP_BASE + CAP_CTRL and self.registers[address] & (1 << CAP_CTRL_ABORT):
+				self.put(CAP_BASE, CAP_CTRL, 0)
+			return len(data_or_length)
+
+	def start_capture(self):
+		self.put(CAP_BASE, CAP_CTRL, 1 << CAP_CTRL_BUSY)
+		threading.Thread(target=self.capture, daemon=True).start()
+
+	def capture(self):
+		time.sleep(self.capture_time)
+		nsegm = self.get(CAP_BASE, CAP_SEGM_NUM) or 1
+		for ncov in range(self.num_covariances):
+			result = int(self.random.randint(-2**40, 2**40))
+			self.put(CAP_BASE, COV_RES_BASE + ncov*4, result)
+			self.put(CAP_BASE, COV_RES_BASE + COV_RES_SUBBASE + ncov*4, result >> 32)
+			average = (self.get(CAP_BASE, COV_RESAVG_BASE + COV_RESAVG_SUBBASE + ncov*4) << 32) + \
+					  self.get(CAP_BASE, COV_RESAVG_BASE + ncov*4) + result
+			self.put(CAP_BASE, COV_RESAVG_BASE + ncov*4, average)
+			self.put(CAP_BASE, COV_RESAVG_BASE + COV_RESAVG_SUBBASE + ncov*4, average >> 32)
+		for state, count in enumerate(self.random.multinomial(nsegm, np.ones(16)/16)):
+			self.put(CAP_BASE, COV_NUMB_BASE + state*4, self.get(CAP_BASE, COV_NUMB_BASE + state*4) + count)
+		self.captures += 1
+		self.put(CAP_BASE, CAP_CTRL, 0)
+
+	def read(self, endpoint, length):
+		self.transfers += 1
+		return np.zeros(length, dtype=np.uint8).tobytes()
+	def write(self, endpoint, data):
+		self.transfers += 1
+		return len(data)
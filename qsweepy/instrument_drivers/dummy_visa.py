@@ -0,0 +1,143 @@
+import numpy as np
+import time
+
+
+class DummyVisaResource:
+	'''
+	Stand-in for a pyvisa message-based resource with a fixed latency per transaction (write, query or read),
+	for timing instrument drivers without hardware. Commands separated by ';' in one write are executed in order.
+	Settings are stored by header ('SENS1:FREQ:STAR 1e9' stores '1e9' under 'SENS1:FREQ:STAR') and returned by
+	the corresponding query; subclasses handle the commands that need more than that in command() and respond().
+	'''
+	def __init__(self, latency=1e-3):
+		self.latency = latency
+		self.timeout = 2000
+		self.values = {}
+		self.transactions = 0
+		self.log = []
+		self.responses = []
+
+	@staticmethod
+	def split(message):
+		commands = []
+		for command in message.split(';'):
+			command = command.strip()
+			if not command:
+				continue
+			header, _, argument = command.partition(' ')
+			commands.append((header.lstrip(':').upper(), argument.strip()))
+		return commands
+
+	def transaction(self):
+		self.transactions += 1
+		time.sleep(self.latency)
+
+	def write(self, message):
+		self.transaction()
+		self.log.append(message)
+		self.responses = []
+		for header, argument in self.split(message):
+			if header.endswith('?'):
+				self.responses.append(self.respond(header, argument))
+			else:
+				self.command(header, argument)
+		return len(message)
+
+	def read(self):
+		self.transaction()
+		responses, self.responses = self.responses, []
+		return ';'.join(str(response) for response in responses)
+
+	def respond(self, header, argument):
+		return self.values.get(header[:-1], '0')
+
+	def command(self, header, argument):
+		self.values[header] = argument
+
+	def query(self, message):
+		self.write(message)
+		self.transactions -= 1
+		return self.read()
+
+	def ask(self, message):
+		return self.query(message)
+
+	def query_ascii_values(self, message, container=list):
+		self.write(message)
+		self.transactions -= 1
+		self.transaction()
+		responses, self.responses = self.responses, []
+		return container(responses[-1])
+
+	def query_binary_values(self, message, datatype='f', is_big_endian=False, container=list):
+		self.write(message)
+		self.transactions -= 1
+		self.transaction()
+		responses, self.responses = self.responses, []
+		return container(responses[-1])
+
+
+class DummyVNAResource(DummyVisaResource):
+	'''
+	Simulated VNA (Agilent N5242A / R&S ZNB20 / Agilent E5071C command subset) behind a DummyVisaResource.
+	A sweep takes point_time per frequency point; INIT:IMM (or *TRG) starts it, *OPC sets the ESR operation
+	complete bit when it's done and *OPC? blocks until then. Linear and segmented (SENS:SEGM:LIST or
+	SENS:SEGM<n>:...) sweeps are supported; the trace data is random.
+	'''
+	def __init__(self, latency=1e-3, point_time=2e-5, nop=201, seed=None):
+		super().__init__(latency=latency)
+		self.point_time = point_time
+		self.random = np.random.RandomState(seed)
+		self.sweep_end = 0
+		self.opc_pending = False
+		self.esr = 0
+		self.sweeps = 0
+		self.segment_points = {}
+		self.values.update({'SENS1:SWE:POIN': str(nop), 'SENS1:FREQ:STAR': '1e9', 'SENS1:FREQ:STOP': '2e9',
+							'SENS:SWE:TYPE': 'LIN', 'SENS1:SWE:TYPE': 'LIN'})
+
+	def points(self):
+		sweep_type = self.values.get('SENS1:SWE:TYPE', self.values.get('SENS:SWE:TYPE', 'LIN')).upper()
+		if sweep_type.startswith('SEGM'):
+			return sum(self.segment_points.values())
+		return int(float(self.values['SENS1:SWE:POIN']))
+
+	def command(self, header, argument):
+		if header in ('INIT:IMM', 'INIT', 'INITIATE:IMMEDIATE', '*TRG'):
+			self.sweep_end = time.perf_counter() + self.points()*self.point_time
+			self.sweeps += 1
+		elif header == '*CLS':
+			self.esr = 0
+			self.opc_pending = False
+		elif header == '*OPC':
+			self.opc_pending = True
+		elif header.endswith('SEGM:LIST'):
+			values = argument.split(',')
+			self.segment_points = {segment: int(values[2 + segment*7 + 1]) for segment in range(int(values[1]))}
+		elif header.endswith('SEGM:DEL:ALL'):
+			self.segment_points = {}
+		elif ':SEGM' in header and header.endswith(':SWE:POIN'):
+			self.segment_points[header.split(':SEGM')[1].split(':')[0]] = int(argument)
+		else:
+			if header.endswith('SWE:TYPE'):
+				self.values['SENS1:SWE:TYPE'] = self.values['SENS:SWE:TYPE'] = argument
+			super().command(header, argument)
+
+	def sweep_done(self):
+		return time.perf_counter() >= self.sweep_end
+
+	def respond(self, header, argument):
+		if header == '*ESR?':
+			if self.opc_pending and self.sweep_done():
+				self.opc_pending = False
+				self.esr |= 1
+			esr, self.esr = self.esr, 0
+			return esr
+		elif header == '*OPC?':
+			time.sleep(max(self.sweep_end - time.perf_counter(), 0))
+			return 1
+		elif header.endswith('SWE:TIME?'):
+			return self.points()*self.point_time
+		elif header in ('CALCULATE:DATA?', 'CALC:DATA?', 'CALC1:DATA:SDAT?'):
+			return self.random.randn(2*self.points())
+		return super().respond(header, argument)
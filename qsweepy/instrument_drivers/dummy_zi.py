@@ -0,0 +1,172 @@
+import numpy as np
+import fnmatch
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+
+class DummyAwgModule:
+	'''
+	Has the node interface of a zhinst awgModule, but doesn't have a compiler or an instrument on the other end.
+	Compilation and upload take a configurable amount of time and run in the background, like in LabOne, so the
+	compile/upload code of the ZI drivers can be timed without hardware. The "ELF" written by the compiler is
+	a hash of the program text.
+	'''
+	def __init__(self, compile_latency=1., upload_latency=0.1, directory=None):
+		self.compile_latency = compile_latency
+		self.upload_latency = upload_latency
+		if directory is None:
+			directory = tempfile.mkdtemp()
+		self.values = {'directory': directory, 'compiler/status': 0, 'compiler/statusstring': '', 'compiler/upload': 1,
+					   'elf/file': os.path.join(directory, 'awg', 'elf', 'default.elf'), 'elf/status': 0, 'progress': 1.}
+		os.makedirs(os.path.join(directory, 'awg', 'elf'), exist_ok=True)
+		self.compilations = 0
+		self.uploads = 0
+		self.finished = False
+		self.cleared = False
+
+	@staticmethod
+	def node(path):
+		return path[len('awgModule/'):] if path.startswith('awgModule/') else path
+
+	def execute(self):
+		pass
+	def finish(self):
+		self.finished = True
+	def clear(self):
+		self.cleared = True
+
+	def set(self, path, value):
+		path = self.node(path)
+		self.values[path] = value
+		if path == 'compiler/sourcestring':
+			self.values['compiler/status'] = -1
+			threading.Thread(target=self.compile, args=(value,), daemon=True).start()
+		elif path == 'elf/upload' and value:
+			self.values['elf/status'] = 2
+			self.values['progress'] = 0.
+			threading.Thread(target=self.upload, daemon=True).start()
+
+	def compile(self, program):
+		time.sleep(self.compile_latency)
+		with open(self.values['elf/file'], 'wb') as f:
+			f.write(hashlib.sha256(program.encode()).digest())
+		self.compilations += 1
+		self.values['compiler/status'] = 0
+		if self.values['compiler/upload']:
+			self.set('elf/upload', 1)
+
+	def upload(self):
+		time.sleep(self.upload_latency)
+		self.uploads += 1
+		self.values['progress'] = 1.
+		self.values['elf/status'] = 0
+
+	def get(self, path):
+		return self.values[self.node(path)]
+	def getInt(self, path):
+		return int(self.get(path))
+	def getDouble(self, path):
+		return float(self.get(path))
+	def getString(self, path):
+		return str(self.get(path))
+
+
+class DummyZIDAQ:
+	'''
+	Stand-in for a zhinst ziDAQServer connection: stores node values and creates DummyAwgModules.
+	'''
+	def __init__(self, compile_latency=1., upload_latency=0.1, directory=None):
+		self.compile_latency = compile_latency
+		self.upload_latency = upload_latency
+		self.directory = directory if directory is not None else tempfile.mkdtemp()
+		self.values = {}
+		self.awg_modules = []
+		# number of API calls, each of which is a round trip to the data server
+		self.transactions = 0
+
+	def awgModule(self):
+		awg_module = DummyAwgModule(self.compile_latency, self.upload_latency, self.directory)
+		self.awg_modules.append(awg_module)
+		return awg_module
+
+	def setInt(self, path, value):
+		self.transactions += 1
+		self.values[path] = value
+	def setDouble(self, path, value):
+		self.transactions += 1
+		self.values[path] = value
+	def setVector(self, path, value):
+		self.transactions += 1
+		self.values[path] = value
+	def set(self, items):
+		self.transactions += 1
+		for path, value in items:
+			self.values[path] = value
+	def getInt(self, path):
+		self.transactions += 1
+		return int(self.values.get(path, 0))
+	def getDouble(self, path):
+		self.transactions += 1
+		return float(self.values.get(path, 0))
+	def getString(self, path):
+		self.transactions += 1
+		return str(self.values.get(path, ''))
+	def get(self, path, flat=True):
+		self.transactions += 1
+		return {node: {'value': np.atleast_1d(value)} for node, value in self.values.items() if fnmatch.fnmatch(node, path)}
+	def sync(self):
+		pass
+
+	def compilations(self):
+		return sum(awg_module.compilations for awg_module in self.awg_modules)
+
+
+class DummyUHFDAQ(DummyZIDAQ):
+	'''
+	Simulated UHFQA node tree for timing ziUHF.measure(). Enabling AWG 0 starts an acquisition in a background
+	thread that runs the sequencer for start_latency + shot_time per shot, then fills the result and monitor
+	vectors with random data and clears the sequencer status and the result/monitor enable nodes, like the
+	device does. The sequencer status only turns to running after start_latency.
+	'''
+	def __init__(self, device='dev2491', shot_time=2e-6, start_latency=1e-3, num_channels=10, seed=None, **kwargs):
+		super().__init__(**kwargs)
+		self.device = device
+		self.shot_time = shot_time
+		self.start_latency = start_latency
+		self.num_channels = num_channels
+		self.random = np.random.RandomState(seed)
+		self.acquisitions = 0
+		for node, value in [('qas/0/result/length', 1), ('qas/0/result/averages', 1), ('qas/0/monitor/length', 4096),
+							('qas/0/monitor/averages', 1), ('awgs/0/sequencer/status', 0), ('clockbase', 1.8e9)]:
+			self.values[self.node(node)] = value
+
+	def node(self, node):
+		return '/' + self.device + '/' + node
+
+	def setInt(self, path, value):
+		super().setInt(path, value)
+		if path == self.node('awgs/0/enable') and value:
+			threading.Thread(target=self.acquire, daemon=True).start()
+
+	def acquire(self):
+		time.sleep(self.start_latency)
+		self.values[self.node('awgs/0/sequencer/status')] = 1
+		nres = self.getInt(self.node('qas/0/result/length'))
+		shots = nres*self.getInt(self.node('qas/0/result/averages'))
+		time.sleep(self.shot_time*shots)
+		for channel in range(self.num_channels):
+			self.values[self.node('qas/0/result/data/{}/wave'.format(channel))] = self.random.randn(nres)
+		for input in range(2):
+			self.values[self.node('qas/0/monitor/inputs/{}/wave'.format(input))] = \
+				self.random.randn(self.getInt(self.node('qas/0/monitor/length')))
+		self.acquisitions += 1
+		self.values[self.node('qas/0/result/enable')] = 0
+		self.values[self.node('qas/0/monitor/enable')] = 0
+		self.values[self.node('awgs/0/enable')] = 0
+		self.values[self.node('awgs/0/sequencer/status')] = 0
+
+	def getList(self, path):
+		return [(path, [{'vector': self.values[path]}])]
@@ -20,6 +20,9 @@ import copy
 import time
 import math
 import inspect
+import collections
+import contextlib
+import struct
 from gettext import gettext as _L
 
 import numpy as np
@@ -914,6 +917,10 @@ class Instrument():
 					delta = 0
 
 				ret = func(curval, **kwargs)
+				# each ramp step has to reach the instrument before the step delay, even inside a batch
+				transport = getattr(self, '_visainstrument', None)
+				if isinstance(transport, SCPITransport):
+					transport.flush()
 
 				if delta != 0:
 					time.sleep(delay / 1000.0)
@@ -960,12 +967,15 @@ class Instrument():
 		result = True
 		changed = {}
 		if type(name) == dict:
-			for key, val in name.items():
-				val = self._set_value(key, val, **kwargs)
-				if val is not None:
-					changed[key] = val
-				else:
-					result = False
+			# drivers with an SCPI transport send the set commands of all parameters as one write
+			transport = getattr(self, '_visainstrument', None)
+			with transport.batch() if isinstance(transport, SCPITransport) else contextlib.nullcontext():
+				for key, val in name.items():
+					val = self._set_value(key, val, **kwargs)
+					if val is not None:
+						changed[key] = val
+					else:
+						result = False
 
 		else:
 			val = self._set_value(name, value, **kwargs)
@@ -1013,7 +1023,7 @@ class Instrument():
 		if hasattr(f, '__doc__'):
 			options['doc'] = getattr(f, '__doc__')
 
-		options['argspec'] = self.get_argspec_dict(inspect.getargspec(f))
+		options['argspec'] = self.get_argspec_dict(inspect.getfullargspec(f))
 
 		self._functions[name] = options
 
@@ -1145,3 +1155,164 @@ class GPIBInstrument(Instrument):
 	def __init__(self, *args, **kwargs):
 		kwargs['lockclass'] = 'GPIB'
 		Instrument.__init__(self, *args, **kwargs)
+
+class SCPITransport():
+	'''
+	Shared transport layer of the SCPI (VISA) instrument drivers. Wraps a pyvisa resource and has the same
+	write / ask / query / read / query_binary_values interface, so drivers can use it in place of the
+	resource, and adds:
+		- batch(): context in which writes are collected and sent as one write when it is left
+		- query_trace(): binary REAL,64 block transfer of trace data
+		- per call byte counts and latencies (history, get_statistics(), verbose printing)
+
+	Usage:
+	self._visainstrument = SCPITransport(visa.ResourceManager().open_resource(address))
+	with self._visainstrument.batch():
+		self._visainstrument.write('SENS1:FREQ:STAR 1e9')
+		self._visainstrument.write('SENS1:FREQ:STOP 2e9')
+	'''
+
+	def __init__(self, resource, trace_format='FORM REAL,64;:FORM:BORD SWAP', is_big_endian=False,
+			history_size=1000):
+		'''
+		Input:
+			resource: pyvisa message-based resource
+			trace_format (string): commands that select 64-bit binary little-endian (swapped) trace data,
+				sent together with every trace query
+			is_big_endian (bool): byte order selected by trace_format
+			history_size (int): number of calls kept in history
+		'''
+		self.resource = resource
+		self.trace_format = trace_format
+		self.is_big_endian = is_big_endian
+		self.history = collections.deque(maxlen=history_size)
+		self.verbose = False
+		self._batch_depth = 0
+		self._batch = []
+		self.reset_statistics()
+
+	def __getattr__(self, name):
+		# timeout, read_termination etc. of the wrapped resource
+		if name == 'resource':
+			raise AttributeError(name)
+		return getattr(self.resource, name)
+
+	def __setattr__(self, name, value):
+		if name in ('timeout', 'read_termination', 'write_termination', 'chunk_size'):
+			setattr(self.resource, name, value)
+		else:
+			self.__dict__[name] = value
+
+	def reset_statistics(self):
+		self.statistics = {'calls': 0, 'bytes_written': 0, 'bytes_read': 0, 'time': 0.}
+
+	def get_statistics(self):
+		'''
+		Output:
+			dict with the number of calls, bytes written and read and the total time spent in calls since
+			the last reset_statistics(), and the mean latency per call
+		'''
+		statistics = dict(self.statistics)
+		statistics['latency'] = statistics['time']/statistics['calls'] if statistics['calls'] else 0.
+		return statistics
+
+	def _record(self, command, bytes_written, bytes_read, latency):
+		self.statistics['calls'] += 1
+		self.statistics['bytes_written'] += bytes_written
+		self.statistics['bytes_read'] += bytes_read
+		self.statistics['time'] += latency
+		self.history.append((command, bytes_written, bytes_read, latency))
+		if self.verbose:
+			print('SCPI {}: {} bytes written, {} bytes read, {:.2f} ms'.format(
+				command[:60], bytes_written, bytes_read, latency*1e3))
+
+	@staticmethod
+	def join(messages):
+		'''
+		Joins messages into one program message. Every message after the first is separated by ';:' (or by ';'
+		if it starts with ':' or '*'), which resets the header path as the start of a separate message does.
+		The messages themselves are not changed, so relative headers and quoted arguments inside a message
+		keep their meaning.
+		'''
+		joined = messages[0]
+		for message in messages[1:]:
+			joined += (';' if message[:1] in (':', '*') else ';:') + message
+		return joined
+
+	@contextlib.contextmanager
+	def batch(self):
+		'''
+		Collects the writes issued in the context and sends them as one program message when the context is
+		left. A query issued in the context sends the collected writes first, so the order of commands is kept.
+		'''
+		self._batch_depth += 1
+		try:
+			yield self
+		finally:
+			self._batch_depth -= 1
+			if not self._batch_depth:
+				self.flush()
+
+	def flush(self):
+		if self._batch:
+			commands, self._batch = self._batch, []
+			self._write(self.join(commands))
+
+	def _write(self, message):
+		start = time.perf_counter()
+		result = self.resource.write(message)
+		self._record(message, len(message), 0, time.perf_counter() - start)
+		return result
+
+	def write(self, message):
+		if self._batch_depth:
+			if message.strip():
+				self._batch.append(message.strip())
+			return len(message)
+		return self._write(message)
+
+	def read(self):
+		self.flush()
+		start = time.perf_counter()
+		response = self.resource.read()
+		self._record('read', 0, len(response), time.perf_counter() - start)
+		return response
+
+	def query(self, message):
+		self.flush()
+		start = time.perf_counter()
+		response = self.resource.query(message)
+		self._record(message, len(message), len(response), time.perf_counter() - start)
+		return response
+
+	def ask(self, message):
+		return self.query(message)
+
+	def query_binary_values(self, message, datatype='f', is_big_endian=False, container=list, **kwargs):
+		self.flush()
+		start = time.perf_counter()
+		values = self.resource.query_binary_values(message, datatype=datatype, is_big_endian=is_big_endian,
+			container=container, **kwargs)
+		self._record(message, len(message), len(values)*struct.calcsize(datatype), time.perf_counter() - start)
+		return values
+
+	def query_ascii_values(self, message, **kwargs):
+		self.flush()
+		start = time.perf_counter()
+		values = self.resource.query_ascii_values(message, **kwargs)
+		self._record(message, len(message), len(values), time.perf_counter() - start)
+		return values
+
+	def query_trace(self, message):
+		'''
+		Queries trace data as a binary block of 64-bit floats. The data format commands are sent in the same
+		program message, so the result doesn't depend on format settings made elsewhere.
+
+		Input:
+			message (string): trace data query, e.g. 'CALC:DATA? SDATA'
+
+		Output:
+			numpy array of float64
+		'''
+		return self.query_binary_values(self.join([self.trace_format, message]), datatype='d',
+			is_big_endian=self.is_big_endian, container=np.array)
@@ -1,6 +1,7 @@
 import visa
 import logging
 import numpy
+from qsweepy.instrument_drivers.instrument import SCPITransport
 
 class RSVNA():
 	'''
@@ -19,7 +20,7 @@ class RSVNA():
 		logging.info(__name__ + ' : Initializing instrument')
 
 		self._address = address
-		self._visainstrument = visa.ResourceManager().open_resource(self._address, timeout=5000)
+		self._visainstrument = SCPITransport(visa.ResourceManager().open_resource(self._address, timeout=5000))
 		self._freqpoints = 0
 		self._ci = channel_index 
 		self._start = 0
@@ -57,7 +58,7 @@ class RSVNA():
 	
 	def get_data(self):
 	
-		data = self._visainstrument.query_ascii_values("CALCulate:DATA? SDATA") 
+		data = self._visainstrument.query_trace("CALCulate:DATA? SDATA")
 		data_size = numpy.size(data)
 		datareal = numpy.array(data[0:data_size:2])
 		dataimag = numpy.array(data[1:data_size:2])
@@ -229,8 +230,9 @@ class RSVNA():
 	def measure(self):
 		sweep_time = float(self.ask('SENSe1:SWEep:TIME?'))
 		
-		self.write('TRIGger%i:SEQuence:SOURce IMMediate'%(self._ci,))
-		self.write('INITiate%i:IMMediate'%(self._ci,))
+		with self._visainstrument.batch():
+			self.write('TRIGger%i:SEQuence:SOURce IMMediate'%(self._ci,))
+			self.write('INITiate%i:IMMediate'%(self._ci,))
 		
 		old_timeout = self._visainstrument.timeout
 		self._visainstrument.timeout = sweep_time*1000+5000
@@ -0,0 +1,70 @@
+import numpy
+import queue
+import threading
+
+
+class SpectrumAccumulator:
+	'''
+	Software averaging of two-channel multi-record acquisitions of the Spectrum M3i/M4i digitizers.
+
+	DMA buffers are accumulated in a background thread directly into a preallocated integer accumulator,
+	through numpy views of the int8 buffer memory, so the card can acquire the next block while the
+	previous one is being summed. The buffers passed to add() must not be reused by the caller until they
+	have been accumulated; the drivers allocate a new buffer for every acquisition, so that holds.
+	'''
+	def __init__(self, segments, nop, blocks=1, channels=2, queue_size=2):
+		self.segments = segments
+		self.nop = nop
+		self.channels = channels
+		# int32 holds 2**24 averages of int8 samples
+		self.accumulator = numpy.zeros((blocks, segments, nop, channels), dtype=numpy.int32)
+		self.accumulated = 0
+		self.error = None
+		self.queue = queue.Queue(maxsize=queue_size)
+		self.thread = threading.Thread(target=self.worker, daemon=True)
+		self.thread.start()
+
+	def worker(self):
+		while True:
+			item = self.queue.get()
+			if item is None:
+				break
+			block, buffer = item
+			if self.error is not None:
+				continue
+			try:
+				view = numpy.frombuffer(buffer, numpy.int8, self.segments*self.nop*self.channels)
+				numpy.add(self.accumulator[block], view.reshape(self.segments, self.nop, self.channels),
+						  out=self.accumulator[block])
+				self.accumulated += 1
+			except Exception as e:
+				self.error = e
+
+	def add(self, block, buffer):
+		'''
+		Queues a DMA buffer to be added to the given block of segments. Blocks if the worker is behind by more
+		than queue_size buffers.
+		'''
+		if self.error is not None:
+			raise self.error
+		self.queue.put((block, buffer))
+
+	def close(self):
+		if self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join()
+		if self.error is not None:
+			raise self.error
+
+	def get_data(self, averages=1):
+		'''
+		Waits for all queued buffers and returns the averaged complex trace, channel 0 being the real part,
+		with shape (blocks*segments, nop).
+		'''
+		self.close()
+		accumulator = self.accumulator.reshape(-1, self.nop, self.channels)
+		data = numpy.empty(accumulator.shape[:2], dtype=complex)
+		data.real = accumulator[:, :, 0]
+		data.imag = accumulator[:, :, 1]
+		data /= float(averages)
+		return data
@@ -0,0 +1,63 @@
+import numpy
+
+
+def normalize_segments(segments, power=None, bandwidth=None):
+    '''
+    Fills in missing power and bandwidth of segmented sweep definitions.
+
+    Input:
+        segments (list of dict): 'start', 'stop' (Hz), 'nop' and optionally 'power' (dBm) and 'bandwidth' (Hz)
+        power, bandwidth: values used for segments that don't define their own
+
+    Output:
+        list of dict with all five keys
+    '''
+    normalized = []
+    for segment in segments:
+        segment = dict(segment)
+        segment['nop'] = int(segment['nop'])
+        segment.setdefault('power', power)
+        segment.setdefault('bandwidth', bandwidth)
+        normalized.append(segment)
+    return normalized
+
+
+def segments_block_axis(segments):
+    '''
+    If all segments cover the same frequency window, a segmented sweep is a 2-D block of traces
+    (e.g. a power sweep measured with a single trigger). Returns the parameter that distinguishes the
+    segments as (name, values, units), or None if the segments cover different frequencies.
+    '''
+    windows = set((segment['start'], segment['stop'], segment['nop']) for segment in segments)
+    if len(windows) != 1:
+        return None
+    for name, key, units in [('Power', 'power', 'dBm'), ('Bandwidth', 'bandwidth', 'Hz')]:
+        values = [segment[key] for segment in segments]
+        if None not in values and len(set(values)) == len(values):
+            return (name, numpy.asarray(values), units)
+    return ('Segment', numpy.arange(len(segments)), '')
+
+
+def segments_freqpoints(segments):
+    return numpy.concatenate([numpy.linspace(segment['start'], segment['stop'], segment['nop'])
+                              for segment in segments])
+
+
+def segments_points(segments):
+    '''
+    Point parameters of the S-parameter measured with a segmented sweep, see get_points() of the VNA drivers.
+    '''
+    axis = segments_block_axis(segments)
+    if axis is None:
+        return [('Frequency', segments_freqpoints(segments), 'Hz')]
+    segment = segments[0]
+    return [axis, ('Frequency', numpy.linspace(segment['start'], segment['stop'], segment['nop']), 'Hz')]
+
+
+def segments_data(segments, data):
+    '''
+    Reshapes the trace of a segmented sweep according to segments_points().
+    '''
+    if segments_block_axis(segments) is None:
+        return data
+    return numpy.reshape(data, (len(segments), segments[0]['nop']))
@@ -1,8 +1,10 @@
 import numpy as np
 import logging
+import re
 import textwrap
 
-from qsweepy.instrument_drivers.zihdawg import ZIDevice
+from qsweepy.instrument_drivers.zihdawg2 import ZIDevice
+from qsweepy.instrument_drivers import zi_readout
 
 import time
 
@@ -37,8 +39,21 @@ class ziUHF(ZIDevice):
         self.internal_avg = True
         # Service values
         self.timeout = 10
+        # Completion polling: the interval doubles from poll_interval_min up to poll_interval_max
+        self.poll_interval_min = 1e-4
+        self.poll_interval_max = 1e-2
+        self.last_acquisition_time = 0
+        # Start the next acquisition as soon as the result vectors of the previous one have been read.
+        # Only valid for repeated measurements with unchanged settings, as the next measure() call returns data
+        # acquired before it.
+        self.rearm = False
+        self.armed = False
+        self.arm_time = 0
         self.thresholds = [0] * num_covariances
         self.num_covariances = num_covariances
+        # Last values written to the integration weights and crosstalk matrix, unchanged values are not resent
+        self.weights_shadow = {}
+        self.crosstalk_shadow = None
         self.adc = self
 
     def set_adc_nop(self, nop):
@@ -76,6 +91,8 @@ class ziUHF(ZIDevice):
         '''
         Config sequencer and trace averaging according to nsegm and nres
         '''
+        # an acquisition started with the old settings must not be returned
+        self.armed = False
         if nsegm * nres > int(2**15):
             logging.warning('Number of segments is higher then the maximum possible number of trace averages')
         # Set monitor average
@@ -232,13 +249,13 @@ class ziUHF(ZIDevice):
     def get_status(self) -> int:
         return self.daq.getInt('/' + self.device + '/awgs/0/sequencer/status')
 
-    # Main measurer method TODO write a proper docstring
-    def measure(self) -> dict:
+    def arm(self) -> None:
+        '''
+        Resets and enables the result and monitor units and starts the sequencer without waiting for the result.
+        '''
         # Just in case
         self.stop()
 
-        result = {}
-
         # toggle node value from 0 to 1 for result reset
         self.daq.setInt('/' + self.device + '/qas/0/result/reset', 0)
         self.daq.setInt('/' + self.device + '/qas/0/result/reset', 1)
@@ -251,48 +268,140 @@ class ziUHF(ZIDevice):
 
         # and start the sequencer execution
         self.run()
+        self.arm_time = time.perf_counter()
+        self.armed = True
 
-        # Sleep to correctly capture initial status TODO mb there is a better way to do it
-        time.sleep(0.3)
-        t1 = time.time()
-
-        while(1):
-            if(self.get_status() == 0):
-                break
-            else:
-                pass
-
-            if(time.time()-t1>self.timeout):
-                print ("Acquisition failed with status {}".format(self.get_status()))
-                break
-
-        self.daq.setInt('/' + self.device + '/qas/0/result/enable', 0)
-        self.daq.setInt('/' + self.device + '/qas/0/monitor/enable', 0)
+    def acquisition_done(self) -> bool:
+        '''
+        The device clears the result and monitor enable nodes once the requested number of results and averages
+        has been acquired, so unlike the sequencer status alone they can't be caught in a stale state right
+        after run().
+        '''
+        if self.get_status() != 0:
+            return False
+        if (self.output_result or self.output_resnum) and self.daq.getInt('/' + self.device + '/qas/0/result/enable'):
+            return False
+        if self.output_raw and self.daq.getInt('/' + self.device + '/qas/0/monitor/enable'):
+            return False
+        return True
+
+    def wait_for_completion(self) -> None:
+        '''
+        Waits for the armed acquisition to finish. The first check is made after 90% of the estimated
+        acquisition duration, then the device is polled with exponentially growing intervals.
+        Raises TimeoutError if the acquisition hasn't finished after self.timeout seconds; the sequencer is
+        stopped and the acquisition disarmed in that case, so that partial result vectors are never read.
+        '''
+        expected_remaining = 0.9 * self.last_acquisition_time - (time.perf_counter() - self.arm_time)
+        if expected_remaining > 0:
+            time.sleep(expected_remaining)
+        interval = self.poll_interval_min
+        last_busy = None
+        while not self.acquisition_done():
+            if time.perf_counter() - self.arm_time > self.timeout:
+                status = self.get_status()
+                self.stop()
+                self.armed = False
+                raise TimeoutError('UHFQA acquisition did not finish in {} s, sequencer status {}'.format(
+                    self.timeout, status))
+            last_busy = time.perf_counter() - self.arm_time
+            time.sleep(interval)
+            interval = min(interval * 2, self.poll_interval_max)
+        # The acquisition ended after the last busy check. Measuring up to the end of the wait would include the
+        # initial sleep and the polling latency and let the estimate grow; if the first check already found the
+        # acquisition done, the estimate was too long and is halved.
+        self.last_acquisition_time = last_busy if last_busy is not None else 0.5 * self.last_acquisition_time
+
+    def read_vectors(self) -> dict:
+        '''
+        Transfers the monitor and result vectors from the device.
+        '''
+        vectors = {}
+        if self.output_raw:
+            vectors['monitor'] = [self.daq.getList('/' + self.device + '/qas/0/monitor/inputs/{}/wave'.format(input))[0][1][0]['vector']
+                                  for input in range(2)]
+        if self.output_result or self.output_resnum:
+            vectors['result'] = [self.daq.getList('/' + self.device + '/qas/0/result/data/' + str(channel) + '/wave')[0][1][0]['vector']
+                                 for channel in range(self.num_covariances)]
+        return vectors
 
+    def process_vectors(self, vectors) -> dict:
+        result = {}
         if self.output_raw:
             # Acquire data from the device:
-            result.update({'Voltage': np.reshape((self.daq.getList('/' + self.device + '/qas/0/monitor/inputs/0/wave')[0][1][0]['vector'] +
-                        1j * self.daq.getList('/' + self.device + '/qas/0/monitor/inputs/1/wave')[0][1][0]['vector'])[:self.nsamp], (1, -1))})
+            result.update({'Voltage': np.reshape((vectors['monitor'][0] + 1j * vectors['monitor'][1])[:self.nsamp], (1, -1))})
 
         # Readout result and store it with key depending on result source
         if self.output_result or self.output_resnum:
-            int_res = np.asarray([
-                self.daq.getList('/' + self.device + '/qas/0/result/data/' + str(channel) + '/wave')[0][1][0]['vector']
-                for channel in range(self.num_covariances)])
             if self.output_result:
-                result.update({self.result_source + str(channel): int_res[channel]
+                result.update({self.result_source + str(channel): vectors['result'][channel]
                         for channel in range(self.num_covariances)})
 
             if self.output_resnum:
-                ro_res = np.asarray([(np.real(int_res[channel]) + np.imag(int_res[channel])) > self.thresholds[channel]
-                    for channel in range(self.num_covariances)]).T
+                result.update({'resultnumbers': self.count_states(vectors['result'], self.nres)})
 
-                disc = np.asarray([sum(v << i for i, v in enumerate(ro_res[sample])) for sample in range(self.nres)])
-                result_numbers = np.asarray([list(disc).count(state) for state in range(int(2**self.num_covariances))])
+        return result
 
-                result.update({'resultnumbers': result_numbers})
+    def count_states(self, result_vectors, nres) -> np.ndarray:
+        '''
+        Counts the occurrences of each multi-qubit state in the integration results, see zi_readout.count_states.
+        '''
+        return zi_readout.count_states(result_vectors, self.thresholds, nres, self.num_covariances)
 
-        return result
+    def measure(self) -> dict:
+        '''
+        Starts an acquisition (unless one has been armed by the previous call with rearm=True), waits for it to
+        finish and returns the monitor trace, the result vectors and the state counts.
+        '''
+        if not self.armed:
+            self.arm()
+        self.wait_for_completion()
+        self.armed = False
+
+        self.daq.setInt('/' + self.device + '/qas/0/result/enable', 0)
+        self.daq.setInt('/' + self.device + '/qas/0/monitor/enable', 0)
+
+        vectors = self.read_vectors()
+        if self.rearm:
+            # the vectors are in host memory, the next acquisition runs while they are being processed
+            self.arm()
+
+        return self.process_vectors(vectors)
+
+    def clear_shadow(self):
+        '''
+        Forgets the cached weights and crosstalk matrix, e.g. after they have been changed outside of this driver.
+        '''
+        self.weights_shadow = {}
+        self.crosstalk_shadow = None
+
+    def set_weights(self, weights) -> int:
+        '''
+        Uploads integration weights of several channels in a single transaction, skipping channels whose weights
+        are the same as the last uploaded ones.
+        :param weights: dict {feature_id: (real, imag)}
+        :return: number of channels actually uploaded
+        '''
+        nodes = []
+        for feature_id, (weights_real, weights_imag) in weights.items():
+            weights_real = np.ascontiguousarray(weights_real, dtype=float)
+            weights_imag = np.ascontiguousarray(weights_imag, dtype=float)
+            if feature_id in self.weights_shadow:
+                shadow_real, shadow_imag = self.weights_shadow[feature_id]
+                if np.array_equal(shadow_real, weights_real) and np.array_equal(shadow_imag, weights_imag):
+                    continue
+            nodes.append(('/' + self.device + '/qas/0/integration/weights/' + str(feature_id) + '/real', weights_real))
+            nodes.append(('/' + self.device + '/qas/0/integration/weights/' + str(feature_id) + '/imag', weights_imag))
+            self.weights_shadow[feature_id] = (weights_real, weights_imag)
+        if nodes:
+            self.daq.set(nodes)
+        return len(nodes) // 2
+
+    def normalize_feature(self, feature, nsamp=None):
+        if nsamp is None:
+            nsamp = self.nsamp
+        feature = feature[:nsamp]/np.max(np.abs(feature[:nsamp]))
+        return np.real(feature), np.imag(feature)
 
     def set_feature_iq(self, feature_id, feature) -> None:
         '''
@@ -301,45 +410,78 @@ class ziUHF(ZIDevice):
         :param feature_real: I part of the weights
         :param feature_imag: Q part of the weights
         '''
-        feature = feature[:self.nsamp]/np.max(np.abs(feature[:self.nsamp]))
-        feature_real = np.ascontiguousarray(np.real(feature))
-        feature_imag = np.ascontiguousarray(np.imag(feature))
-        self.daq.setVector('/' + self.device + '/qas/0/integration/weights/' + str(feature_id) + '/real', feature_real)
-        self.daq.setVector('/' + self.device + '/qas/0/integration/weights/' + str(feature_id) + '/imag', feature_imag)
+        self.set_weights({feature_id: self.normalize_feature(feature)})
+
+    def set_features_iq(self, features) -> None:
+        '''
+        Uploads the demodulation weights of several channels at once
+        :param features: dict {feature_id: feature}
+        '''
+        nsamp = self.nsamp
+        self.set_weights({feature_id: self.normalize_feature(feature, nsamp) for feature_id, feature in features.items()})
 
     # King of kostyl
     def set_feature_real(self, feature_id, feature, threshold=None):
+        self.set_features_real({feature_id: feature}, {feature_id: threshold})
+
+    def set_features_real(self, features, thresholds=None):
+        '''
+        Batch version of set_feature_real
+        :param features: dict {feature_id: feature}
+        :param thresholds: dict {feature_id: threshold}
+        '''
         self.internal_avg = False
 
-        if threshold is not None:
-            threshold = threshold/np.max(np.abs(feature[:self.nsamp]))
-            self.thresholds[feature_id] = threshold
+        if thresholds is not None:
+            nsamp = self.nsamp
+            for feature_id, threshold in thresholds.items():
+                if threshold is not None:
+                    self.thresholds[feature_id] = threshold/np.max(np.abs(features[feature_id][:nsamp]))
 
-        self.set_feature_iq(feature_id=feature_id, feature=feature)
+        self.set_features_iq(features)
 
     def disable_feature(self, feature_id):
-        self.daq.setVector('/' + self.device + '/qas/0/integration/weights/' + str(feature_id) + '/real', np.zeros(4096))
-        self.daq.setVector('/' + self.device + '/qas/0/integration/weights/' + str(feature_id) + '/imag', np.zeros(4096))
-        self.thresholds[feature_id] = 1
+        self.disable_features([feature_id])
+
+    def disable_features(self, feature_ids):
+        self.set_weights({feature_id: (np.zeros(4096), np.zeros(4096)) for feature_id in feature_ids})
+        for feature_id in feature_ids:
+            self.thresholds[feature_id] = 1
 
     @property
     def crosstalk_matrix(self) -> np.ndarray:
-        matrix = np.zeros((10, 10), np.float)
-        for raw in range(10):
-            for column in range(10):
-                matrix[raw][column] = self.daq.getDouble('/' + self.device + '/qas/0/crosstalk/rows/{}/cols/{}'.format(raw, column))
+        # read all elements with a single wildcard request
+        nodes = self.daq.get('/' + self.device + '/qas/0/crosstalk/rows/*/cols/*', True)
+        matrix = np.zeros((10, 10), float)
+        for path, node in nodes.items():
+            match = re.search(r'rows/(\d+)/cols/(\d+)', path)
+            if match is None:
+                continue
+            value = node['value'] if isinstance(node, dict) else node
+            matrix[int(match.group(1))][int(match.group(2))] = np.ravel(value)[-1]
+        self.crosstalk_shadow = matrix.copy()
 
         return matrix
 
     @crosstalk_matrix.setter
     def crosstalk_matrix(self, matrix):
-        raws, columns = np.asarray(matrix).shape
+        matrix = np.asarray(matrix, dtype=float)
+        raws, columns = matrix.shape
         if raws>10 or columns >10:
             raise ValueError('Maximum matrix size should be 10x10, while the given is {}x{}'.format(raws, columns))
+        nodes = []
         for raw_idx in range(raws):
             for col_idx in range(columns):
-                self.daq.setDouble('/' + self.device + '/qas/0/crosstalk/rows/{}/cols/{}'.format(raw_idx, col_idx),
-                                matrix[raw_idx][col_idx])
+                if self.crosstalk_shadow is not None and self.crosstalk_shadow[raw_idx][col_idx] == matrix[raw_idx][col_idx]:
+                    continue
+                nodes.append(('/' + self.device + '/qas/0/crosstalk/rows/{}/cols/{}'.format(raw_idx, col_idx),
+                              matrix[raw_idx][col_idx]))
+        if nodes:
+            self.daq.set(nodes)
+        if self.crosstalk_shadow is None:
+            # elements outside of the given matrix are unknown until the next read
+            self.crosstalk_shadow = np.full((10, 10), np.nan)
+        self.crosstalk_shadow[:raws, :columns] = matrix
 
     @property
     def crosstalk_bypass(self) -> bool:
@@ -0,0 +1,126 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SeqcCompileCache:
+    '''
+    Cache of compiled SeqC programs, keyed by a hash of the program text and of everything else the compiler
+    output depends on (compiler version, device type, channel grouping, sequencer index).
+
+    Binaries are kept in memory and, if a directory is given, as <hash>.elf files on disk, so that they survive
+    reconnecting to the device. The compiler is any callable compiler(program, *context) that returns the ELF
+    binary as bytes; the ZI drivers pass their awgModule compile routine, and a stand-in function can be used
+    to work without an instrument.
+    '''
+    def __init__(self, compiler, directory=None, binaries=None):
+        self.compiler = compiler
+        self.directory = directory
+        self.binaries = binaries if binaries is not None else {}
+        self.hits = 0
+        self.compiles = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(program, *context):
+        h = hashlib.sha256()
+        for item in context:
+            h.update(repr(item).encode())
+            h.update(b'\0')
+        h.update(program.encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.elf')
+
+    def load(self, key):
+        if key in self.binaries:
+            return self.binaries[key]
+        if self.directory is not None and os.path.isfile(self.path(key)):
+            with open(self.path(key), 'rb') as f:
+                self.binaries[key] = f.read()
+            return self.binaries[key]
+        return None
+
+    def store(self, key, elf):
+        self.binaries[key] = elf
+        if self.directory is not None:
+            # write-then-rename, so that an interrupted write never leaves a truncated binary in the cache
+            tmp_path = self.path(key) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(elf)
+            os.replace(tmp_path, self.path(key))
+
+    def get(self, program, *context):
+        '''
+        Returns the compiled binary of the program, running the compiler only if it hasn't been compiled before.
+        '''
+        key = self.key(program, *context)
+        elf = self.load(key)
+        if elf is not None:
+            self.hits += 1
+            return elf
+        elf = self.compiler(program, *context)
+        self.compiles += 1
+        self.store(key, elf)
+        return elf
+
+    def get_many(self, jobs, max_workers=None):
+        '''
+        Like get() for several programs at once. The programs missing from the cache are compiled concurrently,
+        so the compiler must be safe to call from several threads for different jobs.
+
+        Parameters
+        ----------
+        jobs : dict
+            {name: (program, *context)}
+        max_workers : int
+            number of concurrent compilations, defaults to one per missing program
+
+        Returns
+        -------
+        dict
+            {name: elf}
+        '''
+        binaries = {}
+        missing = {}
+        for name, (program, *context) in jobs.items():
+            key = self.key(program, *context)
+            elf = self.load(key)
+            if elf is not None:
+                self.hits += 1
+                binaries[name] = elf
+            else:
+                missing[name] = (key, program, context)
+        if not missing:
+            return binaries
+
+        with ThreadPoolExecutor(max_workers=max_workers if max_workers else len(missing)) as executor:
+            futures = {name: executor.submit(self.compiler, program, *context)
+                       for name, (key, program, context) in missing.items()}
+        for name, (key, program, context) in missing.items():
+            elf = futures[name].result()
+            self.compiles += 1
+            self.store(key, elf)
+            binaries[name] = elf
+        return binaries
+
+    def remove(self, key):
+        self.binaries.pop(key, None)
+        if self.directory is not None and os.path.isfile(self.path(key)):
+            os.remove(self.path(key))
+
+    def clear(self, disk=False):
+        '''
+        Forgets all binaries kept in memory; with disk=True also deletes the cache files.
+        '''
+        if disk and self.directory is not None:
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.elf'):
+                    os.remove(os.path.join(self.directory, filename))
+        self.binaries.clear()
+
+    def hit_rate(self):
+        total = self.hits + self.compiles
+        return self.hits / total if total else 0.
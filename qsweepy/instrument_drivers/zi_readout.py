@@ -0,0 +1,33 @@
+import numpy as np
+
+
+def count_states(result_vectors, thresholds, nres, num_channels=None):
+    '''
+    Thresholds the integration results of all channels and counts the occurrences of each multi-qubit state,
+    with channel i giving bit i of the state number.
+
+    Parameters
+    ----------
+    result_vectors : list[ndarray]
+        integration results of each channel; complex results are thresholded on real + imag
+    thresholds : list[float]
+        threshold of each channel
+    nres : int
+        number of results of each channel to count
+    num_channels : int
+        number of channels of the readout, the counts have 2**num_channels states.
+        Defaults to the number of result vectors.
+
+    Returns
+    -------
+    ndarray
+        number of occurrences of each state
+    '''
+    if num_channels is None:
+        num_channels = len(result_vectors)
+    int_res = np.stack([np.asarray(vector)[:nres] for vector in result_vectors])
+    if np.iscomplexobj(int_res):
+        int_res = int_res.real + int_res.imag
+    ro_res = int_res > np.asarray(thresholds[:len(result_vectors)])[:, np.newaxis]
+    disc = np.dot(1 << np.arange(len(result_vectors)), ro_res)
+    return np.bincount(disc, minlength=int(2**num_channels))
@@ -5,12 +5,16 @@ import textwrap
 import timeit
 import traceback
 import logging
+import os
+import threading
+from qsweepy.instrument_drivers.zi_compile_cache import SeqcCompileCache
 #from qsweepy.libraries.instrument import Instrument
 import numpy as np
 
 
 class ZIDevice():
-    def __init__(self, device_id, devtype, config=0, clock=2.40e9, nop=1000, delay_int=4e-6):
+    def __init__(self, device_id, devtype, config=0, clock=2.40e9, nop=1000, delay_int=4e-6,
+                 compile_cache_directory=None):
         """
         Parameters
         ----------
@@ -18,6 +22,8 @@ class ZIDevice():
         config
         clock
         nop
+        compile_cache_directory
+            directory for compiled SeqC programs, defaults to awg/elf/qsweepy_cache in the awgModule directory
 
         Initializes
         """
@@ -132,6 +138,25 @@ class ZIDevice():
         self.awgModule.set('awgModule/device', self.device)
         self.awgModule.execute()
 
+        if compile_cache_directory is None:
+            compile_cache_directory = os.path.join(self.awgModule.getString('awgModule/directory'),
+                                                   'awg', 'elf', 'qsweepy_cache')
+        # separate awgModules for compilation, one per sequencer, so that programs can be compiled concurrently
+        self.compile_modules = {}
+        self.compile_modules_lock = threading.Lock()
+        # the compiler output depends on the LabOne version and on the exact device type (e.g. HDAWG4/HDAWG8),
+        # so both are part of the compile cache key
+        self.compiler_version = (self.daq.getString('/zi/about/version'), self.daq.getInt('/zi/about/revision'))
+        self.device_type = self.daq.getString('/{}/features/devtype'.format(self.device))
+        self.compile_cache = SeqcCompileCache(self.compile_program, directory=compile_cache_directory,
+                                              binaries=self.known_programs)
+
+    def compile_context(self, sequencer_id):
+        """
+        Everything besides the program text that the compiled binary depends on, see SeqcCompileCache.
+        """
+        return sequencer_id, self.compiler_version, self.device_type, self.awg_config
+
     def set_sequence(self, sequencer_id, sequence):
         #awg_program = self.current_programs[sequencer_id]
         awg_program = sequence.zicode()
@@ -139,19 +164,115 @@ class ZIDevice():
 
         if (sequencer_id > (self.num_seq - 1)):
             print('Sequencer #{}: awg_config={}. Max sequencer number ={}'.format(sequencer_id, self.awg_config, (self.num_seq - 1)))
-        self.awgModule.set('awgModule/index', sequencer_id)
-        self.awgModule.set('awgModule/compiler/sourcestring', awg_program)
         start = timeit.default_timer()
-        while self.awgModule.getInt('awgModule/compiler/status') == -1:
+        # identical program texts are compiled only once, see SeqcCompileCache
+        elf = self.compile_cache.get(awg_program, *self.compile_context(sequencer_id))
+        self.upload_elf(sequencer_id, elf)
+        stop = timeit.default_timer()
+        print('Time: ', stop - start)
+        # self.daq.setInt('/' + self.device + '/awgs/%d/enable'%index, 1)
+        self.daq.sync()
+        return True
+
+    def set_sequences(self, sequences, start=True, max_workers=None):
+        """
+        Sets the programs of several sequencers at once. The programs that are not in the compile cache are
+        compiled concurrently; then all affected sequencers are stopped, the binaries are uploaded and the
+        sequencers are started together.
+
+        Parameters
+        ----------
+        sequences : dict or list
+            {sequencer_id: sequence} or a list of zi_scripts sequences with params['sequencer_id']
+        start : bool
+            start the sequencers after upload
+        max_workers : int
+            number of concurrent compilations, defaults to one per sequencer
+        """
+        if not isinstance(sequences, dict):
+            sequences = {sequence.params['sequencer_id']: sequence for sequence in sequences}
+        start_time = timeit.default_timer()
+        jobs = {sequencer_id: (sequence.zicode(),) + self.compile_context(sequencer_id)
+                for sequencer_id, sequence in sequences.items()}
+        binaries = self.compile_cache.get_many(jobs, max_workers=max_workers)
+        compile_time = timeit.default_timer()
+        for sequencer_id in binaries.keys():
+            self.stop_seq(sequencer_id)
+        for sequencer_id, elf in binaries.items():
+            self.upload_elf(sequencer_id, elf)
+        self.daq.sync()
+        if start:
+            for sequencer_id in binaries.keys():
+                self.start_seq(sequencer_id)
+        stop_time = timeit.default_timer()
+        print('Time: {:.3f} (compile {:.3f}, upload {:.3f})'.format(stop_time - start_time, compile_time - start_time,
+                                                                 stop_time - compile_time))
+        return True
+
+    def get_compile_module(self, sequencer_id):
+        # one module per sequencer, reused for all compilations until close()
+        with self.compile_modules_lock:
+            if sequencer_id not in self.compile_modules:
+                awg_module = self.daq.awgModule()
+                awg_module.set('awgModule/device', self.device)
+                awg_module.execute()
+                self.compile_modules[sequencer_id] = awg_module
+            return self.compile_modules[sequencer_id]
+
+    def close(self):
+        """
+        Finishes and clears the compile awgModules (see get_compile_module), which are otherwise kept running
+        by the data server. They are created again by the next compilation.
+        """
+        with self.compile_modules_lock:
+            for awg_module in self.compile_modules.values():
+                awg_module.finish()
+                awg_module.clear()
+            self.compile_modules.clear()
+
+    def __del__(self):
+        if hasattr(self, 'compile_modules_lock'):
+            self.close()
+
+    def elf_path(self, sequencer_id):
+        return os.path.join(self.awgModule.getString('awgModule/directory'), 'awg', 'elf',
+                            'qsweepy_{}_{}.elf'.format(self.device, sequencer_id))
+
+    def compile_program(self, awg_program, sequencer_id, *compiler_context):
+        """
+        Compiles a SeqC program without uploading it and returns the ELF binary. Uses the awgModule of the
+        sequencer, so different sequencers can be compiled from different threads.
+        compiler_context (the rest of compile_context()) only enters the compile cache key.
+        """
+        elf_path = self.elf_path(sequencer_id)
+        awg_module = self.get_compile_module(sequencer_id)
+        awg_module.set('awgModule/index', sequencer_id)
+        awg_module.set('awgModule/compiler/upload', 0)
+        awg_module.set('awgModule/elf/file', elf_path)
+        awg_module.set('awgModule/compiler/sourcestring', awg_program)
+        while awg_module.getInt('awgModule/compiler/status') == -1:
             time.sleep(0.1)
-        if self.awgModule.getInt('awgModule/compiler/status') == 1:
+        if awg_module.getInt('awgModule/compiler/status') == 1:
             # compilation failed, raise an exceptionawg
-            raise Exception(self.awgModule.getString('awgModule/compiler/statusstring'))
-        if self.awgModule.getInt('awgModule/compiler/status') == 0:
-            print("Sequencer #{}: Compilation successful with no warnings, will upload the program to the instrument.".format(sequencer_id))
-        if self.awgModule.getInt('awgModule/compiler/status') == 2:
-            print("Sequencer #{}: Compilation successful with warnings, will upload the program to the instrument.")
-            print("Sequencer #{}: Compiler warning: ", self.awgModule.getString('awgModule/compiler/statusstring'))
+            raise Exception(awg_module.getString('awgModule/compiler/statusstring'))
+        if awg_module.getInt('awgModule/compiler/status') == 0:
+            print("Sequencer #{}: Compilation successful with no warnings.".format(sequencer_id))
+        if awg_module.getInt('awgModule/compiler/status') == 2:
+            print("Sequencer #{}: Compilation successful with warnings.".format(sequencer_id))
+            print("Sequencer #{}: Compiler warning: ".format(sequencer_id), awg_module.getString('awgModule/compiler/statusstring'))
+        with open(elf_path, 'rb') as f:
+            return f.read()
+
+    def upload_elf(self, sequencer_id, elf):
+        """
+        Uploads a compiled ELF binary to a sequencer and waits for the upload to finish.
+        """
+        elf_path = self.elf_path(sequencer_id)
+        with open(elf_path, 'wb') as f:
+            f.write(elf)
+        self.awgModule.set('awgModule/index', sequencer_id)
+        self.awgModule.set('awgModule/elf/file', elf_path)
+        self.awgModule.set('awgModule/elf/upload', 1)
         # Wait for the waveform upload to finish
         time.sleep(0.1)
         i = 0
@@ -165,11 +286,6 @@ class ZIDevice():
             print("Sequencer #{}: Upload to the instrument successful.".format(sequencer_id))
         if self.awgModule.getInt('awgModule/elf/status') == 1:
             raise Exception("Upload to the instrument failed.")
-        stop = timeit.default_timer()
-        print('Time: ', stop - start)
-        # self.daq.setInt('/' + self.device + '/awgs/%d/enable'%index, 1)
-        self.daq.sync()
-        return True
 
     def set_waveform_indexed(self, sequencer_id, waveform_index, waveform1 = None, waveform2 = None):
         factor = 2 ** 15-1
@@ -194,17 +310,34 @@ class ZIDevice():
         #self.daq.sync()
         return
 
+    # compile cache keys (hashes) of the AWG programs in dict known_programs
     def programs(self):
         return set(self.known_programs.keys())
 
     # clear all AWG programs in dict known_programs
     def _clear_all_programs(self):
-        self.known_programs.clear()
+        self.compile_cache.clear()
 
-    # remove select AWG programs from dict known_programs
-    def remove_awg_program(self, name: str):
-        # Call removal of program waveforms on WaveManger.
-        self.known_programs.pop(name)
+    def remove_awg_program(self, name, sequencer_id=None):
+        """
+        Removes a compiled AWG program from known_programs and from the compile cache directory.
+
+        Parameters
+        ----------
+        name : str or sequence
+            a key of known_programs (see programs()), a SeqC program text, or a zi_scripts sequence whose
+            zicode() is removed
+        sequencer_id : int
+            sequencer the program text has been compiled for, defaults to all sequencers
+        """
+        if isinstance(name, str) and name in self.known_programs:
+            self.compile_cache.remove(name)
+            return
+        if not isinstance(name, str):
+            name = name.zicode()
+        sequencer_ids = range(self.num_seq) if sequencer_id is None else [sequencer_id]
+        for sequencer_id in sequencer_ids:
+            self.compile_cache.remove(self.compile_cache.key(name, *self.compile_context(sequencer_id)))
 
     #
     def set_clock(self, clock):
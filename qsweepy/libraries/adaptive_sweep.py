@@ -0,0 +1,185 @@
+import itertools
+import logging
+import numpy as np
+from qsweepy.libraries import sweep as sweep_module
+
+'''
+Adaptive (sparse) sampling on top of sweep().
+
+The sweep grid is first measured on a coarse subgrid with a stride of initial_step points. On every refinement
+level the stride is halved, and the new points are measured only in the cells of the previous level where
+the signal varies by more than tolerance times its total range. Points that are never visited stay NaN in the
+dense data arrays, so plotting and fitting code works on adaptive sweeps without changes.
+
+Refinement decisions are made from the data stored in the measurement state, so adaptive sweeps are always
+serial (no deferred or pipelined postprocessing) and can be neither shuffled nor resumed.
+'''
+
+
+def gradient_criterion(corner_values):
+    """
+    Variation of the signal across a cell: peak-to-peak of its corner values.
+    """
+    return np.max(corner_values) - np.min(corner_values)
+
+
+def curvature_criterion(corner_values):
+    """
+    Deviation of the cell corners from their mean, which vanishes for flat cells and grows where the
+    signal bends. Less sensitive than gradient_criterion to smooth slopes of the background.
+    """
+    return np.max(np.abs(corner_values - np.mean(corner_values)))
+
+
+def default_signal(dataset, sweep_ndim):
+    """
+    Reduces a dataset to one real number per sweep point: the absolute value of the mean over all point axes.
+    """
+    data = np.asarray(dataset.data)
+    if data.ndim > sweep_ndim:
+        data = np.mean(data, axis=tuple(range(sweep_ndim, data.ndim)))
+    return np.abs(data)
+
+
+def subgrid(sweep_dimensions, step):
+    """
+    Indices of every step-th point along each sweep dimension, always including the last one.
+    """
+    return [sorted(set(range(0, d, step)) | {d-1}) for d in sweep_dimensions]
+
+
+def cell_corners(indices, sweep_dimensions, step):
+    """
+    Points of the subgrid with the given step that enclose the given point.
+    """
+    corners = []
+    for index, d in zip(indices, sweep_dimensions):
+        if index % step == 0 or index == d-1:
+            corners.append([index])
+        else:
+            lower = (index//step)*step
+            corners.append([lower, min(lower+step, d-1)])
+    return itertools.product(*corners)
+
+
+def adaptive_indices(sweep_dimensions, get_signal, initial_step=8, tolerance=0.05, criterion=gradient_criterion,
+                     on_plan=None):
+    """
+    Generates sweep point indices for adaptive sampling. The generator is consumed lazily by sweep(), and
+    get_signal() is called between refinement levels, when all previously generated points have been measured.
+
+    Parameters
+    ----------
+    sweep_dimensions : tuple[int]
+        number of points of each sweep parameter
+    get_signal : callable
+        returns an array of shape sweep_dimensions with the reduced signal, NaN for unmeasured points
+    initial_step : int
+        stride of the initial coarse subgrid
+    tolerance : float
+        cells are refined if their variation exceeds tolerance times the total range of the signal
+    criterion : callable
+        variation of the signal in a cell, calculated from the array of its corner values
+    on_plan : callable
+        called with the total number of points generated up to the end of the current level, before the
+        points of each level are generated
+    """
+    step = max(int(initial_step), 1)
+    measured = np.zeros(sweep_dimensions, dtype=bool)
+    initial = list(itertools.product(*subgrid(sweep_dimensions, step)))
+    planned = len(initial)
+    if on_plan is not None:
+        on_plan(planned)
+    for indices in initial:
+        measured[indices] = True
+        yield indices
+
+    while step > 1:
+        signal = get_signal()
+        threshold = tolerance*(np.nanmax(signal) - np.nanmin(signal))
+        fine_step = step//2
+        refined = []
+        for indices in itertools.product(*subgrid(sweep_dimensions, fine_step)):
+            if measured[indices]:
+                continue
+            corner_values = np.asarray([signal[corner] for corner in cell_corners(indices, sweep_dimensions, step)])
+            # cells of the previous level that have not been measured completely are flat at a coarser level
+            if np.any(np.isnan(corner_values)):
+                continue
+            if criterion(corner_values) > threshold:
+                refined.append(indices)
+        planned += len(refined)
+        if on_plan is not None and refined:
+            on_plan(planned)
+        for indices in refined:
+            measured[indices] = True
+            yield indices
+        step = fine_step
+
+
+def adaptive_sweep(measurer, *parameters, initial_step=8, tolerance=0.05, criterion=gradient_criterion,
+                   dataset_name=None, signal=default_signal, on_start=[], on_finish=[], **kwargs):
+    """
+    Performs a n-d parametric sweep with adaptive sampling (see module description).
+
+    Parameters
+    ----------
+    measurer
+        an object that supports get_points(), measure(), get_dtype() and get_opts() methods.
+    parameters : list[tuple]
+        sweep parameters, as for sweep()
+    initial_step : int
+        stride of the initial coarse subgrid; halved on every refinement level
+    tolerance : float
+        cells are refined if their variation exceeds tolerance times the total range of the signal
+    criterion : callable
+        gradient_criterion, curvature_criterion or any function of the array of cell corner values
+    dataset_name : str
+        dataset that is used to decide on the refinement, defaults to the first dataset of the measurer
+    signal : callable
+        signal(dataset, sweep_ndim) reduces the dataset to a real array over the sweep dimensions
+    kwargs
+        passed to sweep(); use_deferred, pipelined, shuffle and resume_state are not supported
+
+    Returns
+    -------
+    MeasurementState
+        Measurement state with NaN at the points that have not been measured. The number of measured points is
+        stored in state.metadata['measured_points']. state.total_sweeps is the number of points planned so far,
+        so the last point of every refinement level, and of the sweep, triggers the on_update callbacks.
+    """
+    sweep_parameters = [parameter if isinstance(parameter, sweep_module.MeasurementParameter)
+                        else sweep_module.MeasurementParameter(*parameter) for parameter in parameters]
+    sweep_dimensions = tuple([len(sweep_parameter.values) for sweep_parameter in sweep_parameters])
+    if dataset_name is None:
+        dataset_name = list(measurer.get_points().keys())[0]
+
+    # refinement needs the data of all previous points in the order adaptive_indices plans them
+    for unsupported in ('use_deferred', 'pipelined', 'shuffle', 'resume_state'):
+        if kwargs.pop(unsupported, None) not in (None, False):
+            raise ValueError('adaptive_sweep: {} is not supported, refinement needs the data of all previous '
+                             'points'.format(unsupported))
+
+    adaptive_state = None
+
+    def attach_state(state):
+        nonlocal adaptive_state
+        adaptive_state = state
+
+    def get_signal():
+        return signal(adaptive_state.datasets[dataset_name], len(sweep_dimensions))
+
+    def plan(planned_points):
+        adaptive_state.total_sweeps = planned_points
+
+    def report_measured_points(state):
+        state.metadata['measured_points'] = str(state.done_sweeps)
+        logging.info('Adaptive sweep: measured {} of {} points'.format(state.done_sweeps,
+                                                                        int(np.prod(sweep_dimensions))))
+
+    return sweep_module.sweep(measurer, *sweep_parameters,
+                              traversal=adaptive_indices(sweep_dimensions, get_signal, initial_step=initial_step,
+                                                         tolerance=tolerance, criterion=criterion, on_plan=plan),
+                              on_start=[(attach_state, tuple())]+on_start,
+                              on_finish=[(report_measured_points, tuple())]+on_finish,
+                              **kwargs)
@@ -4,14 +4,68 @@
 import numpy as np
 import logging
 import threading
+from collections import OrderedDict
+from qsweepy.libraries.reducer_pool import reducer_pool
+
+
+class reduction_pass(dict):
+	'''
+	Raw data of a single measurement together with the intermediate results computed from it.
+	Filters request intermediates (demodulated IQ, averages over an axis, ...) through shared(), so that every
+	intermediate is computed once per measurement no matter how many filters use it.
+	'''
+	def __init__(self, data):
+		super().__init__(data)
+		self.intermediates = {}
+
+	def shared(self, key, func):
+		if key not in self.intermediates:
+			self.intermediates[key] = func()
+		return self.intermediates[key]
+
+
+def shared(x, key, func):
+	'''
+	Returns the intermediate result identified by key, computing it with func() only if it hasn't been computed
+	during the current reduction pass yet. Outside of a reduction pass (filter called on a bare dict) just calls func().
+	'''
+	if isinstance(x, reduction_pass):
+		return x.shared(key, func)
+	return func()
+
+
+class fused_term:
+	'''
+	Describes how a filter can be evaluated together with other filters of the same group.
+	Filters with equal keys are evaluated by a single evaluate(x, operands) call, where operands is a dict
+	{filter_name: operand} and the return value is a dict {filter_name: result}.
+	filter is the standalone function, the term is only used while the filter's 'filter' is still that function.
+	'''
+	def __init__(self, key, operand, evaluate, filter):
+		self.key = key
+		self.operand = operand
+		self.evaluate = evaluate
+		self.filter = filter
+
 
 class data_reduce:
-	def __init__(self, source, thread_limit=1):
+	'''
+	Deferred postprocessing (measure_deferred_result) runs the filters either in a new thread per point
+	(backend='thread', at most thread_limit at a time) or in a persistent pool of worker processes
+	(backend='process', see reducer_pool), which delivers the results in acquisition order.
+	Filters that keep state between calls must be marked with 'stateful': True; the process backend evaluates them
+	in this process in acquisition order instead of in the workers.
+	'''
+	def __init__(self, source, thread_limit=1, backend='thread', workers=None, pool_depth=None):
 		self.source = source
 		self.filters = {}
 		self.extra_opts = {}
 		self.threads = []
 		self.thread_limiter = threading.Semaphore(thread_limit)
+		self.backend = backend
+		self.workers = workers
+		self.pool_depth = pool_depth
+		self.pool = None
 		if hasattr(self.source, 'pre_sweep'):
 			self.pre_sweep = self.source.pre_sweep
 		if hasattr(self.source, 'post_sweep'):
@@ -26,9 +80,30 @@ class data_reduce:
 	def get_opts(self):
 		return { filter_name:{**filter['get_opts'](), **self.extra_opts} for filter_name, filter in self.filters.items()}
 		
+	def acquire(self):
+		return self.source.measure()
+
+	def reduce(self, data, filter_names=None):
+		# single pass over the raw data: intermediates are shared between filters and
+		# filters that declare a fused term are evaluated group-wise
+		filters = self.filters if filter_names is None else {name: self.filters[name] for name in filter_names}
+		x = reduction_pass(data)
+		groups = {}
+		for filter_name, filter in filters.items():
+			term = filter.get('fused')
+			if term is not None and term.filter is filter['filter']:
+				groups.setdefault(term.key, (term.evaluate, {}))[1][filter_name] = term.operand
+		result = {}
+		for evaluate, operands in groups.values():
+			result.update(evaluate(x, operands))
+		for filter_name, filter in filters.items():
+			if filter_name not in result:
+				result[filter_name] = filter['filter'](x)
+		return {filter_name: result[filter_name] for filter_name in filters.keys()}
+
 	def measure(self):
-		data = self.source.measure()
-		result = { filter_name:filter['filter'](data) for filter_name, filter in self.filters.items()}
+		data = self.acquire()
+		result = self.reduce(data)
 		del data
 		return result
 		
@@ -48,7 +123,7 @@ class data_reduce:
 			self.thread_limiter.release()
 			
 	def postprocess(self, data, callback, args):
-		result = { filter_name:filter['filter'](data) for filter_name, filter in self.filters.items()}
+		result = self.reduce(data)
 		#print ('Finished postprocessing with args: ', args)
 		del data
 		callback(result, *args)
@@ -58,6 +133,24 @@ class data_reduce:
 			self.source.measure_deferred_result(self.postprocess, args=(callback, args)) 
 			return
 		data = self.source.measure()
+		if self.backend == 'process':
+			if reducer_pool.available():
+				if self.pool is None:
+					# filters that accumulate state (e.g. hist_filter with a histogram) run in this process,
+					# the workers only get copies of them
+					stateful = [name for name, filter in self.filters.items() if filter.get('stateful')]
+					stateless = [name for name in self.filters.keys() if name not in stateful]
+					self.pool = reducer_pool(lambda data: self.reduce(data, stateless), self.workers, self.pool_depth,
+											 parent_reduce=(lambda data: self.reduce(data, stateful)) if stateful else None)
+				try:
+					self.pool.submit(data, callback, args)
+				except Exception:
+					print ('Postprocessing exception detected with args, joining all deferred postprocessing: ', args)
+					self.join_deferred()
+					raise
+				return
+			logging.warning('data_reduce: process backend needs the fork start method, falling back to threads.')
+			self.backend = 'thread'
 		# first, traverse all threads and make sure they didn't exit with an exception, otherwise rethrow the expection in the main thread
 		for t in self.threads:
 			if hasattr(t, 'termination_cause'):
@@ -72,9 +165,63 @@ class data_reduce:
 		t.start()
 	
 	def join_deferred(self):
-		for t in self.threads:
+		# finished threads remove themselves from self.threads, iterate over a copy
+		for t in list(self.threads):
 			t.join()
-		
+		if self.pool is not None:
+			pool, self.pool = self.pool, None
+			pool.join()
+
+class demodulation_kernels:
+	'''
+	Cache of demodulation kernels exp(2*pi*1j*frequency*t) on a uniformly sampled time axis.
+	Kernels are keyed by (frequency, sample rate, length, start time) and only rebuilt when one of them changes.
+	The least recently used kernels are dropped once there are more than max_kernels of them.
+	'''
+	def __init__(self, max_kernels=64):
+		self.max_kernels = max_kernels
+		self.kernels = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, time, frequency):
+		time = np.asarray(time)
+		sample_rate = 1/(time[1]-time[0]) if len(time) > 1 else 0
+		key = (frequency, sample_rate, len(time), time[0] if len(time) else 0)
+		with self.lock:
+			kernel = self.kernels.get(key)
+			if kernel is not None:
+				self.kernels.move_to_end(key)
+				return kernel
+		kernel = np.exp(1j*2*np.pi*time*frequency)
+		kernel.setflags(write=False)
+		with self.lock:
+			self.kernels[key] = kernel
+			while len(self.kernels) > self.max_kernels:
+				self.kernels.popitem(last=False)
+		return kernel
+
+	def clear(self):
+		with self.lock:
+			self.kernels.clear()
+
+kernel_cache = demodulation_kernels()
+
+def demodulate_decimate(data, kernel, axis, downsample):
+	'''
+	Multiplies data by kernel along axis and averages blocks of downsample consecutive samples,
+	without building the full demodulated array.
+	'''
+	data = np.asarray(data)
+	blocks = data.shape[axis]//downsample
+	data = np.reshape(data, data.shape[:axis]+(blocks, downsample)+data.shape[axis+1:])
+	kernel = np.reshape(kernel[:blocks*downsample], (blocks, downsample))
+	indices = list(range(data.ndim))
+	output = indices[:axis+1]+indices[axis+2:]
+	return np.einsum(data, indices, kernel, [axis, axis+1], output)/downsample
+
+def shared_mean(x, src_meas, axis):
+	return shared(x, ('mean', src_meas, axis), lambda: np.mean(x[src_meas], axis=axis))
+
 def downsample_reducer(source, src_meas, axis, carrier, downsample, iq=True, iq_axis=-1):
 	def get_points():
 		new_axes = source.get_points()[src_meas].copy()
@@ -83,10 +230,18 @@ def downsample_reducer(source, src_meas, axis, carrier, downsample, iq=True, iq_
 		if iq:
 			new_axes [iq_axis][1] = np.asarray([j for i in zip(new_axes [iq_axis][1], new_axes [iq_axis][1]) for j in i ])
 		return new_axes
-	intermediate_axes = [len(a[1]) for a in source.get_points()[src_meas][:axis]]+[len(source.get_points()[src_meas][axis][1][::downsample]), downsample]+[len(a[1]) for a in source.get_points()[src_meas][axis+1:]]
-	filter_func = lambda x,s:np.mean(np.reshape(np.exp(s*2*np.pi*1j*source.get_points()[src_meas][axis][1]*carrier)*x[src_meas], intermediate_axes), axis=axis+1)
+	def filter_func(x):
+		kernel = kernel_cache.get(source.get_points()[src_meas][axis][1], carrier)
+		data = x[src_meas]
+		result = demodulate_decimate(data, kernel, axis, downsample)
+		if not iq:
+			return result
+		if np.isrealobj(data):
+			# demodulation with the conjugate kernel of real data gives the conjugate result
+			return np.concatenate([result, np.conj(result)], axis=iq_axis)
+		return np.concatenate([result, demodulate_decimate(data, np.conj(kernel), axis, downsample)], axis=iq_axis)
 	
-	filter = {'filter': lambda x:filter_func(x,1) if not iq else np.concatenate([filter_func(x,1), filter_func(x,-1)], axis=iq_axis),
+	filter = {'filter': filter_func,
 			  'get_points': get_points,
 			  'get_dtype': (lambda : complex if source.get_dtype()[src_meas] is complex else float),
 			  'get_opts': (lambda : source.get_opts()[src_meas])}
@@ -121,7 +276,7 @@ def mean_reducer(source, src_meas, axis):
 		new_axes = source.get_points()[src_meas].copy()
 		del new_axes [axis]
 		return new_axes
-	filter = {'filter': lambda x:np.mean(x[src_meas], axis=axis),
+	filter = {'filter': lambda x:shared_mean(x, src_meas, axis),
 			  'get_points': get_points,
 			  'get_dtype': (lambda : complex if source.get_dtype()[src_meas] is complex else float),
 			  'get_opts': (lambda : source.get_opts()[src_meas])}
@@ -132,7 +287,11 @@ def std_reducer(source, src_meas, axis):
 		new_axes = source.get_points()[src_meas].copy()
 		del new_axes [axis]
 		return new_axes
-	filter = {'filter': lambda x:np.std(x[src_meas], axis=axis),
+	def filter_func(x):
+		# same as np.std, but reuses the mean if another filter has already computed it
+		deviation = np.asarray(x[src_meas]) - np.expand_dims(shared_mean(x, src_meas, axis), axis)
+		return np.sqrt(np.mean(np.real(deviation*np.conj(deviation)), axis=axis))
+	filter = {'filter': filter_func,
 			  'get_points': get_points,
 			  'get_dtype': (lambda : complex if source.get_dtype()[src_meas] is complex else float),
 			  'get_opts': (lambda : source.get_opts()[src_meas])}
@@ -145,12 +304,11 @@ def std_reducer_noavg(source, src_meas, axis, noavg_axis):
 		return new_axes
 	def filter_func(x):
 		avg_dim = [len(a[1]) for a in source.get_points()[src_meas].copy()]
-		if hasattr(source, 'internal_average'):
-			if source.internal_average:
-				return np.zeros(avg_dim[1])
+		if getattr(source, 'internal_average', False):
+			return np.zeros(avg_dim[1])
 		else:
 			avg_dim[noavg_axis] = 1
-			return np.std(x[src_meas]-np.reshape(np.mean(x[src_meas], axis=noavg_axis), avg_dim), axis=axis)
+			return np.std(x[src_meas]-np.reshape(shared_mean(x, src_meas, noavg_axis), avg_dim), axis=axis)
 	filter = {'filter': filter_func,
 			  'get_points': get_points,
 			  'get_dtype': (lambda : float),
@@ -163,12 +321,10 @@ def mean_reducer_noavg(source, src_meas, axis):
 		del new_axes [axis]
 		return new_axes
 	def filter_func(x):
-		avg_dim = [len(a[1]) for a in source.get_points()[src_meas].copy()]
-		if hasattr(source, 'internal_average'):
-			if source.internal_average:
-				return x[src_meas] - np.mean(x[src_meas], axis=0)
+		if getattr(source, 'internal_average', False):
+			return x[src_meas] - shared_mean(x, src_meas, 0)
 		else:
-			return np.mean(x[src_meas], axis=axis) - np.mean(x[src_meas])
+			return shared_mean(x, src_meas, axis) - np.mean(x[src_meas])
 	filter = {'filter': filter_func,
 			  'get_points': get_points,
 			  'get_dtype': (lambda : complex if source.get_dtype()[src_meas] is complex else float),
@@ -185,6 +341,8 @@ def mean_reducer_freq(source, src_meas, axis_mean, freq):
 
 	if axis_dm>axis_mean:
 		axis_dm_new = axis_dm-1
+	else:
+		axis_dm_new = axis_dm
 		
 	def get_points():
 		new_axes = source.get_points()[src_meas].copy()
@@ -194,9 +352,9 @@ def mean_reducer_freq(source, src_meas, axis_mean, freq):
 
 			
 	def filter_func(x):
-		dm = np.exp(1j*2*np.pi*source.get_points()[src_meas][axis_dm][1]*freq)
-		mean_sample = np.mean(x[src_meas], axis=axis_mean)
-		return np.mean(mean_sample*dm, axis=axis_dm_new)
+		dm = kernel_cache.get(source.get_points()[src_meas][axis_dm][1], freq)
+		mean_sample = shared_mean(x, src_meas, axis_mean)
+		return np.tensordot(mean_sample, dm, axes=([axis_dm_new], [0]))/len(dm)
 	
 	filter = {'filter': filter_func,
 			  'get_points': get_points,
@@ -204,22 +362,36 @@ def mean_reducer_freq(source, src_meas, axis_mean, freq):
 			  'get_opts': (lambda : source.get_opts()[src_meas])}
 	return filter
 	
+def feature_products(src_meas, axis_mean):
+	'''
+	Returns the evaluation function of the fused term shared by feature_reducer and feature_reducer_binary.
+	All features of the group are stacked into a single matrix and contracted with the raw data in one pass,
+	the background is subtracted afterwards as sum(bg*feature) instead of subtracting it from every shot.
+	Operands are tuples (bg, feature, post), where post is applied to the sum of the corresponding feature.
+	'''
+	def evaluate(x, operands):
+		data = np.asarray(x[src_meas])
+		length = data.shape[axis_mean]
+		names = list(operands.keys())
+		features = np.stack([operands[name][1][:length] for name in names], axis=-1)
+		offsets = np.asarray([np.sum(operands[name][0][:length]*operands[name][1][:length]) for name in names])
+		products = np.tensordot(data, features, axes=([axis_mean], [0])) - offsets
+		return {name: operands[name][2](products[..., name_id]) for name_id, name in enumerate(names)}
+	return evaluate
+
 def feature_reducer(source, src_meas, axis_mean, bg, feature):
 	def get_points():
 		new_axes = source.get_points()[src_meas].copy()
 		del new_axes [axis_mean]
 		return new_axes
-	new_feature_shape = [1]*len(source.get_points()[src_meas])
-	new_feature_shape[axis_mean] = len(feature)
-	bg	= np.reshape(bg, new_feature_shape)
-	feature = np.reshape(feature, new_feature_shape)
+	bg = np.ravel(bg)
+	feature = np.ravel(feature)
+	evaluate = feature_products(src_meas, axis_mean)
+	operand = (bg, feature, lambda products: products)
 	def filter_func(x):
-		feature_truncated_shape = tuple([slice(None) if i != axis_mean else slice(x[src_meas].shape[axis_mean]) for i in range(len(new_feature_shape))])
-		feature_truncated = feature[feature_truncated_shape]
-		bg_truncated = bg[feature_truncated_shape]
-		#print (x[src_meas].shape, axis_mean, feature_truncated_shape, feature.shape, feature_truncated.shape)
-		return np.sum((x[src_meas]-bg_truncated)*feature_truncated, axis=axis_mean)
+		return evaluate(x, {None: operand})[None]
 	filter = {'filter': filter_func,
+			  'fused': fused_term(('feature_products', src_meas, axis_mean), operand, evaluate, filter_func),
 			  'get_points': get_points,
 			  'get_dtype': (lambda : source.get_dtype()[src_meas]),
 			  'get_opts': (lambda : source.get_opts()[src_meas])}
@@ -230,22 +402,39 @@ def feature_reducer_binary(source, src_meas, axis_mean, bg, feature):
 		new_axes = source.get_points()[src_meas].copy()
 		del new_axes [axis_mean]
 		return new_axes
-	new_feature_shape = [1]*len(source.get_points()[src_meas])
-	new_feature_shape[axis_mean] = len(feature)
-	bg	= np.reshape(bg, new_feature_shape)
-	feature = np.reshape(feature, new_feature_shape)
-	filter = {'filter': lambda x:(np.sum((x[src_meas]-bg)*feature, axis=axis_mean)>0)*2-1,
+	bg = np.ravel(bg)
+	feature = np.ravel(feature)
+	evaluate = feature_products(src_meas, axis_mean)
+	operand = (bg, feature, lambda products: (products>0)*2-1)
+	def filter_func(x):
+		return evaluate(x, {None: operand})[None]
+	filter = {'filter': filter_func,
+			  'fused': fused_term(('feature_products', src_meas, axis_mean), operand, evaluate, filter_func),
 			  'get_points': get_points,
 			  'get_dtype': (lambda : int),
 			  'get_opts': (lambda : source.get_opts()[src_meas])}
 	return filter
 	
-def hist_filter(source, *src_meas_values):
+def hist_filter(source, *src_meas_values, histogram=None):
+	'''
+	Fraction of shots in which every measurement m equals its value v, for (m, v) in src_meas_values.
+	If a streaming_histogram with edges [-0.5, 0.5, 1.5] is given as histogram, the matches of each acquisition are
+	accumulated in it and the fraction over all shots since its last reset() is returned instead.
+	That running fraction depends on the order in which points are reduced: it follows the acquisition order in
+	serial and pipelined sweeps and with the process backend (where the filter runs in the parent process),
+	but not with deferred threads (thread_limit>1), where it only stays thread-safe.
+	'''
 	def filter_func(x):
 		#print (x)
-		return np.mean(np.prod([x[m]==v for m, v in src_meas_values], axis=0))
+		match = np.all([np.asarray(x[m])==v for m, v in src_meas_values], axis=0)
+		if histogram is None:
+			return np.mean(match)
+		histogram.update(np.ravel(match).astype(float))
+		with histogram.lock:
+			return histogram.counts[1]/histogram.total
 	filter = {'filter': filter_func,
-			  'get_points': [],
+			  'stateful': histogram is not None,
+			  'get_points': lambda : [],
 			  'get_dtype': lambda : float,
-			  'get_opts': lambda : source.get_opts()[src_meas[0]]}
-	return filter
\ No newline at end of file
+			  'get_opts': lambda : source.get_opts()[src_meas_values[0][0]]}
+	return filter
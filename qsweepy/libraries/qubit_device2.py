@@ -493,16 +493,26 @@ class QubitDevice:
 
 
         feature_id = 0
-        for feature, threshold in zip(features, thresholds):
-            adc_reducer.set_feature_real(feature_id=feature_id, feature=feature, threshold=threshold)
-            feature_id += 1
+        if hasattr(adc_reducer, 'set_features_real'):
+            # all channels in one transaction, unchanged weights are not resent
+            features_thresholds = list(zip(features, thresholds))
+            adc_reducer.set_features_real({_id: feature for _id, (feature, threshold) in enumerate(features_thresholds)},
+                                          {_id: threshold for _id, (feature, threshold) in enumerate(features_thresholds)})
+            feature_id = len(features_thresholds)
+        else:
+            for feature, threshold in zip(features, thresholds):
+                adc_reducer.set_feature_real(feature_id=feature_id, feature=feature, threshold=threshold)
+                feature_id += 1
 
         adc_reducer.resultnumbers_dimension = 2**feature_id
 
         if disable_rest:
-            while (feature_id < self.modem.adc_device.adc.num_covariances):
-                adc_reducer.disable_feature(feature_id=feature_id)
-                feature_id += 1
+            if hasattr(adc_reducer, 'disable_features'):
+                adc_reducer.disable_features(range(feature_id, self.modem.adc_device.adc.num_covariances))
+            else:
+                while (feature_id < self.modem.adc_device.adc.num_covariances):
+                    adc_reducer.disable_feature(feature_id=feature_id)
+                    feature_id += 1
         return adc_reducer
 
     def invalid_calib(self, invalid: bool, calib_type: str, awg_ch: str):
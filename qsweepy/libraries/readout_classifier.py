@@ -2,6 +2,7 @@ import numpy as np
 from sklearn.metrics import make_scorer, roc_auc_score
 from sklearn.model_selection import cross_val_score, cross_validate
 from sklearn.base import BaseEstimator, ClassifierMixin
+from qsweepy.libraries.streaming_histogram import streaming_histogram
 
 def binary_readout_fidelity(y_pred, y_true):
     false_negative_rate = np.sum(y_true*(1-y_pred))/np.sum(y_true)
@@ -111,22 +112,35 @@ class linear_classifier(BaseEstimator, ClassifierMixin):
         #print (np.asarray(reduced).shape)
         return reduced
 
-    def naive_bayes(self, X, y):
-        from scipy.interpolate import griddata
+    def reduced_predictions(self, X):
         predictions = np.asarray(self.dimreduce(X))
         # reduce last class dimension
-        predictions = np.asarray(predictions - np.mean(predictions, axis=0))[:-1, :]
+        return np.asarray(predictions - np.mean(predictions, axis=0))[:-1, :]
 
-        hist_all, bins = np.histogramdd(predictions.T, bins=self.nbins)
-        proba_points = [(d_bins[1:]+d_bins[:-1])/2. for d_bins in bins]
-        hists = []
+    def naive_bayes(self, X, y):
+        predictions = self.reduced_predictions(X)
+        # bin edges are fixed by the range of this batch, naive_bayes_update() adds more shots to the same bins
+        self.histogram = streaming_histogram.from_samples(predictions.T, self.nbins, classes=self.class_list)
+        self.histogram.update(predictions.T, y)
+        self.update_probabilities()
+
+    def naive_bayes_update(self, X, y):
+        '''
+        Adds another batch of calibration shots to the class histograms without re-histogramming the previous ones.
+        X is preprocessed the same way as in fit().
+        '''
+        X = X - np.reshape(np.mean(X, axis=1), (-1, 1))
+        self.histogram.update(self.reduced_predictions(X).T, y)
+        self.update_probabilities()
 
-        for y_val in self.class_list:
-            hists.append(np.histogramdd(predictions[:,y==y_val].T, bins=bins)[0])
+    def update_probabilities(self):
+        from scipy.interpolate import griddata
+        proba_points = self.histogram.centers()
+        hists = np.asarray(self.histogram.class_counts, dtype=float)
+        hist_all = self.histogram.counts
 
-        hists = np.asarray(hists, dtype=float)
         probabilities = hists/hist_all
-        points = np.reshape(np.meshgrid(*proba_points), (predictions.shape[0], -1)).T
+        points = np.reshape(np.meshgrid(*proba_points), (len(proba_points), -1)).T
         #naive_probabilities = np.asarray([proba_points<0, proba_points>0], dtype=float)
         #probabilities[np.isnan(probabilities)] = naive_probabilities[np.isnan(probabilities)]
         #X = np.asarray(np.meshgrid(*tuple(bins)))
@@ -175,9 +189,7 @@ class linear_classifier(BaseEstimator, ClassifierMixin):
         #result = coo_matrix((np.ones(np.asarray(X).shape[0]), ((np.arange(np.asarray(X).shape[0]), self.predict(X)))), (np.asarray(X).shape[0], len(self.class_list)))
         #return result.todense()
         from scipy.interpolate import interpn
-        predictions = np.asarray(self.dimreduce(X))
-        # reduce last class dimension
-        predictions = np.asarray(predictions - np.mean(predictions, axis=0))[:-1, :]
+        predictions = self.reduced_predictions(X)
         #print (len(self.proba_points))
         #print (self.probabilities.shape)
         result = np.asarray([interpn(self.proba_points, self.probabilities[_class_id,...], np.asarray(predictions).T, method='nearest', bounds_error=False, fill_value=None) for _class_id, class_name in enumerate(self.class_list)]).T
@@ -0,0 +1,215 @@
+import numpy as np
+import multiprocessing
+import threading
+import logging
+import os
+
+
+def pack_layout(data, alignment=64):
+	'''
+	Describes how the ndarray values of a measurement result dict are placed in a flat shared buffer.
+	Returns (layout, size), layout being {key: (offset, dtype, shape)} for arrays and {key: (None, value, None)}
+	for everything else, which is sent to the workers as is.
+	'''
+	layout = {}
+	offset = 0
+	for key, value in data.items():
+		if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+			layout[key] = (offset, value.dtype.str, value.shape)
+			offset += (value.nbytes+alignment-1)//alignment*alignment
+		else:
+			layout[key] = (None, value, None)
+	return layout, offset
+
+
+def unpack(buffer, layout):
+	data = {}
+	for key, (offset, dtype, shape) in layout.items():
+		if offset is None:
+			data[key] = dtype
+		else:
+			dtype = np.dtype(dtype)
+			data[key] = np.frombuffer(buffer, dtype, int(np.prod(shape)), offset).reshape(shape)
+	return data
+
+
+def pool_worker(reduce, buffers, tasks, results):
+	while True:
+		task = tasks.get()
+		if task is None:
+			break
+		seq, slot, layout, data = task
+		try:
+			if data is None:
+				data = unpack(buffers[slot], layout)
+			result = reduce(data)
+			# results are pickled, so views into the shared buffer don't outlive the slot
+			results.put((seq, result, None))
+		except Exception as e:
+			try:
+				results.put((seq, None, e))
+			except Exception:
+				results.put((seq, None, RuntimeError(repr(e))))
+
+
+class reducer_pool:
+	'''
+	Persistent pool of worker processes that run reduce() on raw measurement data.
+
+	Raw data is copied into one of depth preallocated shared memory slots and reduced by whichever worker is free;
+	results are passed to the callbacks in submission order by a collector thread of the parent process.
+	At most depth points are in flight or waiting for delivery, submit() blocks when all slots are busy.
+
+	Workers are forked when the pool is started, so they see the filters as they were at that moment and
+	reduce() must not communicate with instruments. State changed by reduce() in a worker stays in that worker:
+	reductions that accumulate state go to parent_reduce, which the collector thread runs on the same raw data
+	in submission order before the slot is reused, and whose results are merged into those of the workers.
+	Slots are sized by the first submitted point; larger points are pickled through the task queue instead.
+	The pool needs the 'fork' start method (see available()). If a worker dies, submit() and join() raise
+	instead of waiting for its results.
+	'''
+	def __init__(self, reduce, workers=None, depth=None, parent_reduce=None, poll_interval=1.):
+		self.reduce = reduce
+		self.parent_reduce = parent_reduce
+		self.poll_interval = poll_interval
+		self.workers = workers if workers is not None else os.cpu_count()
+		self.depth = depth if depth is not None else 2*self.workers
+		self.processes = []
+		self.buffers = []
+		self.free_slots = []
+		self.slot_size = 0
+		self.slots_available = threading.Semaphore(self.depth)
+		self.lock = threading.Lock()
+		self.submitted = 0
+		self.delivered = 0
+		self.pending = {}
+		self.termination_cause = None
+		self.collector = None
+
+	@staticmethod
+	def available():
+		return 'fork' in multiprocessing.get_all_start_methods()
+
+	def start(self, slot_size):
+		context = multiprocessing.get_context('fork')
+		self.slot_size = slot_size
+		# RawArrays allocated before forking are shared with the workers without copying
+		self.buffers = [context.RawArray('b', max(slot_size, 1)) for slot in range(self.depth)]
+		self.free_slots = list(range(self.depth))
+		self.tasks = context.Queue()
+		self.results = context.Queue()
+		self.processes = [context.Process(target=pool_worker, args=(self.reduce, self.buffers, self.tasks, self.results),
+										  daemon=True) for worker in range(self.workers)]
+		for process in self.processes:
+			process.start()
+		self.collector = threading.Thread(target=self.collector_func, daemon=True)
+		self.collector.start()
+
+	def collector_func(self):
+		while True:
+			item = self.results.get()
+			if item is None:
+				break
+			seq, result, error = item
+			with self.lock:
+				self.pending[seq] = (result, error)
+			self.deliver()
+
+	def deliver(self):
+		while True:
+			with self.lock:
+				if self.delivered not in self.pending:
+					return
+				result, error = self.pending.pop(self.delivered)
+				slot, layout, data, callback, args = self.callbacks.pop(self.delivered)
+			try:
+				if error is not None:
+					logging.error('reducer_pool: postprocessing exception occured with args {}: {!r}'.format(args, error))
+					raise error
+				if self.termination_cause is None:
+					if self.parent_reduce is not None:
+						if data is None:
+							data = unpack(self.buffers[slot], layout)
+						result.update(self.parent_reduce(data))
+					del data
+					callback(result, *args)
+			except Exception as e:
+				if self.termination_cause is None:
+					self.termination_cause = e
+			finally:
+				with self.lock:
+					if slot is not None:
+						self.free_slots.append(slot)
+					self.delivered += 1
+				self.slots_available.release()
+
+	def check(self):
+		if self.termination_cause is not None:
+			raise self.termination_cause
+
+	def wait_slot(self):
+		'''
+		Takes a free slot, checking that the workers are alive while waiting.
+		'''
+		while not self.slots_available.acquire(timeout=self.poll_interval):
+			dead = [process for process in self.processes if not process.is_alive()]
+			if dead:
+				self.terminate()
+				raise RuntimeError('reducer_pool: worker process {} exited with code {}'.format(
+					dead[0].pid, dead[0].exitcode))
+
+	def terminate(self):
+		for process in self.processes:
+			if process.is_alive():
+				process.terminate()
+		for process in self.processes:
+			process.join()
+		self.results.put(None)
+		self.collector.join()
+		self.collector = None
+		self.processes = []
+		self.buffers = []
+
+	def submit(self, data, callback, args):
+		self.check()
+		layout, size = pack_layout(data)
+		if self.collector is None:
+			self.callbacks = {}
+			self.start(size)
+		self.wait_slot()
+		with self.lock:
+			slot = self.free_slots.pop() if size <= self.slot_size else None
+			seq = self.submitted
+			self.submitted += 1
+			# pickled points are kept for parent_reduce, slot points are read back from the slot
+			self.callbacks[seq] = (slot, layout, data if slot is None and self.parent_reduce is not None else None,
+								   callback, args)
+		if slot is None:
+			self.tasks.put((seq, None, layout, data))
+			return
+		buffer = self.buffers[slot]
+		for key, (offset, dtype, shape) in layout.items():
+			if offset is not None:
+				np.frombuffer(buffer, np.dtype(dtype), data[key].size, offset).reshape(shape)[...] = data[key]
+		self.tasks.put((seq, slot, layout, None))
+
+	def join(self):
+		'''
+		Waits until all submitted points have been delivered, then stops the workers.
+		'''
+		if self.collector is None:
+			return
+		for slot in range(self.depth):
+			self.wait_slot()
+		for process in self.processes:
+			self.tasks.put(None)
+		for process in self.processes:
+			process.join()
+		self.results.put(None)
+		self.collector.join()
+		for slot in range(self.depth):
+			self.slots_available.release()
+		self.collector = None
+		self.processes = []
+		self.buffers = []
+		self.check()
@@ -0,0 +1,118 @@
+import numpy as np
+import threading
+
+
+class streaming_histogram:
+	'''
+	Multidimensional histogram with fixed bin edges that is accumulated batch by batch.
+
+	Memory does not depend on the number of samples: only the integer counts of each bin (per class, if classes are
+	given) are stored, and update() processes the samples in chunks of chunk_size. Samples outside of the edges
+	are dropped and counted in outside. Binning is the same as np.histogramdd with the same edges, so a histogram
+	accumulated from several batches equals the histogram of all samples at once.
+	Samples with labels that are not in classes are counted in other_counts: they are part of counts and total,
+	but of none of the class_counts. Counts are updated under lock, so update() can be called from several threads.
+	'''
+	def __init__(self, edges, classes=None, chunk_size=2**20):
+		self.edges = [np.asarray(d_edges, dtype=float) for d_edges in edges]
+		self.classes = list(classes) if classes is not None else None
+		self.chunk_size = chunk_size
+		self.shape = tuple(len(d_edges)-1 for d_edges in self.edges)
+		nclasses = len(self.classes) if self.classes is not None else 1
+		self.class_counts = np.zeros((nclasses,)+self.shape, dtype=np.int64)
+		self.other_counts = np.zeros(self.shape, dtype=np.int64)
+		self.outside = 0
+		self.lock = threading.Lock()
+
+	@classmethod
+	def from_samples(cls, samples, bins, classes=None, **kwargs):
+		'''
+		Creates an empty histogram with bins edges over the range of samples in each dimension, like np.histogramdd
+		with an integer number of bins. The samples themselves are not added.
+		'''
+		samples = np.atleast_2d(np.asarray(samples).T).T
+		return cls([np.histogram_bin_edges(samples[:, d], bins=bins) for d in range(samples.shape[1])], classes,
+				   **kwargs)
+
+	def bin_indices(self, samples):
+		'''
+		Flat bin index of every sample, -1 for samples outside of the edges.
+		'''
+		inside = np.ones(samples.shape[0], dtype=bool)
+		indices = []
+		for d, d_edges in enumerate(self.edges):
+			d_indices = np.searchsorted(d_edges, samples[:, d], side='right')-1
+			# the right edge of the last bin is inclusive
+			d_indices[samples[:, d] == d_edges[-1]] = len(d_edges)-2
+			inside &= (d_indices >= 0) & (d_indices < len(d_edges)-1)
+			indices.append(np.clip(d_indices, 0, len(d_edges)-2))
+		flat = np.ravel_multi_index(indices, self.shape) if indices else np.zeros(samples.shape[0], dtype=np.intp)
+		flat[~inside] = -1
+		return flat
+
+	def update(self, samples, labels=None):
+		'''
+		Adds a batch of samples with shape (N, D) (or (N,) for a one-dimensional histogram).
+		labels are required if the histogram has classes.
+		'''
+		samples = np.asarray(samples)
+		if samples.ndim == 1:
+			samples = samples[:, None]
+		if self.classes is not None:
+			if labels is None:
+				raise ValueError('streaming_histogram: labels are required for a histogram with classes')
+			labels = np.asarray(labels)
+			class_order = np.argsort(self.classes)
+			sorted_classes = np.asarray(self.classes)[class_order]
+		bins = int(np.prod(self.shape))
+		for start in range(0, samples.shape[0], self.chunk_size):
+			flat = self.bin_indices(samples[start:start+self.chunk_size])
+			other = None
+			if self.classes is not None:
+				chunk_labels = labels[start:start+self.chunk_size]
+				positions = np.clip(np.searchsorted(sorted_classes, chunk_labels), 0, len(sorted_classes)-1)
+				known = sorted_classes[positions] == chunk_labels
+				other = np.bincount(flat[(flat >= 0) & ~known], minlength=bins)
+				flat = np.where((flat >= 0) & known, class_order[positions]*bins+flat, -1)
+				outside = int(np.sum(flat < 0)) - int(np.sum(other))
+			else:
+				outside = int(np.sum(flat < 0))
+			counts = np.bincount(flat[flat >= 0], minlength=self.class_counts.size)
+			with self.lock:
+				self.outside += outside
+				self.class_counts += np.reshape(counts, self.class_counts.shape)
+				if other is not None:
+					self.other_counts += np.reshape(other, self.shape)
+
+	def merge(self, other):
+		'''
+		Adds the counts of another histogram with the same edges and classes.
+		'''
+		if other.classes != self.classes or other.shape != self.shape or \
+				not all(np.array_equal(a, b) for a, b in zip(self.edges, other.edges)):
+			raise ValueError('streaming_histogram: cannot merge histograms with different edges or classes')
+		with self.lock:
+			self.class_counts += other.class_counts
+			self.other_counts += other.other_counts
+			self.outside += other.outside
+		return self
+
+	def reset(self):
+		with self.lock:
+			self.class_counts[...] = 0
+			self.other_counts[...] = 0
+			self.outside = 0
+
+	@property
+	def counts(self):
+		'''
+		Histogram of all samples regardless of their class.
+		'''
+		return np.sum(self.class_counts, axis=0) + self.other_counts
+
+	@property
+	def total(self):
+		return int(np.sum(self.class_counts) + np.sum(self.other_counts))
+
+	def centers(self):
+		return tuple((d_edges[1:]+d_edges[:-1])/2. for d_edges in self.edges)
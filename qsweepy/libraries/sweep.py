@@ -1,8 +1,10 @@
 import itertools
 import random
 from qsweepy.ponyfiles.data_structures import *
-# import traceback
+import traceback
 import time
+import threading
+import queue
 
 
 def optimize(target, *params ,initial_simplex=None ,maxfun=200, bounds=None ):
@@ -112,9 +114,211 @@ example: point_parameter(vna) should return
 '''
 
 
+class SweepPipeline:
+    """
+    Reduction stage of a pipelined sweep.
+
+    Raw points acquired by the measurement thread are put into a bounded queue and reduced by a single worker
+    thread in the order they have been acquired, so that the setters and acquisition of point N+1 overlap with
+    the reduction of point N. Reduced points are handed back to the measurement thread, which stores them
+    (running the on_update callbacks) in acquisition order on each put() and on join(): exdir writers,
+    database sessions and plotting stay on the thread that started the sweep.
+    """
+    def __init__(self, reducer, consumer, depth=1):
+        self.reducer = reducer
+        self.consumer = consumer
+        self.queue = queue.Queue(maxsize=depth)
+        self.reduced = queue.Queue()
+        self.termination_cause = None
+        self.thread = threading.Thread(target=self.worker_func, daemon=True)
+        self.thread.start()
+
+    def worker_func(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            # after a failure keep draining the queue so that the measurement thread never blocks on put()
+            if self.termination_cause is not None:
+                continue
+            try:
+                self.reduced.put((self.reducer(*item),) + item[1:])
+            except Exception as e:
+                print('Pipelined postprocessing exception occured with args: ', item[1:])
+                self.termination_cause = e
+
+    def check(self):
+        if self.termination_cause is not None:
+            raise self.termination_cause
+
+    def collect(self):
+        """
+        Stores the points that have been reduced so far.
+        """
+        while True:
+            try:
+                item = self.reduced.get_nowait()
+            except queue.Empty:
+                return
+            self.consumer(*item)
+
+    def put(self, *args):
+        self.check()
+        self.collect()
+        self.queue.put(args)
+
+    def join(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.collect()
+        self.check()
+
+
+def traversal_changes(sweep_dimensions, order, snake=False):
+    """
+    Number of setter calls each sweep parameter gets (apart from the first point) when the index grid is
+    traversed with the dimensions in the given order.
+
+    Parameters
+    ----------
+    sweep_dimensions : tuple[int]
+        number of points of each sweep parameter
+    order : list[int]
+        sweep parameter ids, outermost first
+    snake : bool
+        if True, inner dimensions are traversed back and forth instead of being reset at the end of each row
+
+    Returns
+    -------
+    list[int]
+        number of value changes of each sweep parameter, in the original parameter order
+    """
+    changes = [0 for d in sweep_dimensions]
+    outer_points = 1
+    for parameter_id in order:
+        if snake:
+            changes[parameter_id] = outer_points*(sweep_dimensions[parameter_id]-1)
+        else:
+            changes[parameter_id] = outer_points*sweep_dimensions[parameter_id]-1
+        outer_points *= sweep_dimensions[parameter_id]
+    return changes
+
+
+def plan_traversal(sweep_parameters, snake=True):
+    """
+    Finds the order of sweep dimensions with the lowest total setter cost.
+    The cost of each parameter is estimated by MeasurementParameter.get_setter_cost().
+
+    Parameters
+    ----------
+    sweep_parameters : list[MeasurementParameter]
+    snake : bool
+        whether the traversal is boustrophedon (see traversal_changes)
+
+    Returns
+    -------
+    list[int]
+        sweep parameter ids, outermost first
+    """
+    sweep_dimensions = tuple([len(sweep_parameter.values) for sweep_parameter in sweep_parameters])
+    costs = [sweep_parameter.get_setter_cost() for sweep_parameter in sweep_parameters]
+
+    def total_cost(order):
+        return sum(cost*changes for cost, changes in zip(costs, traversal_changes(sweep_dimensions, order, snake)))
+
+    # sweeps rarely have more than a handful of dimensions, so brute force is fine.
+    # min() keeps the first of equally good orders, i.e. the plain C order if setters are equally fast
+    return list(min(itertools.permutations(range(len(sweep_dimensions))), key=total_cost))
+
+
+def traversal_indices(sweep_dimensions, order=None, snake=False):
+    """
+    Generates indices of the sweep grid in traversal order. The indices are always in the original parameter order,
+    so that data is written to the same place regardless of the visit order.
+
+    Parameters
+    ----------
+    sweep_dimensions : tuple[int]
+        number of points of each sweep parameter
+    order : list[int]
+        sweep parameter ids, outermost first. Defaults to the original order (C order).
+    snake : bool
+        if True, each dimension reverses its direction at the end of a row instead of jumping back to its start
+    """
+    if order is None:
+        order = list(range(len(sweep_dimensions)))
+    permuted_dimensions = [sweep_dimensions[parameter_id] for parameter_id in order]
+    for permuted_indices in itertools.product(*([i for i in range(d)] for d in permuted_dimensions)):
+        indices = [0 for d in sweep_dimensions]
+        # number of rows of the current dimension that have already been traversed
+        rows = 0
+        for parameter_id, index, d in zip(order, permuted_indices, permuted_dimensions):
+            indices[parameter_id] = d-1-index if snake and rows % 2 else index
+            rows = rows*d+index
+        yield tuple(indices)
+
+
+def resume_measurement_state(state, resume_state):
+    """
+    Copies the data of an interrupted measurement into a freshly initialized sweep state and
+    makes the state refer to the same DB row and exdir file.
+
+    Parameters
+    ----------
+    state : MeasurementState
+        state of the new sweep with initialized (NaN-filled) datasets
+    resume_state : MeasurementState
+        state of the interrupted measurement
+
+    Returns
+    -------
+    ndarray
+        boolean mask over the sweep dimensions, True for points that have already been measured
+    """
+    measured = None
+    for dataset_name, dataset in state.datasets.items():
+        if dataset_name not in resume_state.datasets:
+            raise ValueError('Cannot resume measurement {}: dataset {} is missing'.format(resume_state.id, dataset_name))
+        resume_data = np.asarray(resume_state.datasets[dataset_name].data)
+        if resume_data.shape != dataset.data.shape:
+            raise ValueError('Cannot resume measurement {}: dataset {} has shape {}, expected {}'.format(
+                resume_state.id, dataset_name, resume_data.shape, dataset.data.shape))
+        dataset.data[...] = resume_data
+        point_axes = tuple(range(len(state.parameter_values), dataset.data.ndim))
+        dataset_measured = np.logical_not(np.any(np.isnan(dataset.data), axis=point_axes))
+        measured = dataset_measured if measured is None else np.logical_and(measured, dataset_measured)
+
+    state.id = resume_state.id
+    state.filename = resume_state.filename
+    state.start = resume_state.start
+    state.measurement_time = resume_state.measurement_time
+    state.metadata = {**resume_state.metadata, **state.metadata}
+    if measured is not None:
+        state.done_sweeps = int(np.sum(measured))
+    return measured
+
+
+def callback_phase_names(callbacks, prefix):
+    """
+    Names under which callbacks are recorded in SweepTiming, e.g. 'on_update update_exdir'.
+    Callbacks with the same name (lambdas) are numbered.
+    """
+    names = []
+    for event_handler, arguments in callbacks:
+        name = '{} {}'.format(prefix, getattr(event_handler, '__name__', type(event_handler).__name__))
+        if name in names:
+            name = '{} {}'.format(name, len([n for n in names if n.startswith(name)]))
+        names.append(name)
+    return names
+
+
 def sweep(measurer, *parameters, shuffle=False,
           on_start=[], on_update=[], on_finish=[],
           use_deferred=False,
+          pipelined=False,
+          pipeline_depth=1,
+          traversal=None,
+          resume_state=None,
           ignore_callback_errors=True,
           on_update_divider = 1,
           **kwargs):
@@ -126,21 +330,42 @@ def sweep(measurer, *parameters, shuffle=False,
     measurer
         an object that supports get_points(), measure(), get_dtype() and get_opts() methods.
     parameters : list[tuple]
-        tuple associated with a parameter has the following meaning: (param_values, param_setter, param_name)
+        tuple associated with a parameter has the following meaning: (param_values, param_setter, param_name).
+        MeasurementParameter instances are also accepted; their setter timings carry over between sweeps.
     shuffle
     on_start
     on_update
     on_finish
-    use_deferred
+    use_deferred : bool
+        If True and the measurer supports measure_deferred_result(), reduction and storage of each point are handed
+        over to the measurer's background workers (for data_reduce: threads or a process pool, see its backend).
+    pipelined : bool
+        If True, measurers that provide acquire() and reduce() have the reduction of each point run in a
+        background thread while the next point is being set and acquired. Storage and on_update callbacks stay
+        on the calling thread and run in acquisition order, so the results are identical to the serial loop.
+    pipeline_depth : int
+        Maximum number of acquired points waiting for postprocessing in pipelined mode.
+    traversal : str
+        Order in which the index grid is visited. None or 'c' walks it in C order, 'snake' walks it back and forth,
+        'optimal' additionally reorders the dimensions to minimize the total setter time (see plan_traversal).
+        An iterable of index tuples visits exactly these points in the given order; it is consumed lazily, so
+        it can depend on the data measured so far (see adaptive_sweep). Ignored if shuffle is True.
+    resume_state : MeasurementState
+        State of an interrupted measurement of the same sweep (e.g. from load_exdir). Its data is copied into the
+        new state, points that have been measured already (no NaNs in any dataset) are skipped, and the id and
+        filename are reused so that the callbacks reattach to the same DB row and exdir file.
     kwargs
 
     Returns
     -------
     MeasurementState
-        Structure after measurement dict of ndarrays each corresponding to a measurement in the sweep
+        Structure after measurement dict of ndarrays each corresponding to a measurement in the sweep.
+        Per-point durations of the setters, acquisition, reduction, storage and callbacks are recorded
+        in state.timing; their summary is added to state.metadata before the on_finish callbacks.
     """
 
-    sweep_parameters = [MeasurementParameter(*parameter) for parameter in parameters]
+    sweep_parameters = [parameter if isinstance(parameter, MeasurementParameter) else MeasurementParameter(*parameter)
+                        for parameter in parameters]
     point_parameters = measurer_point_parameters(measurer)
 
     # ndarray.shape equivalent for sweep_parameters
@@ -162,81 +387,166 @@ def sweep(measurer, *parameters, shuffle=False,
             data.fill(np.nan)
         state.datasets[dataset_name] = MeasurementDataset(parameters = all_parameters, data = data)
 
-    all_indeces = itertools.product(*([i for i in range(d)] for d in sweep_dimensions))
+    measured = None
+    if resume_state is not None:
+        measured = resume_measurement_state(state, resume_state)
+
+    if traversal == 'optimal':
+        all_indeces = traversal_indices(sweep_dimensions, plan_traversal(sweep_parameters), snake=True)
+    elif traversal == 'snake':
+        all_indeces = traversal_indices(sweep_dimensions, snake=True)
+    elif traversal in (None, 'c'):
+        all_indeces = itertools.product(*([i for i in range(d)] for d in sweep_dimensions))
+    elif not isinstance(traversal, str):
+        all_indeces = traversal
+    else:
+        raise ValueError('Unknown sweep traversal: {}'.format(traversal))
     if shuffle:
         all_indeces = [i for i in all_indeces]
         random.shuffle(all_indeces)
     if len(sweep_dimensions)==0: # 0-d sweep case: single measurement
         all_indeces = [[]]
+    if measured is not None:
+        all_indeces = [indeces for indeces in all_indeces if not measured[tuple(indeces)]]
 
-    def set_single_measurement_result(single_measurement_result, indeces):
+    on_update_phases = callback_phase_names(on_update, 'on_update')
+    setter_phases = ['setter {}'.format(sweep_parameter.name) for sweep_parameter in sweep_parameters]
+    # deferred postprocessing threads store their points concurrently
+    store_lock = threading.Lock()
+
+    def set_single_measurement_result(single_measurement_result, indeces, point_id):
         start_single_result = time.time()
         nonlocal state, indices_buffer
         indeces = list(indeces)
-        indices_buffer = indices_buffer + indeces
-        for dataset in single_measurement_result.keys():
-            state.datasets[dataset].data[tuple(indeces+[...])] = single_measurement_result[dataset]
-            state.datasets[dataset].indeces_updates = tuple(indeces+[...])
-        state.done_sweeps += 1
-
-        if (not (state.done_sweeps % on_update_divider)) or state.done_sweeps == state.total_sweeps:
-            for event_handler, arguments in on_update:
+        with store_lock:
+            indices_buffer = indices_buffer + indeces
+            for dataset in single_measurement_result.keys():
+                state.datasets[dataset].data[tuple(indeces+[...])] = single_measurement_result[dataset]
+                state.datasets[dataset].indeces_updates = tuple(indeces+[...])
+            state.done_sweeps += 1
+            run_callbacks = (not (state.done_sweeps % on_update_divider)) or state.done_sweeps == state.total_sweeps
+            # the callbacks get the indices stored up to now; points stored by other threads while the
+            # callbacks run go to the next batch
+            if run_callbacks:
+                pending, indices_buffer = indices_buffer, []
+        state.timing.add(point_id, 'store', time.time() - start_single_result)
+
+        if run_callbacks:
+            for (event_handler, arguments), phase in zip(on_update, on_update_phases):
+                callback_start = time.time()
                 try:
-                    event_handler(state, indices_buffer, *arguments)
+                    event_handler(state, pending, *arguments)
                 except Exception as e:
                     if not ignore_callback_errors:
                         raise
                     #traceback.print_exc()
-            indices_buffer = []
-        print('set_single_measurement_result', time.time() - start_single_result)
+                finally:
+                    state.timing.add(point_id, phase, time.time() - callback_start)
 
-    for event_handler, arguments in on_start:
+    for (event_handler, arguments), phase in zip(on_start, callback_phase_names(on_start, 'on_start')):
+        callback_start = time.time()
         try:
             event_handler(state, *arguments)
         except Exception as e:
             if not ignore_callback_errors:
                 raise
             #traceback.print_exc()
+        finally:
+            state.timing.add_event(phase, time.time() - callback_start)
 
-    ################
-    if hasattr(measurer, 'pre_sweep'):
-        measurer.pre_sweep()
-    for indeces in all_indeces:
-        if state.request_stop_acq:
-            break
-        # check which values have changed this sweep
-        measurement_start = time.time()
-        old_parameter_values = state.parameter_values
-        state.parameter_values = [sweep_parameters[parameter_id].values[value_id] for parameter_id, value_id in enumerate(indeces)]
-        changed_values = np.logical_not(np.equal(old_parameter_values, state.parameter_values))#[old_parameter_values!=state.parameter_values for old_val, val in zip(old_vals, vals)]
-        # set to new param vals
-        for value, sweep_parameter, changed in zip(state.parameter_values, sweep_parameters, changed_values):
-            if changed:
-                setter_start = time.time()
-                sweep_parameter.setter(value)
-                sweep_parameter.setter_time += time.time() - setter_start
-        #measuring
-
-        if hasattr(measurer, 'measure_deferred_result') and use_deferred:
-            measurer.measure_deferred_result(set_single_measurement_result, (indeces, ))
-        else:
-            mpoint = measurer.measure()
-            #saving data to containers
-            set_single_measurement_result(mpoint, indeces)
+    if hasattr(measurer, 'acquire') and hasattr(measurer, 'reduce'):
+        acquire, reduce = measurer.acquire, measurer.reduce
+    else:
+        acquire, reduce = measurer.measure, None
+
+    def reduce_point(data, indeces, point_id):
+        if reduce:
+            reduction_start = time.time()
+            data = reduce(data)
+            state.timing.add(point_id, 'reduction', time.time() - reduction_start)
+        return data
 
-        state.measurement_time += time.time() - measurement_start
+    def postprocess(data, indeces, point_id):
+        set_single_measurement_result(reduce_point(data, indeces, point_id), indeces, point_id)
 
-        
-    if hasattr(measurer, 'join_deferred'):
-        print ('Waiting to join deferred threads:')
-        measurer.join_deferred()
+    pipeline = None
+    if pipelined:
+        pipeline = SweepPipeline(reduce_point, set_single_measurement_result, depth=pipeline_depth)
 
-    for event_handler, arguments in on_finish:
+    ################
+    if hasattr(measurer, 'pre_sweep'):
+        measurer.pre_sweep()
+    loop_finished = False
+    try:
+        for point_id, indeces in enumerate(all_indeces):
+            if state.request_stop_acq:
+                break
+            state.started_sweeps += 1
+            # check which values have changed this sweep
+            measurement_start = time.time()
+            old_parameter_values = state.parameter_values
+            state.parameter_values = [sweep_parameters[parameter_id].values[value_id] for parameter_id, value_id in enumerate(indeces)]
+            changed_values = np.logical_not(np.equal(old_parameter_values, state.parameter_values))#[old_parameter_values!=state.parameter_values for old_val, val in zip(old_vals, vals)]
+            # set to new param vals
+            for value, sweep_parameter, changed, phase in zip(state.parameter_values, sweep_parameters, changed_values, setter_phases):
+                if changed:
+                    setter_start = time.time()
+                    sweep_parameter.setter(value)
+                    setter_time = time.time() - setter_start
+                    sweep_parameter.setter_time += setter_time
+                    sweep_parameter.setter_calls += 1
+                    state.timing.add(point_id, phase, setter_time)
+            #measuring
+
+            acquisition_start = time.time()
+            if pipeline is not None:
+                data = acquire()
+                state.timing.add(point_id, 'acquisition', time.time() - acquisition_start)
+                # postprocessing of this point overlaps with the setters and acquisition of the next one
+                pipeline.put(data, indeces, point_id)
+            elif hasattr(measurer, 'measure_deferred_result') and use_deferred:
+                measurer.measure_deferred_result(set_single_measurement_result, (indeces, point_id))
+                state.timing.add(point_id, 'acquisition', time.time() - acquisition_start)
+            else:
+                data = acquire()
+                state.timing.add(point_id, 'acquisition', time.time() - acquisition_start)
+                #saving data to containers
+                postprocess(data, indeces, point_id)
+
+            state.measurement_time += time.time() - measurement_start
+        loop_finished = True
+    finally:
+        if pipeline is not None:
+            try:
+                pipeline.join()
+            except Exception:
+                # don't hide the exception raised in the sweep loop
+                if loop_finished:
+                    raise
+                print ('Pipelined postprocessing exception while handling a sweep exception:')
+                traceback.print_exc()
+        # deferred workers are also stopped after an exception, so that the next sweep starts with fresh ones
+        if hasattr(measurer, 'join_deferred'):
+            print ('Waiting to join deferred threads:')
+            try:
+                measurer.join_deferred()
+            except Exception:
+                if loop_finished:
+                    raise
+                print ('Deferred postprocessing exception while handling a sweep exception:')
+                traceback.print_exc()
+
+    state.metadata.update(state.timing.summary_metadata())
+
+    for (event_handler, arguments), phase in zip(on_finish, callback_phase_names(on_finish, 'on_finish')):
+        callback_start = time.time()
         try:
             event_handler(state, *arguments)
         except Exception as e:
             if not ignore_callback_errors:
                 raise
             print(e)
+        finally:
+            state.timing.add_event(phase, time.time() - callback_start)
 
     return state
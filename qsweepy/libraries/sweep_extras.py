@@ -1,8 +1,10 @@
 import qsweepy.libraries.sweep as sweep
+import qsweepy.libraries.adaptive_sweep as adaptive_sweep
 import qsweepy.libraries.plotly_plot as plotly_plot
 from ..fitters.fit_dataset import fit_dataset_1d
 from datetime import timedelta
 from qsweepy.ponyfiles import save_exdir
+from pony.orm import db_session
 '''
 Interactive stuff:
 - (matplotlib) UI &  & telegram bot,
@@ -22,23 +24,27 @@ class Sweeper:
     """
     nice function
     """
-    def __init__(self, db, sample_name=None):
+    def __init__(self, db, sample_name=None, buffered_exdir=False, compress_exdir=False):
         self.db = db
         self.default_save_path = ''
         self.sample_name = sample_name
         self.ignore_callback_errors = True
         self.on_start = [(db.create_in_database, tuple()),
-                         (save_exdir.save_exdir, (True,)),
+                         (save_exdir.save_exdir, (True, buffered_exdir, compress_exdir)),
                          (db.update_in_database, tuple()),
                          # (sweep_fit.fit_on_start, (db,))
                          ]
         self.on_update = [(save_exdir.update_exdir, tuple()),
                           (self.print_time, tuple())
                           ]
+        self.on_resume = [(save_exdir.reopen_exdir, (buffered_exdir, compress_exdir or None)),
+                          (db.update_in_database, tuple())]
         self.on_finish = [# (sweep_fit.fit_on_finish, (db, )),
+                          (save_exdir.save_timing_exdir, tuple()),
                           (db.update_in_database,tuple()),
                           (save_exdir.close_exdir, tuple()),
-                          (plotly_plot.save_default_plot,(self.db,))]
+                          (plotly_plot.save_default_plot,(self.db,)),
+                          (self.save_timing_summary, tuple())]
 
         self.on_start_fit = [(lambda x: db.create_in_database(x.fit), tuple()),
                              (lambda x: save_exdir.save_exdir(x.fit, True), tuple()),
@@ -70,6 +76,57 @@ class Sweeper:
                            ignore_callback_errors=self.ignore_callback_errors,
                            **kwargs)
 
+    def adaptive_sweep(self, *args, on_start=[], on_update=[], on_finish=[], **kwargs):
+        """
+        hook for n-dimensional measurement with adaptive sampling (see adaptive_sweep.adaptive_sweep)
+        :param args:
+        :param on_start:
+        :param on_update:
+        :param on_finish:
+        :param kwargs:
+        :return:
+        """
+        return adaptive_sweep.adaptive_sweep(*args,
+                                             sample_name=self.sample_name,
+                                             on_start=on_start+self.on_start,
+                                             on_finish=on_finish+self.on_finish,
+                                             on_update=on_update+self.on_update,
+                                             ignore_callback_errors=self.ignore_callback_errors,
+                                             **kwargs)
+
+    def resume(self, measurement_id, *args, on_start=[], on_update=[], on_finish=[], **kwargs):
+        """
+        Continues an interrupted n-dimensional measurement. The sweep has to be called with the same
+        measurer and parameters as the original one; points already stored in the exdir file are skipped
+        and the results are written to the same exdir file and DB row.
+        :param measurement_id: id of the interrupted measurement
+        :param args:
+        :param on_start:
+        :param on_update:
+        :param on_finish:
+        :param kwargs:
+        :return:
+        """
+        with db_session:
+            filename = self.db.Data[measurement_id].filename
+            resume_state = save_exdir.load_exdir(filename, db=self.db)
+        kwargs.setdefault('measurement_type', resume_state.measurement_type)
+        return sweep.sweep(*args,
+                           sample_name=self.sample_name,
+                           resume_state=resume_state,
+                           on_start=on_start+self.on_resume,
+                           on_finish=on_finish+self.on_finish,
+                           on_update=on_update+self.on_update,
+                           ignore_callback_errors=self.ignore_callback_errors,
+                           **kwargs)
+
+    def save_timing_summary(self, state):
+        """
+        Updates the timing summary in the database with the durations of the on_finish callbacks (e.g. plotting).
+        """
+        state.metadata.update(state.timing.summary_metadata())
+        self.db.update_in_database(state)
+
     def print_time(self, state, indeces):
         time_per_sweep = state.measurement_time/state.done_sweeps
         total_time=time_per_sweep*state.total_sweeps
@@ -1,4 +1,5 @@
 import numpy as np
+import threading
 from datetime import datetime
 from typing import List, Mapping
 
@@ -16,6 +17,9 @@ class MeasurementParameter:
         self.unit = param[3] if len(param) > 3 else ''
         self.pre_setter = param[4] if len(param) > 4 else None
         self.setter_time = 0
+        self.setter_calls = 0
+        # a-priori estimate of the time per setter call, used until the setter has been timed
+        self.setter_cost = kwargs.get('setter_cost', 0)
 
         if 'name' in kwargs:
             self.name = kwargs['name']
@@ -24,6 +28,14 @@ class MeasurementParameter:
         if 'pre_setter' in kwargs:
             self.pre_setter = kwargs['pre_setter']
 
+    def get_setter_cost(self):
+        """
+        Average time per setter call measured so far, or the a-priori setter_cost if the setter hasn't been called.
+        """
+        if self.setter_calls:
+            return self.setter_time/self.setter_calls
+        return self.setter_cost
+
     def __str__(self):
         return '{name} ({units}),:[{min}, {max}] ({num_points} points) {setter_str}'.format(#'{name} ({units}): [{min}, {max}] ({num_points} points) {setter_str}'.format(
             name=self.name,
@@ -91,6 +103,85 @@ data: {}'''
         return str(self)
 
 
+class SweepTiming:
+    """
+    Per-point timing records of a sweep.
+    For every phase of the sweep loop (setters, acquisition, reduction, storage, callbacks) the time spent
+    on each point is stored in seconds; phases that haven't run on a point count as zero.
+    One-off phases such as on_start and on_finish callbacks are stored in events.
+    Records can be added from several threads.
+    """
+    percentiles = (50, 90, 99)
+
+    def __init__(self):
+        self.records = {}
+        self.events = {}
+        self.lock = threading.Lock()
+
+    def add(self, point_id, phase, duration):
+        with self.lock:
+            record = self.records.setdefault(phase, [])
+            if len(record) <= point_id:
+                record.extend([0.]*(point_id + 1 - len(record)))
+            record[point_id] += duration
+
+    def add_event(self, phase, duration):
+        with self.lock:
+            self.events[phase] = self.events.get(phase, 0.) + duration
+
+    def copy(self):
+        """
+        Independent copy of the records and events (with its own lock).
+        """
+        copy = SweepTiming()
+        with self.lock:
+            copy.records = {phase: list(record) for phase, record in self.records.items()}
+            copy.events = dict(self.events)
+        return copy
+
+    def get_records(self):
+        """
+        Returns
+        -------
+        dict[str, ndarray]
+            per-point durations of each phase, all arrays padded to the same number of points
+        """
+        with self.lock:
+            num_points = max([len(record) for record in self.records.values()], default=0)
+            return {phase: np.asarray(record + [0.]*(num_points - len(record))) for phase, record in self.records.items()}
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict[str, dict[str, float]]
+            total, mean and percentiles of the per-point durations of each phase
+        """
+        summary = {}
+        for phase, record in self.get_records().items():
+            summary[phase] = {'total': np.sum(record), 'mean': np.mean(record)}
+            summary[phase].update({'p{}'.format(q): p for q, p in zip(self.percentiles,
+                                                                       np.percentile(record, self.percentiles))})
+        return summary
+
+    def summary_metadata(self):
+        """
+        Summary formatted as string-valued metadata, one key per phase.
+        """
+        metadata = {}
+        for phase, stats in self.summary().items():
+            metadata['timing {}'.format(phase)] = ' '.join('{}={:.3g}'.format(k, v) for k, v in stats.items())
+        for phase, duration in self.events.items():
+            metadata['timing {}'.format(phase)] = 'total={:.3g}'.format(duration)
+        return metadata
+
+    def __str__(self):
+        return '\n'.join('{}: {}'.format(k, v) for k, v in self.summary_metadata().items())
+
+    def __repr__(self):
+        return str(self)
+
+
 class MeasurementState:
     datasets: Mapping[str, MeasurementDataset]
 
@@ -120,6 +211,7 @@ class MeasurementState:
         self.total_sweeps = 0
         self.request_stop_acq = False
         self.sweep_error = None
+        self.timing = SweepTiming()
         for key, value in kwargs.items():
             setattr(self, key, value)
 
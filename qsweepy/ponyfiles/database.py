@@ -11,8 +11,13 @@ class MyDatabase:
 
     """
     def __init__(self, provider='postgres', user='qsweepy', password='qsweepy',
-                 host='localhost', database='qsweepy', port=5432):
+                 host='localhost', database='qsweepy', port=5432, filename=':memory:'):
         db = Database()
+        # incremented on every write through this class, used by Exdir_db to invalidate its query cache
+        self.modification_count = 0
+        # maximum number of bound parameters per multi-row INSERT statement, see bulk_statements. 999 is the
+        # lowest limit of the supported providers (SQLite before 3.32; PostgreSQL allows 65535)
+        self.bulk_parameters = 999
 
         class Data(db.Entity):
             id = PrimaryKey(int, auto=True)
@@ -29,17 +34,18 @@ class MyDatabase:
             owner = Optional(str)
 
             # one-to-many references to the other tables (entities)
-            metadata = Set('Metadata')
+            # volatile: metadata rows are written with bulk SQL statements (see insert_bulk and upsert_metadata)
+            metadata = Set('Metadata', volatile=True)
             reference_one = Set('Reference', reverse='this')
             reference_two = Set('Reference', reverse='that')
-            linear_sweep = Set('Linear_sweep')  # 1d sweep parameter uniform grid description
+            linear_sweep = Set('Linear_sweep', volatile=True)  # 1d sweep parameter uniform grid description
         self.Data = Data
 
         class Metadata(db.Entity):
             # id = PrimaryKey(int, auto=True)
             data_id = Required(self.Data)
             name = Required(str)
-            value = Required(str)
+            value = Required(str, volatile=True)
             # data = Required(Data)
             PrimaryKey(data_id, name)
         self.Metadata = Metadata
@@ -75,7 +81,11 @@ class MyDatabase:
             query_date = Required(datetime)
         self.Queries = Queries
 
-        db.bind(provider, user=user, password=password, host=host, database=database, port=port)
+        if provider == 'sqlite':
+            # local database, e.g. for tests: filename is a path or ':memory:'
+            db.bind(provider, filename=filename, create_db=True)
+        else:
+            db.bind(provider, user=user, password=password, host=host, database=database, port=port)
         db.generate_mapping(create_tables=True)
         self.db = db
 
@@ -101,24 +111,26 @@ class MyDatabase:
                       type_revision=state.type_revision,
                       owner=state.owner,
                       incomplete=True)
+        flush()
 
+        # sweep parameters are shared between datasets, reduce each of them only once
+        parameter_rows = {}
+        linear_sweep_rows = []
         for dataset in state.datasets.keys():
             for parameter in state.datasets[dataset].parameters:
-                minv = np.min(parameter.values)
-                maxv = np.max(parameter.values)
-                number = len(parameter.values)
-                name = parameter.name
-                unit = parameter.unit
-                self.Linear_sweep(data_id=d,
-                                  min_value=minv,
-                                  max_value=maxv,
-                                  num_points=number,
-                                  parameter_name=name,
-                                  parameter_units=unit)
-
-        for name, value in state.metadata.items():
-            # print(name, value)
-            self.Metadata(data_id=d, name=name, value=value)
+                if id(parameter) not in parameter_rows:
+                    values = np.asarray(parameter.values)
+                    numeric = values.size and values.dtype.kind in 'biuf'
+                    parameter_rows[id(parameter)] = (float(np.min(values)) if numeric else None,
+                                                     float(np.max(values)) if numeric else None,
+                                                     len(values),
+                                                     parameter.name,
+                                                     parameter.unit)
+                linear_sweep_rows.append((d.id,)+parameter_rows[id(parameter)])
+        self.insert_bulk(self.Linear_sweep, ('data_id', 'min_value', 'max_value', 'num_points', 'parameter_name',
+                                             'parameter_units'), linear_sweep_rows)
+        self.insert_bulk(self.Metadata, ('data_id', 'name', 'value'),
+                         [(d.id, name, str(value)) for name, value in state.metadata.items()])
         # print('Inserting references:', state.references)
         for ref_description, ref_that in state.references.items():
             if type(ref_description) is tuple:
@@ -127,6 +139,7 @@ class MyDatabase:
                 self.Reference(this=d, that=ref_that, ref_type=ref_description, ref_comment='-')
 
         commit()
+        self.modification_count += 1
         state.id = d.id
         return d.id
 
@@ -144,15 +157,60 @@ class MyDatabase:
         d.filename = state.filename
         d.invalid = state.invalid
 
-        for k, v in state.metadata.items():
-            if k not in d.metadata.name:
-                self.Metadata(data_id=d, name=k, value=str(v))
-            else:
-                self.Metadata[d, k].value = str(v)
+        self.upsert_metadata(d.id, state.metadata)
         # d.metadata.update(state.metadata)
         commit()
+        self.modification_count += 1
         return d.id
 
+    def bulk_statements(self, entity, attributes, rows):
+        """
+        Splits rows into multi-row INSERT statements for the table of an entity, so that each statement is a single
+        round trip to the database and has at most bulk_parameters bound parameters.
+
+        Returns
+        -------
+        list[tuple[str, list]]
+            (sql, flattened parameters) for each statement
+        """
+        provider = self.db.provider
+        placeholder = '?' if provider.paramstyle == 'qmark' else '%s'
+        columns = ', '.join(provider.quote_name(getattr(entity, attribute).column) for attribute in attributes)
+        row_placeholders = '(' + ', '.join([placeholder]*len(attributes)) + ')'
+        rows_per_statement = max(self.bulk_parameters // len(attributes), 1)
+        statements = []
+        for chunk_start in range(0, len(rows), rows_per_statement):
+            chunk = rows[chunk_start:chunk_start+rows_per_statement]
+            sql = 'INSERT INTO {} ({}) VALUES {}'.format(provider.quote_name(entity._table_), columns,
+                                                          ', '.join([row_placeholders]*len(chunk)))
+            statements.append((sql, [value for row in chunk for value in row]))
+        return statements
+
+    def insert_bulk(self, entity, attributes, rows):
+        """
+        Inserts rows into the table of an entity with multi-row INSERT statements, in the current transaction.
+        The rows bypass the PonyORM identity map, so entities of the same table loaded in the current
+        db_session are not updated.
+        """
+        cursor = self.db.get_connection().cursor()
+        for sql, parameters in self.bulk_statements(entity, attributes, rows):
+            cursor.execute(sql, parameters)
+
+    def upsert_metadata(self, data_id, metadata):
+        """
+        Inserts or updates all metadata of a measurement at once (INSERT ... ON CONFLICT DO UPDATE).
+        """
+        provider = self.db.provider
+        data_id_column = provider.quote_name(self.Metadata.data_id.column)
+        name_column = provider.quote_name(self.Metadata.name.column)
+        value_column = provider.quote_name(self.Metadata.value.column)
+        cursor = self.db.get_connection().cursor()
+        for sql, parameters in self.bulk_statements(self.Metadata, ('data_id', 'name', 'value'),
+                                                    [(data_id, str(k), str(v)) for k, v in metadata.items()]):
+            sql += ' ON CONFLICT ({}, {}) DO UPDATE SET {} = excluded.{}'.format(data_id_column, name_column,
+                                                                                 value_column, value_column)
+            cursor.execute(sql, parameters)
+
     def get_from_database(self, filename=''):
         # print(select(i for i in self.Data))
         id = get(i.id for i in self.Data if (i.filename == filename))
@@ -176,6 +234,7 @@ class MyDatabase:
                 delete(i for i in self.Reference if i.that.id == idx)
                 delete(i for i in self.Linear_sweep if i.data_id.id == idx)
             commit()
+            self.modification_count += 1
         except Exception as e:
             print('Failed to delete %s. Reason: %s' % (indexes, e))
             raise e
\ No newline at end of file
@@ -4,7 +4,9 @@ from .data_structures import MeasurementState
 
 from pony.orm import desc, count
 import datetime
+import time
 from typing import List, Mapping
+import numpy as np
 
 
 class Exdir_db:
@@ -12,29 +14,51 @@ class Exdir_db:
     Exdir class
 
     """
-    def __init__(self, db, sample_name=None, old_prefix='', new_prefix=''):
+    def __init__(self, db, sample_name=None, old_prefix='', new_prefix='', use_cache=True, cache_ttl=None):
         self.db = db
         if not sample_name:
             sample_name = 'anonymous-sample'
         self.sample_name = sample_name
         self.old_prefix = old_prefix
         self.new_prefix = new_prefix
+        # select_measurement results keyed by query, see select_measurement
+        self.use_cache = use_cache
+        # maximum age of a cache entry in seconds, None for no limit
+        self.cache_ttl = cache_ttl
+        self.cache = {}
+        self.cache_modification_count = None
+        self.cache_hits = 0
+        self.cache_misses = 0
 
-    def save_measurement(self, data: MeasurementState):
+    def clear_cache(self):
+        self.cache = {}
+        self.cache_modification_count = getattr(self.db, 'modification_count', None)
+
+    def cache_hit_rate(self):
+        """
+        Fraction of select_measurement calls that have been served from the cache.
+        """
+        calls = self.cache_hits + self.cache_misses
+        return self.cache_hits / calls if calls else 0.
+
+    def save_measurement(self, data: MeasurementState, compression: bool = False):
         """
             Saves measurement state to the exdir_db system.
 
             Parameters
             ----------
             data: MeasurementState
+            compression: bool
+                store large arrays compressed (see save_exdir.write_compressed)
 
             Returns
             -------
             None
 
         """
+        self.clear_cache()
         self.db.create_in_database(data)
-        save_exdir.save_exdir(data)
+        save_exdir.save_exdir(data, compression=compression)
         self.db.update_in_database(data)
 
     def save(self, **values):
@@ -61,6 +85,7 @@ class Exdir_db:
         return data
 
     def invalidate(self, data_id: int, reason: str = 'anonymous', chain: bool = True):
+        self.clear_cache()
         invalidation_time=str(datetime.datetime.now())
         invalidation_chain = {(None, self.db.Data[data_id])}
         invalidation_chain_processed = set()
@@ -114,7 +139,29 @@ class Exdir_db:
         MeasurementState :
             measurement state that contains all datasets and corresponding parameter values
         that corresponds to the parameters provided.
+
+        Results are cached until the database is modified through this instance or its MyDatabase
+        (save_measurement, invalidate, delete_measurements, create/update/delete_in_database). Writes made by
+        other processes or connections are not detected: set cache_ttl to reload entries older than cache_ttl
+        seconds, call clear_cache(), or disable the cache with use_cache=False if the database is shared.
+        Cache hits return a copy of the cached state, including its dataset arrays (see copy_state).
         """
+        key = (measurement_type,
+               frozenset((k, str(v)) for k, v in (metadata or {}).items()),
+               frozenset((references_this or {}).items()),
+               frozenset((references_that or {}).items()),
+               ignore_invalidation)
+        if self.use_cache:
+            if self.cache_modification_count != getattr(self.db, 'modification_count', None):
+                self.clear_cache()
+            if key in self.cache:
+                state, cache_time = self.cache[key]
+                if self.cache_ttl is None or time.time() - cache_time < self.cache_ttl:
+                    self.cache_hits += 1
+                    return self.copy_state(state)
+                del self.cache[key]
+            self.cache_misses += 1
+
         measurement_db_list = self.select_measurements_db(measurement_type, metadata=metadata,
                                                           references_this=references_this,
                                                           references_that=references_that,
@@ -123,7 +170,28 @@ class Exdir_db:
         filename_db = list(measurement_db_list.order_by(lambda d: desc(d.id)).limit(1))[0].filename
         filename_converted = self.replace_file_prefixes(filename_db)
 
-        return save_exdir.load_exdir(filename_converted, db=self.db, filename_db = filename_db)
+        state = save_exdir.load_exdir(filename_converted, db=self.db, filename_db = filename_db)
+        if self.use_cache:
+            self.cache[key] = (state, time.time())
+            return self.copy_state(state)
+        return state
+
+    @staticmethod
+    def copy_state(state: MeasurementState):
+        """
+        Copy of a cached measurement state, so that callers changing its attributes, metadata, references,
+        datasets or timing don't change the cache. Sweep parameters are shared.
+        Every dataset array is copied, so a cache hit costs a memory copy of the whole measurement; this is
+        still much cheaper than reading it with load_exdir, but large measurements that are only read can be
+        selected with use_cache=False to avoid holding them twice.
+        """
+        copy = data_structures.MeasurementState(state)
+        copy.metadata = dict(state.metadata)
+        copy.references = dict(state.references)
+        copy.datasets = {name: data_structures.MeasurementDataset(dataset.parameters, np.copy(dataset.data))
+                         for name, dataset in state.datasets.items()}
+        copy.timing = state.timing.copy()
+        return copy
 
     def select_measurement_by_id(self, id: int):
         filename_db = self.db.Data[id].filename
@@ -183,6 +251,7 @@ class Exdir_db:
         """
         Delete measurements by list of indexes from database and from disk
         """
+        self.clear_cache()
         save_exdir.delete_exdir(self.db, indexes)
         MyDatabase.delete_from_database(self.db, indexes)
         for idx in indexes:
@@ -9,6 +9,9 @@ from pony.orm import get, select
 from qsweepy.libraries.config import get_config
 from collections import OrderedDict
 import os, shutil
+import threading
+import time
+import zipfile
 
 from .database import MyDatabase
 from .data_structures import MeasurementState
@@ -38,10 +41,101 @@ def default_measurement_save_path(state: MeasurementState):
     return fullpath
 
 
-def save_exdir(state: MeasurementState, keep_open: bool = False):
+compression_min_size = 4096
+compression_chunk_bytes = 2**22
+compression_level = 1
+
+
+def write_compressed(parent, name: str, data, chunk_bytes: int = None):
+    """
+    Stores an array as a raw exdir object with a deflate-compressed npz file, split into chunks
+    along the first axis. Shape, dtype and chunking are kept in the attributes of the raw object.
+    """
+    if chunk_bytes is None:
+        chunk_bytes = compression_chunk_bytes
+    data = np.asarray(data)
+    raw = parent.create_raw(name)
+    if data.ndim:
+        chunk_rows = max(chunk_bytes // max(data[:1].nbytes, 1), 1)
+        chunks = {'chunk_{:06d}'.format(chunk_id): data[start:start+chunk_rows]
+                  for chunk_id, start in enumerate(range(0, data.shape[0], chunk_rows))}
+    else:
+        chunk_rows = 0
+        chunks = {'chunk_000000': data}
+    # same layout as np.savez_compressed, but with a fast deflate level
+    with zipfile.ZipFile(os.path.join(raw.directory, 'data.npz'), 'w', zipfile.ZIP_DEFLATED,
+                         compresslevel=compression_level) as npz:
+        for chunk_name, chunk in chunks.items():
+            with npz.open(chunk_name + '.npy', 'w', force_zip64=True) as chunk_file:
+                np.lib.format.write_array(chunk_file, np.ascontiguousarray(chunk), allow_pickle=False)
+    raw.attrs = {'compression': 'deflate', 'shape': list(data.shape), 'dtype': data.dtype.str, 'chunk_rows': chunk_rows}
+    return raw
+
+
+def read_compressed(raw):
+    """
+    Loads an array stored by write_compressed.
+    """
+    shape = tuple(raw.attrs['shape'])
+    data = np.empty(shape, dtype=np.dtype(raw.attrs['dtype']))
+    with np.load(os.path.join(raw.directory, 'data.npz')) as chunks:
+        if not shape:
+            data[...] = chunks['chunk_000000']
+        else:
+            start = 0
+            for chunk_name in sorted(chunks.files):
+                chunk = chunks[chunk_name]
+                data[start:start+chunk.shape[0]] = chunk
+                start += chunk.shape[0]
+    return data
+
+
+def read_exdir_data(exdir_object):
+    """
+    Array stored in an exdir object. Plain exdir datasets are returned memory-mapped, compressed ones
+    (see write_compressed) are decompressed into memory.
+    """
+    if isinstance(exdir_object, exdir.Raw):
+        return read_compressed(exdir_object)
+    return exdir_object.data
+
+
+def write_exdir_data(parent, name: str, data, compression: bool = False):
+    """
+    Stores an array as an exdir dataset, or compressed if compression is enabled and the array
+    has at least compression_min_size elements.
+    """
+    data = np.asarray(data)
+    if compression and data.size >= compression_min_size:
+        return write_compressed(parent, name, data)
+    return parent.create_dataset(name, dtype=data.dtype, data=data)
+
+
+def compress_exdir(state: MeasurementState):
+    """
+    Replaces the uncompressed data of the datasets in the open exdir file of the state with compressed copies.
+    Used at the end of sweeps, since compressed data can't be updated in place.
+    """
+    for dataset_name, dataset in state.datasets.items():
+        data = np.asarray(dataset.data)
+        if data.size < compression_min_size:
+            continue
+        dataset_exdir = state.exdir[str(dataset_name)]
+        if hasattr(dataset, 'data_exdir'):
+            del dataset.data_exdir
+        del dataset_exdir['data']
+        write_compressed(dataset_exdir, 'data', data)
+
+
+def save_exdir(state: MeasurementState, keep_open: bool = False, buffered: bool = False, compression: bool = False):
     """
     The main function
 
+    If buffered is True (and keep_open is True), subsequent update_exdir calls go through an ExdirWriter,
+    which writes the updated data in contiguous blocks from a background thread.
+
+    If compression is True, large arrays are stored compressed (see write_compressed). Files kept open for
+    updates are written uncompressed and compressed in close_exdir.
     """
 
     # parameters = []
@@ -64,14 +158,18 @@ def save_exdir(state: MeasurementState, keep_open: bool = False):
                 parameter_name = state.datasets[dataset].parameters[index].name
                 parameter_unit = state.datasets[dataset].parameters[index].unit
                 has_setter = True if state.datasets[dataset].parameters[index].setter else False
-                d = parameters_exdir.create_dataset(str(index), dtype=np.asarray(parameter_values).dtype,
-                                                    shape=np.asarray(parameter_values).shape)
-                d.attrs = {'name': parameter_name, 'unit': parameter_unit, 'has_setter': has_setter}
-                d.data[:] = np.asarray(parameter_values)
-            data_exdir = dataset_exdir.create_dataset('data', dtype=state.datasets[dataset].data.dtype,
-                                                      data=state.datasets[dataset].data)
+                d = write_exdir_data(parameters_exdir, str(index), parameter_values, compression)
+                d.attrs.update({'name': parameter_name, 'unit': parameter_unit, 'has_setter': has_setter})
             if keep_open:
+                data_exdir = dataset_exdir.create_dataset('data', dtype=state.datasets[dataset].data.dtype,
+                                                          data=state.datasets[dataset].data)
                 state.datasets[dataset].data_exdir = data_exdir
+            else:
+                write_exdir_data(dataset_exdir, 'data', state.datasets[dataset].data, compression)
+        if keep_open and buffered:
+            state.exdir_writer = ExdirWriter(state)
+        if keep_open and compression:
+            state.exdir_compression = True
     except:
         raise
     finally:
@@ -79,15 +177,154 @@ def save_exdir(state: MeasurementState, keep_open: bool = False):
             f.close()
 
 
+class ExdirWriter:
+    """
+    Buffered writer backend for update_exdir.
+
+    Updates only mark points as dirty; a background thread copies the dirty block of each dataset
+    to the exdir file once flush_points points have been updated or flush_interval seconds have passed.
+    The block is the contiguous slab along the first sweep axis spanning all dirty points, so a row of
+    a 2-D sweep is written at once instead of point by point. Attributes are written once, on close().
+    """
+    def __init__(self, state: MeasurementState, flush_points: int = 1000, flush_interval: float = 1.0):
+        self.state = state
+        self.flush_points = flush_points
+        self.flush_interval = flush_interval
+        self.sweep_ndim = len(state.parameter_values)
+        self.lock = threading.Lock()
+        self.flush_requested = threading.Event()
+        self.closed = False
+        self.dirty_points = 0
+        self.dirty_range = None
+        # number of completed flushes that wrote data
+        self.flushes = 0
+        self.termination_cause = None
+        self.thread = threading.Thread(target=self.flush_thread_func, daemon=True)
+        self.thread.start()
+
+    def update(self, indeces):
+        """
+        Marks points as dirty.
+
+        Parameters
+        ----------
+        indeces
+            sweep indices of the updated points, concatenated (as passed to on_update callbacks),
+            or None if the whole dataset has been updated.
+        """
+        if self.termination_cause is not None:
+            raise self.termination_cause
+        if indeces is None or not self.sweep_ndim or not len(indeces):
+            points, dirty_range = 1, (0, None)
+        else:
+            first_axis = np.reshape(indeces, (-1, self.sweep_ndim))[:, 0]
+            points, dirty_range = len(first_axis), (int(np.min(first_axis)), int(np.max(first_axis)) + 1)
+        with self.lock:
+            if self.dirty_range is None:
+                self.dirty_range = dirty_range
+            elif dirty_range[1] is None or self.dirty_range[1] is None:
+                self.dirty_range = (0, None)
+            else:
+                self.dirty_range = (min(self.dirty_range[0], dirty_range[0]), max(self.dirty_range[1], dirty_range[1]))
+            self.dirty_points += points
+            if self.dirty_points >= self.flush_points:
+                self.flush_requested.set()
+
+    def flush(self):
+        with self.lock:
+            dirty_range = self.dirty_range
+            self.dirty_range = None
+            self.dirty_points = 0
+        if dirty_range is None:
+            return
+        # points updated while copying are marked dirty again and written on the next flush
+        block = slice(*dirty_range)
+        for dataset in self.state.datasets.values():
+            dataset.data_exdir[block] = dataset.data[block]
+        self.flushes += 1
+
+    def flush_thread_func(self):
+        while not self.closed:
+            self.flush_requested.wait(self.flush_interval)
+            self.flush_requested.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print('ExdirWriter: flush failed: ', e)
+                self.termination_cause = e
+                return
+
+    def close(self):
+        """
+        Stops the background thread, writes the remaining dirty points and the attributes.
+        """
+        self.closed = True
+        self.flush_requested.set()
+        self.thread.join()
+        self.flush()
+        self.state.exdir.attrs.update(self.state.metadata)
+
+
+def reopen_exdir(state: MeasurementState, buffered: bool = False, compression: bool = None):
+    """
+    Reattaches a state to the exdir file of an existing measurement, so that update_exdir
+    continues writing into it (used when resuming interrupted sweeps).
+
+    Datasets stored compressed (see write_compressed) can't be updated in place; they are replaced by plain
+    datasets and compressed again in close_exdir. buffered and compression have the same meaning as in
+    save_exdir; compression=None compresses again only if some dataset was stored compressed.
+    """
+    if hasattr(state, 'exdir'):
+        close_exdir(state)
+    f = exdir.File(state.filename, 'r+', allow_remove=True)
+    f.attrs.update(state.metadata)
+    state.exdir = f
+    stored_compressed = False
+    for dataset in state.datasets.keys():
+        dataset_exdir = f[str(dataset)]
+        data_exdir = dataset_exdir['data']
+        if isinstance(data_exdir, exdir.Raw):
+            stored_compressed = True
+            del dataset_exdir['data']
+            data_exdir = dataset_exdir.create_dataset('data', dtype=state.datasets[dataset].data.dtype,
+                                                      data=state.datasets[dataset].data)
+        else:
+            data_exdir[...] = state.datasets[dataset].data
+        state.datasets[dataset].data_exdir = data_exdir
+    if compression or (compression is None and stored_compressed):
+        state.exdir_compression = True
+    if buffered:
+        state.exdir_writer = ExdirWriter(state)
+
+
 def update_exdir(state:MeasurementState, indeces: Iterable[int]):
+    if hasattr(state, 'exdir_writer'):
+        state.exdir_writer.update(indeces)
+        return
 
+    state.exdir.attrs.update(state.metadata)
     for dataset in state.datasets.keys():
-        state.exdir.attrs.update(state.metadata)
         try:
             state.datasets[dataset].data_exdir[tuple(indeces)] = state.datasets[dataset].data[tuple(indeces)]
         except Exception as e:
             state.datasets[dataset].data_exdir[...] = state.datasets[dataset].data[...]
 
+def save_timing_exdir(state: MeasurementState):
+    """
+    Stores the per-point timing records of a sweep (see SweepTiming) in the 'timing' group of the open exdir file.
+    Each row of the 'records' dataset corresponds to one phase, listed in the 'phases' attribute.
+    """
+    records = state.timing.get_records()
+    if not records:
+        return
+    timing_exdir = state.exdir.require_group('timing')
+    timing_exdir.attrs = {'phases': list(records.keys())}
+    # resumed sweeps overwrite the records of the previous run
+    if 'records' in timing_exdir:
+        del timing_exdir['records']
+    timing_exdir.create_dataset('records', data=np.asarray(list(records.values())))
+
+
 def get_filename(db:MyDatabase, idx: int):
     """
     Get filename by given index
@@ -112,6 +349,12 @@ def delete_exdir(db:MyDatabase = None, indexes: list = []):
                 raise e
 
 def close_exdir(state:MeasurementState):
+    if hasattr(state, 'exdir_writer'):
+        state.exdir_writer.close()
+        del state.exdir_writer
+    if hasattr(state, 'exdir_compression'):
+        compress_exdir(state)
+        del state.exdir_compression
     if hasattr(state, 'exdir'):
         for dataset in state.datasets.keys():
             try:
@@ -149,7 +392,7 @@ class LazyMeasParFromExdir:
 
     @property
     def values(self):
-        return self.exdir_parameter.data
+        return read_exdir_data(self.exdir_parameter)
 
     def __str__(self):
         return '{name} lazy-loaded ({units}),:[{min}, {max}] ({num_points} points) {setter_str}'.format(#'{name} ({units}): [{min}, {max}] ({num_points} points) {setter_str}'.format(
@@ -210,6 +453,9 @@ def load_exdir(filename: str, db:MyDatabase = None, filename_db: str = None, laz
         # stdout.flush()
 
         for dataset_name in f.keys():
+            # groups without parameters (e.g. sweep timing records) are not datasets
+            if 'parameters' not in f[dataset_name]:
+                continue
             # dataset_start_time = time()
             parameters = [None for key in f[dataset_name]['parameters'].keys()]
             for parameter_id, parameter in f[dataset_name]['parameters'].items():
@@ -218,7 +464,7 @@ def load_exdir(filename: str, db:MyDatabase = None, filename_db: str = None, laz
                     parameter_name = parameter.attrs['name']
                     parameter_setter = parameter.attrs['has_setter']
                     parameter_unit = parameter.attrs['unit']
-                    parameter_values = parameter.data[:].copy()
+                    parameter_values = read_exdir_data(parameter)[:].copy()
                     parameters[int(parameter_id)] = MeasurementParameter(parameter_values, parameter_setter,
                                                                          parameter_name, parameter_unit)
                 else:
@@ -228,11 +474,11 @@ def load_exdir(filename: str, db:MyDatabase = None, filename_db: str = None, laz
             # stdout.flush()
             if not lazy:
                 try:
-                    data = f[dataset_name]['data'].data[:].copy()
+                    data = read_exdir_data(f[dataset_name]['data'])[:].copy()
                 except:
-                    data = f[dataset_name]['data'].data
+                    data = read_exdir_data(f[dataset_name]['data'])
             else:
-                data = f[dataset_name]['data'].data
+                data = read_exdir_data(f[dataset_name]['data'])
             state.datasets[dataset_name] = MeasurementDataset(parameters, data)
             # dataset_end_time = time()
         # print ('load_exdir: dataset_data_time: ', dataset_end_time - parameter_time)
@@ -246,6 +492,7 @@ def load_exdir(filename: str, db:MyDatabase = None, filename_db: str = None, laz
             state.start = db_record.start
             state.stop = db_record.stop
             state.measurement_type = db_record.measurement_type
+            state.measurement_time = float(db_record.measurement_time) if db_record.measurement_time else 0
             query = select(i for i in db.Reference if (i.this.id == state.id))
             references = {}
             for q in query:
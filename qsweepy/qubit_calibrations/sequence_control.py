@@ -44,15 +44,14 @@ def define_qubit_control_seq(device, ex_sequence, ex_channel, exitation_amplitud
 def set_preparation_sequence(device, ex_sequencers, prepare_seq, control_sequence = None):
     if control_sequence is None:
         for ex_seq in ex_sequencers:
-            ex_seq.awg.stop_seq(ex_seq.params['sequencer_id'])
             ex_seq.clear_pulse_sequence()
             for prep_seq in prepare_seq:
                 for seq_id, single_sequence in prep_seq[0].items():
                     if seq_id == ex_seq.params['sequencer_id']:
                         ex_seq.add_definition_fragment(single_sequence[0])
                         ex_seq.add_play_fragment(single_sequence[1])
-            device.modem.awg.set_sequence(ex_seq.params['sequencer_id'], ex_seq)
-            ex_seq.awg.start_seq(ex_seq.params['sequencer_id'])
+        # compiles all sequencers concurrently, then stops, uploads and starts them together
+        device.modem.awg.set_sequences(ex_sequencers)
     else:
         for ex_seq in ex_sequencers:
             if ex_seq.params['sequencer_id'] == control_sequence.params['sequencer_id']:
@@ -9,4 +9,5 @@ from .ex_seq import EXSequence
 from .pre_pulse_seq import PrepulseSetter
 from .pre_pulse_seq import Prepulse
 from .pre_pulse_seq import Offset
-from .pre_pulse_seq import SIMPLESequence
\ No newline at end of file
+from .pre_pulse_seq import SIMPLESequence
+from .register_parameters import ParameterisedSequence
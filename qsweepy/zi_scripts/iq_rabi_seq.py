@@ -1,9 +1,10 @@
 import numpy as np
 import textwrap
 import time
+from .register_parameters import ParameterisedSequence
 
 
-class IQ_RABISequence:
+class IQ_RABISequence(ParameterisedSequence):
     def __init__(self, sequencer_id, awg, tail_length, readout_delay=0, awg_amp=1, pre_pulses=[],
                  use_modulation=True, length__reg=0, resudual__reg =1):
         """
@@ -35,6 +36,8 @@ class IQ_RABISequence:
                            readout_delay=int(readout_delay*self.clock), length__reg=length__reg,
                            resudual__reg=resudual__reg, nco_id=sequencer_id*4,
                            ic=2 * sequencer_id, qc=sequencer_id* 2 + 1)
+        self.init_register_parameters()
+        self.declare_register_parameter('length', (length__reg, resudual__reg), self.encode_length)
 
         self.pre_pulses = pre_pulses
         self.set_awg_amp(self.params['awg_amp'])
@@ -182,14 +185,14 @@ while (true) {{
         self.awg.set_offset(self.params['qc'], offset_q)
         # self.awg.set_register(self.params['sequencer_id'], self.params['qo'], np.asarray(int(offset_q*0xffffffff), dtype=np.uint32))
 
+    def encode_length(self, length):
+        # length in seconds -> (pause in sequencer cycles, residual samples switch case)
+        pause_cycles = int(np.round(length * self.awg._clock))
+        return pause_cycles // 8, pause_cycles % 8
+
     def set_length(self, length):
         # length in seconds
-        # self.trig_delay = delay
-        # self.params['trig_delay'] = delay
-        # print('setting delay to ',  length)
-        pause_cycles = int(np.round(length * self.awg._clock))
-        self.awg.set_register(self.params['sequencer_id'], self.params['length__reg'], pause_cycles // 8)
-        self.awg.set_register(self.params['sequencer_id'], self.params['resudual__reg'], pause_cycles % 8)
+        self.set_parameter('length', length)
 
     def start(self):
         self.awg.start_seq(self.params['sequencer_id'])
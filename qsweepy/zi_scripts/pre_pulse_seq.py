@@ -1,6 +1,7 @@
 import numpy as np
 import textwrap
 import time
+from .register_parameters import ParameterisedSequence
 
 class Offset:
     def __init__(self, channel, offset, IQ_modulation = False):
@@ -158,7 +159,7 @@ class PrepulseSetter:
 
 
 
-class SIMPLESequence:
+class SIMPLESequence(ParameterisedSequence):
     def __init__(self, sequencer_id, awg, readout_delay=0, awg_amp=1, pre_pulses = [],
                  use_modulation=True, var_reg0=0, var_reg1 =1, var_reg2 =2, var_reg3 =3, control=False, is_iq = False):
         """
@@ -185,6 +186,9 @@ class SIMPLESequence:
                            nco_id=sequencer_id * 4, nco_control_id=sequencer_id * 4 + 1,
                            frequency=frequency, control_frequency=0,
                            ic=2 * sequencer_id, qc=sequencer_id * 2 + 1)
+        self.init_register_parameters()
+        self.declare_register_parameter('length', (var_reg0, var_reg1), self.encode_length)
+        self.declare_register_parameter('phase', var_reg2)
         self.pre_pulses = pre_pulses
         self.definition_pre_pulses = '''
 // Pre pulses definition'''
@@ -375,27 +379,19 @@ var variable_register3 = getUserReg(var_reg3);
         #assert (np.abs(offset) <= 0.5)
         self.awg.set_offset(channel, offset)
 
-    def set_length(self, length):
-        # length in seconds
-        #self.trig_delay = delay
-        #self.params['trig_delay'] = delay
-        #print('setting delay to ',  length)
+    def encode_length(self, length):
+        # length in seconds -> (pause in sequencer cycles, residual samples)
         pause_cycles = int(np.round(length*self.awg._clock))
-        if (pause_cycles//8)!=0:
-            if (pause_cycles % 8)!=0:
-                self.awg.set_register(self.params['sequencer_id'], self.params['var_reg0'], pause_cycles // 8)
-                self.awg.set_register(self.params['sequencer_id'], self.params['var_reg1'], pause_cycles % 8)
-            else:
-                self.awg.set_register(self.params['sequencer_id'], self.params['var_reg0'], pause_cycles // 8-1)
-                self.awg.set_register(self.params['sequencer_id'], self.params['var_reg1'], 8)
+        if (pause_cycles//8)!=0 and (pause_cycles % 8)==0:
+            return pause_cycles // 8-1, 8
+        return pause_cycles // 8, pause_cycles % 8
 
-        else:
-            self.awg.set_register(self.params['sequencer_id'], self.params['var_reg0'], pause_cycles//8)
-            self.awg.set_register(self.params['sequencer_id'], self.params['var_reg1'], pause_cycles % 8)
+    def set_length(self, length):
+        # length in seconds
+        self.set_parameter('length', length)
 
     def set_phase(self, phase):
-
-        self.awg.set_register(self.params['sequencer_id'], self.params['var_reg2'], phase)
+        self.set_parameter('phase', phase)
 
     def start(self):
         #self.awg.start_seq(self.params['sequencer_id'])
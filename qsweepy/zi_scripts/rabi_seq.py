@@ -1,9 +1,10 @@
 import numpy as np
 import textwrap
 import time
+from .register_parameters import ParameterisedSequence
 
 
-class RABISequence:
+class RABISequence(ParameterisedSequence):
     def __init__(self, sequencer_id, awg, tail_length, readout_delay=0, awg_amp=1, pre_pulses = [],
                  use_modulation=True, length_reg=0, residual_reg =1):
         """
@@ -39,6 +40,8 @@ class RABISequence:
                            nco_control_id=sequencer_id * 4 + 1,
                            frequency=frequency, control_frequency=0,
                            ic=2 * sequencer_id, qc=sequencer_id*2 + 1)
+        self.init_register_parameters()
+        self.declare_register_parameter('length', (length_reg, residual_reg), self.encode_length)
 
         self.pre_pulses = pre_pulses
         self.definition_pre_pulses = '''
@@ -213,15 +216,15 @@ while (true) {{
         #assert (np.abs(offset) <= 0.5)
         self.awg.set_offset(channel, offset)
 
+    def encode_length(self, length):
+        # length in seconds -> (pause in sequencer cycles, residual samples switch case)
+        pause_cycles = int(np.round(length*self.awg._clock))
+        return pause_cycles//8, 1+pause_cycles % 8
+
     def set_length(self, length):
         # length in seconds
-        #self.trig_delay = delay
-        #self.params['trig_delay'] = delay
-        #print('setting delay to ',  length)
         #self.awg.stop_seq(self.params['sequencer_id'])
-        pause_cycles = int(np.round(length*self.awg._clock))
-        self.awg.set_register(self.params['sequencer_id'], self.params['length_reg'], pause_cycles//8)
-        self.awg.set_register(self.params['sequencer_id'], self.params['resudual_reg'], 1+pause_cycles % 8)
+        self.set_parameter('length', length)
         #self.awg.start_seq(self.params['sequencer_id'])
 
     def start(self):
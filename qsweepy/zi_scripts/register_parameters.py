@@ -0,0 +1,63 @@
+import numpy as np
+import logging
+
+
+class ParameterisedSequence:
+    """
+    Mixin for zi_scripts sequences with numeric parameters that live in AWG user registers.
+
+    A sequence declares its register parameters with declare_register_parameter(); set_parameter() then turns an
+    update of such a parameter into user register writes, and the SeqC program stays the same. Any other
+    parameter is stored in self.params and the program is recompiled and uploaded (stop, compile, upload, start),
+    so the zicode() of sequences that use this fallback should be generated from self.params. The fallback is
+    slow, so a warning is logged the first time an undeclared parameter is set.
+
+    register_updates counts the register updates that changed a parameter value and compiles counts the updates
+    that needed a new program. The parameters declared by the sequences in zi_scripts (lengths and phases) were
+    already written to registers before this mixin, so register_updates is not a count of avoided compilations;
+    only parameters moved from self.params to registers save compilations.
+    """
+    def init_register_parameters(self):
+        self.register_parameters = {}
+        self.register_values = {}
+        self.recompiled_parameters = set()
+        self.register_updates = 0
+        self.compiles = 0
+
+    def declare_register_parameter(self, name, registers, encode=int):
+        """
+        Parameters
+        ----------
+        name : str
+            parameter name, as used in set_parameter()
+        registers : int or tuple[int]
+            user register indices of the parameter
+        encode : callable
+            converts a parameter value into an int, or a tuple of ints with one value per register
+        """
+        if np.isscalar(registers):
+            registers = (registers,)
+        self.register_parameters[name] = (tuple(int(register) for register in registers), encode)
+
+    def set_parameter(self, name, value):
+        if name in self.register_parameters:
+            registers, encode = self.register_parameters[name]
+            register_values = encode(value)
+            if np.isscalar(register_values):
+                register_values = (register_values,)
+            register_values = tuple(int(register_value) for register_value in register_values)
+            for register, register_value in zip(registers, register_values):
+                self.awg.set_register(self.params['sequencer_id'], register, register_value)
+            if self.register_values.get(name) != register_values:
+                self.register_updates += 1
+            self.register_values[name] = register_values
+        else:
+            if name not in self.recompiled_parameters:
+                self.recompiled_parameters.add(name)
+                logging.warning('{}: parameter {} is not declared as a register parameter, every update '
+                                'recompiles the sequence'.format(type(self).__name__, name))
+            self.params[name] = value
+            self.awg.stop_seq(self.params['sequencer_id'])
+            self.awg.set_sequence(self.params['sequencer_id'], self)
+            self.awg.start_seq(self.params['sequencer_id'])
+            self.compiles += 1
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from qsweepy.libraries import adaptive_sweep
+from qsweepy.instrument_drivers.dummy_measurer import DummyResonator
+
+
+def resonator_parameters(resonator):
+	return ((np.linspace(-1e-3, 1e-3, 33), resonator.set_current, 'Current'),
+			(np.linspace(6.88e9, 7.02e9, 65), resonator.set_frequency, 'Frequency'))
+
+
+def test_adaptive_sweep_is_sparse_and_finishes_with_on_update():
+	resonator = DummyResonator()
+	updates = []
+	state = adaptive_sweep.adaptive_sweep(resonator, *resonator_parameters(resonator), initial_step=8,
+										  on_update=[(lambda state, indices: updates.append(state.done_sweeps), ())],
+										  on_update_divider=1000, use_deferred=False)
+	measured = np.sum(np.isfinite(state.datasets['S21'].data))
+	assert 0 < measured < 33*65
+	assert state.done_sweeps == state.total_sweeps == measured
+	assert updates and updates[-1] == measured
+	assert state.metadata['measured_points'] == str(measured)
+
+
+def test_adaptive_sweep_refines_the_resonance():
+	resonator = DummyResonator()
+	state = adaptive_sweep.adaptive_sweep(resonator, *resonator_parameters(resonator), initial_step=8)
+	data = state.datasets['S21'].data
+	currents, frequencies = [parameter.values for parameter in state.datasets['S21'].parameters]
+	# every measured point next to the minimum of its column has been refined down to single-point resolution
+	for current_id, current in enumerate(currents):
+		frequency_id = np.argmin(np.abs(frequencies-resonator.get_resonator_frequency(current)))
+		if 0 < frequency_id < len(frequencies)-1 and np.isfinite(data[current_id, frequency_id]):
+			assert np.any(np.isfinite(data[current_id, frequency_id-1:frequency_id+2:2]))
+
+
+@pytest.mark.parametrize('option, value', [('use_deferred', True), ('pipelined', True), ('shuffle', True),
+										   ('resume_state', object())])
+def test_adaptive_sweep_rejects_unsupported_options(option, value):
+	resonator = DummyResonator()
+	with pytest.raises(ValueError):
+		adaptive_sweep.adaptive_sweep(resonator, *resonator_parameters(resonator), **{option: value})
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from pony.orm import db_session, select
+
+from qsweepy.ponyfiles.database import MyDatabase
+from qsweepy.ponyfiles.data_structures import MeasurementState, MeasurementDataset, MeasurementParameter
+
+
+@pytest.fixture
+def db(tmp_path):
+	return MyDatabase(provider='sqlite', filename=str(tmp_path / 'db.sqlite'))
+
+
+def make_state(tmp_path, metadata):
+	x = MeasurementParameter(np.linspace(-1, 1, 5), None, 'x', 'V')
+	y = MeasurementParameter(np.arange(3), None, 'y')
+	state = MeasurementState(measurement_type='test', sample_name='sample', filename=str(tmp_path / 'data'),
+							 total_sweeps=15, done_sweeps=10)
+	state.datasets['Voltage'] = MeasurementDataset([x, y], np.zeros((5, 3), dtype=complex))
+	state.datasets['Current'] = MeasurementDataset([x], np.zeros(5, dtype=complex))
+	state.metadata.update(metadata)
+	return state
+
+
+def metadata_rows(db, data_id):
+	return {m.name: m.value for m in select(m for m in db.Metadata if m.data_id.id == data_id)}
+
+
+def test_statements_stay_within_parameter_budget(db):
+	rows = [(1, str(i), str(i)) for i in range(1000)]
+	statements = db.bulk_statements(db.Metadata, ('data_id', 'name', 'value'), rows)
+	assert [len(parameters) for sql, parameters in statements] == [999, 999, 999, 3]
+	assert [value for sql, parameters in statements for value in parameters] == \
+		   [value for row in rows for value in row]
+
+	db.bulk_parameters = 10
+	statements = db.bulk_statements(db.Linear_sweep, ('data_id', 'min_value', 'max_value', 'num_points',
+													  'parameter_name', 'parameter_units'), [(1,)*6]*3)
+	assert [len(parameters) for sql, parameters in statements] == [6, 6, 6]
+
+
+def test_create_in_database(db, tmp_path):
+	metadata = {'parameter{}'.format(i): i for i in range(800)}
+	with db_session:
+		data_id = db.create_in_database(make_state(tmp_path, metadata))
+	with db_session:
+		assert db.Data[data_id].incomplete
+		assert metadata_rows(db, data_id) == {name: str(value) for name, value in metadata.items()}
+		sweeps = sorted((s.parameter_name, s.min_value, s.max_value, s.num_points, s.parameter_units)
+						for s in select(s for s in db.Linear_sweep if s.data_id.id == data_id))
+		# x is shared between the datasets and has a row for each of them
+		assert sweeps == [('x', -1., 1., 5, 'V'), ('x', -1., 1., 5, 'V'), ('y', 0., 2., 3, '')]
+	assert db.modification_count == 1
+
+
+def test_update_in_database_upserts_metadata(db, tmp_path):
+	state = make_state(tmp_path, {'parameter{}'.format(i): i for i in range(500)})
+	with db_session:
+		db.create_in_database(state)
+	state.metadata.update({'parameter{}'.format(i): -i for i in range(250, 750)})
+	state.done_sweeps = state.total_sweeps
+	with db_session:
+		db.update_in_database(state)
+	with db_session:
+		assert not db.Data[state.id].incomplete
+		assert metadata_rows(db, state.id) == {name: str(value) for name, value in state.metadata.items()}
+		assert len(metadata_rows(db, state.id)) == 750
+	assert db.modification_count == 2
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from pony.orm import db_session
+
+from qsweepy.ponyfiles.database import MyDatabase
+from qsweepy.ponyfiles.exdir_db import Exdir_db
+from qsweepy.ponyfiles.data_structures import MeasurementState, MeasurementDataset, MeasurementParameter
+
+
+def save_state(exdb, tmp_path, name, value):
+	parameter = MeasurementParameter(np.arange(3), None, 'x')
+	state = MeasurementState(measurement_type='test', sample_name=exdb.sample_name,
+							 filename=str(tmp_path / name), total_sweeps=3, done_sweeps=3)
+	state.datasets['Voltage'] = MeasurementDataset([parameter], np.full(3, value, dtype=complex))
+	state.timing.add(0, 'acquisition', 1.)
+	exdb.save_measurement(state)
+	return state
+
+
+def test_cache_is_cleared_by_writes_through_the_same_database(tmp_path):
+	exdb = Exdir_db(MyDatabase(provider='sqlite', filename=str(tmp_path / 'db.sqlite')), sample_name='sample')
+	with db_session:
+		first = save_state(exdb, tmp_path, 'first', 1)
+	with db_session:
+		assert exdb.select_measurement('test').id == first.id
+		assert exdb.select_measurement('test').id == first.id
+	assert exdb.cache_hits == 1
+	with db_session:
+		second = save_state(exdb, tmp_path, 'second', 2)
+	with db_session:
+		assert exdb.select_measurement('test').id == second.id
+	assert exdb.cache_misses == 2
+
+
+def test_cache_ttl_picks_up_writes_from_other_connections(tmp_path):
+	filename = str(tmp_path / 'db.sqlite')
+	exdb = Exdir_db(MyDatabase(provider='sqlite', filename=filename), sample_name='sample', cache_ttl=0)
+	other = Exdir_db(MyDatabase(provider='sqlite', filename=filename), sample_name='sample')
+	with db_session:
+		save_state(exdb, tmp_path, 'first', 1)
+		exdb.select_measurement('test')
+	with db_session:
+		second = save_state(other, tmp_path, 'second', 2)
+	with db_session:
+		assert exdb.select_measurement('test').id == second.id
+
+
+def test_cache_ttl(tmp_path):
+	exdb = Exdir_db(MyDatabase(provider='sqlite', filename=str(tmp_path / 'db.sqlite')), sample_name='sample',
+					cache_ttl=0)
+	with db_session:
+		save_state(exdb, tmp_path, 'first', 1)
+		exdb.select_measurement('test')
+		exdb.select_measurement('test')
+	assert exdb.cache_hits == 0 and exdb.cache_misses == 2
+
+
+def test_cached_states_are_independent(tmp_path):
+	exdb = Exdir_db(MyDatabase(provider='sqlite', filename=str(tmp_path / 'db.sqlite')), sample_name='sample')
+	with db_session:
+		save_state(exdb, tmp_path, 'first', 1)
+		state = exdb.select_measurement('test')
+		state.datasets['Voltage'].data[...] = 5
+		state.timing.add(0, 'acquisition', 1.)
+		cached = exdb.select_measurement('test')
+	np.testing.assert_array_equal(cached.datasets['Voltage'].data, np.ones(3))
+	assert state.timing is not cached.timing
@@ -0,0 +1,202 @@
+import numpy as np
+import pytest
+
+from qsweepy.libraries import data_reduce, thru_inst
+
+import baseline_data_reduce
+import baseline_thru_inst
+
+# the formulas the reducers had before they were moved to shared and fused evaluation
+
+
+def legacy_mean_reducer_freq(data, times, axis_mean, freq):
+	dm = np.exp(1j*2*np.pi*times*freq)
+	return np.mean(np.mean(data, axis=axis_mean)*dm, axis=0)
+
+
+def legacy_feature_reducer(data, axis_mean, bg, feature):
+	shape = [1]*data.ndim
+	shape[axis_mean] = len(feature)
+	index = tuple(slice(None) if i != axis_mean else slice(data.shape[axis_mean]) for i in range(data.ndim))
+	return np.sum((data-np.reshape(bg, shape)[index])*np.reshape(feature, shape)[index], axis=axis_mean)
+
+
+def legacy_downsample_reducer(data, times, axis, carrier, downsample):
+	shape = list(data.shape[:axis])+[len(times[::downsample]), downsample]+list(data.shape[axis+1:])
+	demodulate = lambda s: np.mean(np.reshape(np.exp(s*2*np.pi*1j*times*carrier)*data, shape), axis=axis+1)
+	return np.concatenate([demodulate(1), demodulate(-1)], axis=-1)
+
+
+class RandomSource:
+	def __init__(self, dtype, shots=64, nop=128, seed=0):
+		self.dtype = dtype
+		self.random = np.random.RandomState(seed)
+		self.times = np.arange(nop)/1e9
+		self.shots = shots
+		self.data = None
+
+	def get_points(self):
+		return {'Voltage': [('Sample', np.arange(self.shots), ''), ('Time', self.times, 's')]}
+	def get_dtype(self):
+		return {'Voltage': self.dtype}
+	def get_opts(self):
+		return {'Voltage': {}}
+	def measure(self):
+		data = self.random.randn(self.shots, len(self.times))
+		if self.dtype is complex:
+			data = data + 1j*self.random.randn(self.shots, len(self.times))
+		self.data = data
+		return {'Voltage': data}
+
+
+@pytest.mark.parametrize('dtype', [float, complex])
+def test_reducers_match_legacy_formulas(dtype):
+	source = RandomSource(dtype)
+	random = np.random.RandomState(1)
+	nop = len(source.times)
+	# features longer than the trace are truncated, as in the legacy feature_reducer
+	bg, feature1, feature2 = random.randn(nop+8), random.randn(nop+8), random.randn(nop+8)
+	reducer = data_reduce.data_reduce(source)
+	reducer.filters['mean'] = data_reduce.mean_reducer(source, 'Voltage', 0)
+	reducer.filters['std'] = data_reduce.std_reducer(source, 'Voltage', 0)
+	reducer.filters['std_noavg'] = data_reduce.std_reducer_noavg(source, 'Voltage', 0, 1)
+	reducer.filters['mean_noavg'] = data_reduce.mean_reducer_noavg(source, 'Voltage', 0)
+	reducer.filters['freq'] = data_reduce.mean_reducer_freq(source, 'Voltage', 0, 25e6)
+	reducer.filters['feature1'] = data_reduce.feature_reducer(source, 'Voltage', 1, bg, feature1)
+	reducer.filters['feature2'] = data_reduce.feature_reducer(source, 'Voltage', 1, bg, feature2)
+	reducer.filters['binary'] = data_reduce.feature_reducer_binary(source, 'Voltage', 1, bg[:nop], feature2[:nop])
+	reducer.filters['downsample'] = data_reduce.downsample_reducer(source, 'Voltage', 1, 25e6, 8)
+	legacy = thru_inst.data_reduce(source)
+	legacy.filters['mean'] = thru_inst.mean_reducer(source, 'Voltage', 0)
+	legacy.filters['mean_noavg'] = thru_inst.mean_reducer_noavg(source, 'Voltage', 0)
+	legacy.filters['freq'] = thru_inst.mean_reducer_freq(source, 'Voltage', 0, 25e6)
+	legacy.filters['feature1'] = thru_inst.feature_reducer(source, 'Voltage', 1, bg, feature1)
+
+	for point in range(3):
+		result = reducer.measure()
+		data = source.data
+		legacy_result = legacy.measure()
+		legacy_data = source.data
+		np.testing.assert_allclose(result['mean'], np.mean(data, axis=0), rtol=1e-12, atol=1e-12)
+		np.testing.assert_allclose(result['std'], np.std(data, axis=0), rtol=1e-12, atol=1e-12)
+		np.testing.assert_allclose(result['std_noavg'],
+								   np.std(data-np.reshape(np.mean(data, axis=1), (-1, 1)), axis=0), rtol=1e-12, atol=1e-12)
+		np.testing.assert_allclose(result['mean_noavg'], np.mean(data, axis=0)-np.mean(data), rtol=1e-12, atol=1e-12)
+		np.testing.assert_allclose(result['freq'], legacy_mean_reducer_freq(data, source.times, 0, 25e6),
+								   rtol=1e-12, atol=1e-12)
+		np.testing.assert_allclose(result['feature1'], legacy_feature_reducer(data, 1, bg, feature1),
+								   rtol=1e-10, atol=1e-10)
+		np.testing.assert_allclose(result['feature2'], legacy_feature_reducer(data, 1, bg, feature2),
+								   rtol=1e-10, atol=1e-10)
+		binary = (legacy_feature_reducer(data, 1, bg[:nop], feature2[:nop]) > 0)*2-1
+		# shots whose projection is at rounding level may flip sign
+		close = np.abs(legacy_feature_reducer(data, 1, bg[:nop], feature2[:nop])) < 1e-9
+		np.testing.assert_array_equal(result['binary'][~close], binary[~close])
+		np.testing.assert_allclose(result['downsample'], legacy_downsample_reducer(data, source.times, 1, 25e6, 8),
+								   rtol=1e-12, atol=1e-12)
+
+		np.testing.assert_allclose(legacy_result['mean'], np.mean(legacy_data, axis=0), rtol=1e-12, atol=1e-12)
+		np.testing.assert_allclose(legacy_result['mean_noavg'], np.mean(legacy_data, axis=0)-np.mean(legacy_data),
+								   rtol=1e-12, atol=1e-12)
+		np.testing.assert_allclose(legacy_result['freq'], legacy_mean_reducer_freq(legacy_data, source.times, 0, 25e6),
+								   rtol=1e-12, atol=1e-12)
+		np.testing.assert_allclose(legacy_result['feature1'], legacy_feature_reducer(legacy_data, 1, bg, feature1),
+								   rtol=1e-10, atol=1e-10)
+	assert legacy.get_dtype()['mean'] is dtype
+
+
+class RandomShapeSource:
+	def __init__(self, shape, dtype, random):
+		self.shape = shape
+		self.dtype = dtype
+		self.random = random
+		self.times = np.arange(shape[-1])/1e9
+
+	def get_points(self):
+		return {'Voltage': [('Axis{}'.format(axis), np.arange(size), '') for axis, size in enumerate(self.shape[:-1])]
+						   + [('Time', self.times, 's')]}
+	def get_dtype(self):
+		return {'Voltage': self.dtype}
+	def get_opts(self):
+		return {'Voltage': {}}
+	def measure(self):
+		data = self.random.randn(*self.shape)
+		if self.dtype is complex:
+			data = data + 1j*self.random.randn(*self.shape)
+		return {'Voltage': data}
+
+
+def assert_points_equal(points, baseline_points):
+	assert [(name, units) for name, values, units in points] == [(name, units) for name, values, units in baseline_points]
+	for (name, values, units), (_, baseline_values, _) in zip(points, baseline_points):
+		np.testing.assert_array_equal(values, baseline_values)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_reducers_match_baseline_on_random_shapes(seed):
+	random = np.random.RandomState(seed)
+	dtype = [float, complex][seed % 2]
+	downsample = random.choice([2, 4])
+	shape = tuple(random.randint(2, 10, size=random.randint(1, 3))) + (downsample*random.randint(3, 12),)
+	ndim = len(shape)
+	nop = shape[-1]
+	axis = random.randint(ndim)
+	axis_mean = random.randint(ndim - 1)
+	feature_axis = random.randint(ndim)
+	feature_length = shape[feature_axis]
+	bg = random.randn(feature_length + 5)
+	features = [random.randn(feature_length + 5) for feature in range(3)]
+	source = RandomShapeSource(shape, dtype, random)
+
+	filters = {
+		'mean': lambda module: module.mean_reducer(source, 'Voltage', axis),
+		'std': lambda module: module.std_reducer(source, 'Voltage', axis),
+		'std_noavg': lambda module: module.std_reducer_noavg(source, 'Voltage', axis, (axis + 1) % ndim),
+		'mean_noavg': lambda module: module.mean_reducer_noavg(source, 'Voltage', axis),
+		'freq': lambda module: module.mean_reducer_freq(source, 'Voltage', axis_mean, 25e6),
+		'downsample': lambda module: module.downsample_reducer(source, 'Voltage', ndim - 1, 25e6, downsample),
+		'binary': lambda module: module.feature_reducer_binary(source, 'Voltage', feature_axis,
+															   bg[:feature_length], features[0][:feature_length]),
+	}
+	# several features of the same axis are evaluated as one tensordot (fused_term)
+	for feature_id, feature in enumerate(features):
+		filters['feature{}'.format(feature_id)] = \
+			lambda module, feature=feature: module.feature_reducer(source, 'Voltage', feature_axis, bg, feature)
+	reducer = data_reduce.data_reduce(source)
+	baseline = baseline_data_reduce.data_reduce(source)
+	for name, make_filter in filters.items():
+		reducer.filters[name] = make_filter(data_reduce)
+		baseline.filters[name] = make_filter(baseline_data_reduce)
+
+	thru_filters = {
+		'mean': lambda module: module.mean_reducer(source, 'Voltage', axis),
+		'mean_noavg': lambda module: module.mean_reducer_noavg(source, 'Voltage', axis),
+		'freq': lambda module: module.mean_reducer_freq(source, 'Voltage', axis_mean, 25e6),
+		# the baseline thru_inst.feature_reducer doesn't truncate the feature to the trace
+		'feature': lambda module: module.feature_reducer(source, 'Voltage', feature_axis, bg[:feature_length],
+														 features[1][:feature_length]),
+	}
+	thru = thru_inst.data_reduce(source)
+	baseline_thru = baseline_thru_inst.data_reduce(source)
+	for name, make_filter in thru_filters.items():
+		thru.filters[name] = make_filter(thru_inst)
+		baseline_thru.filters[name] = make_filter(baseline_thru_inst)
+
+	data = source.measure()
+	source.measure = lambda: data
+	for new, old in [(reducer, baseline), (thru, baseline_thru)]:
+		result = new.measure()
+		baseline_result = old.measure()
+		assert result.keys() == baseline_result.keys()
+		for name in result.keys():
+			if name == 'binary':
+				projection = baseline_data_reduce.feature_reducer(source, 'Voltage', feature_axis, bg[:feature_length],
+																  features[0][:feature_length])['filter'](data)
+				close = np.abs(projection) < 1e-9
+				np.testing.assert_array_equal(result[name][~close], baseline_result[name][~close])
+			else:
+				np.testing.assert_allclose(result[name], baseline_result[name], rtol=1e-10, atol=1e-10)
+		assert new.get_dtype() == old.get_dtype()
+		assert new.get_opts() == old.get_opts()
+	for name in filters.keys():
+		assert_points_equal(reducer.get_points()[name], baseline.get_points()[name])
@@ -0,0 +1,142 @@
+import logging
+import os
+import time
+import numpy as np
+import pytest
+
+from qsweepy.libraries import data_reduce
+from qsweepy.libraries.reducer_pool import reducer_pool
+from qsweepy.libraries.streaming_histogram import streaming_histogram
+
+pytestmark = pytest.mark.skipif(not reducer_pool.available(), reason='process backend needs fork')
+
+
+class ShotSource:
+	'''
+	Returns a different block of shots on every measurement, so that reordered results are detected.
+	'''
+	def __init__(self, shots=16, nop=32, seed=0):
+		self.shots = shots
+		self.nop = nop
+		self.random = np.random.RandomState(seed)
+		self.measured = []
+
+	def get_points(self):
+		return {'Voltage': [('Sample', np.arange(self.shots), ''), ('Time', np.arange(self.nop)/1e9, 's')]}
+	def get_dtype(self):
+		return {'Voltage': float}
+	def get_opts(self):
+		return {'Voltage': {}}
+	def measure(self):
+		data = {'Voltage': self.random.randn(self.shots, self.nop), 'State': self.random.randint(0, 2, self.shots)}
+		self.measured.append(data)
+		return data
+
+
+def deferred_results(reducer, points):
+	results = []
+	for point_id in range(points):
+		reducer.measure_deferred_result(lambda result, point_id: results.append((point_id, result)), (point_id, ))
+	reducer.join_deferred()
+	return results
+
+
+def test_results_are_delivered_in_order():
+	source = ShotSource()
+	reducer = data_reduce.data_reduce(source, backend='process', workers=3, pool_depth=4)
+	reducer.filters['mean'] = data_reduce.mean_reducer(source, 'Voltage', 0)
+	results = deferred_results(reducer, 40)
+	assert [point_id for point_id, result in results] == list(range(40))
+	for (point_id, result), data in zip(results, source.measured):
+		np.testing.assert_allclose(result['mean'], np.mean(data['Voltage'], axis=0))
+
+
+def test_pool_is_stopped_by_join_deferred():
+	source = ShotSource()
+	reducer = data_reduce.data_reduce(source, backend='process', workers=2)
+	reducer.filters['mean'] = data_reduce.mean_reducer(source, 'Voltage', 0)
+	deferred_results(reducer, 3)
+	assert reducer.pool is None
+
+
+def test_stateful_filters_accumulate_in_parent():
+	source = ShotSource()
+	histogram = streaming_histogram([[-0.5, 0.5, 1.5]])
+	reducer = data_reduce.data_reduce(source, backend='process', workers=3, pool_depth=4)
+	reducer.filters['mean'] = data_reduce.mean_reducer(source, 'Voltage', 0)
+	reducer.filters['P1'] = data_reduce.hist_filter(source, ('State', 1), histogram=histogram)
+	results = deferred_results(reducer, 20)
+	states = np.concatenate([data['State'] for data in source.measured])
+	assert histogram.total == len(states)
+	# the running fraction is accumulated in acquisition order
+	for point_id, result in results:
+		shots = states[:(point_id+1)*source.shots]
+		assert result['P1'] == pytest.approx(np.mean(shots == 1))
+
+
+def test_worker_exception_is_raised_in_measurement_thread():
+	source = ShotSource()
+	reducer = data_reduce.data_reduce(source, backend='process', workers=2)
+	reducer.filters['broken'] = {'filter': lambda x: 1/0,
+								 'get_points': lambda: [], 'get_dtype': lambda: float, 'get_opts': lambda: {}}
+	with pytest.raises(ZeroDivisionError):
+		deferred_results(reducer, 5)
+
+
+def slow_first_points(data):
+	# earlier points take longer, so the workers finish them out of order
+	time.sleep(0.02*max(5-int(data['point']), 0))
+	return {'sum': float(np.sum(data['Voltage']))}
+
+
+@pytest.mark.parametrize('nop', [8, [8, 8, 64, 8, 64, 8, 8, 64, 8, 8]])
+def test_pool_delivers_in_submission_order(nop):
+	# points larger than the first one are pickled through the task queue instead of a slot
+	sizes = nop if isinstance(nop, list) else [nop]*10
+	pool = reducer_pool(slow_first_points, workers=3, depth=4)
+	random = np.random.RandomState(0)
+	points = [{'Voltage': random.randn(size), 'point': point} for point, size in enumerate(sizes)]
+	delivered = []
+	for point, data in enumerate(points):
+		pool.submit(data, lambda result, point: delivered.append((point, result['sum'])), (point, ))
+	pool.join()
+	assert [point for point, result in delivered] == list(range(len(points)))
+	for (point, result), data in zip(delivered, points):
+		assert result == pytest.approx(np.sum(data['Voltage']))
+
+
+def test_worker_exception_is_logged_and_raised(caplog):
+	pool = reducer_pool(lambda data: 1/0, workers=1, depth=1)
+	with caplog.at_level(logging.ERROR):
+		pool.submit({'Voltage': np.zeros(8)}, lambda result: None, ('point 0', ))
+		with pytest.raises(ZeroDivisionError):
+			pool.join()
+	assert 'point 0' in caplog.text and 'ZeroDivisionError' in caplog.text
+
+
+def test_dead_worker_is_detected_by_submit():
+	pool = reducer_pool(lambda data: os._exit(1), workers=1, depth=1, poll_interval=0.1)
+	pool.submit({'Voltage': np.zeros(8)}, lambda result: None, ())
+	with pytest.raises(RuntimeError, match='exited with code 1'):
+		pool.submit({'Voltage': np.zeros(8)}, lambda result: None, ())
+	assert pool.processes == []
+
+
+def test_dead_worker_does_not_hang_join():
+	pool = reducer_pool(lambda data: os._exit(1), workers=1, depth=1, poll_interval=0.1)
+	pool.submit({'Voltage': np.zeros(8)}, lambda result: None, ())
+	with pytest.raises(RuntimeError):
+		pool.join()
+
+
+def test_sweep_stops_pool_after_exception():
+	from qsweepy.libraries import sweep
+	source = ShotSource()
+	reducer = data_reduce.data_reduce(source, backend='process', workers=2)
+	reducer.filters['mean'] = data_reduce.mean_reducer(source, 'Voltage', 0)
+	def setter(value):
+		if value == 3:
+			raise KeyboardInterrupt
+	with pytest.raises(KeyboardInterrupt):
+		sweep.sweep(reducer, (np.arange(5), setter, 'x'), use_deferred=True)
+	assert reducer.pool is None
@@ -0,0 +1,44 @@
+import logging
+
+from qsweepy.zi_scripts.register_parameters import ParameterisedSequence
+
+
+class DummyAWG:
+	def __init__(self):
+		self.registers = {}
+		self.uploads = 0
+	def set_register(self, sequencer_id, register, value):
+		self.registers[register] = value
+	def stop_seq(self, sequencer_id):
+		pass
+	def set_sequence(self, sequencer_id, sequence):
+		self.uploads += 1
+	def start_seq(self, sequencer_id):
+		pass
+
+
+class DummySequence(ParameterisedSequence):
+	def __init__(self):
+		self.awg = DummyAWG()
+		self.params = {'sequencer_id': 0}
+		self.init_register_parameters()
+		self.declare_register_parameter('length', (0, 1), lambda length: (length//16, length%16))
+
+
+def test_only_changed_register_values_are_counted():
+	sequence = DummySequence()
+	for length in [40, 40, 41, 41, 40]:
+		sequence.set_parameter('length', length)
+	assert sequence.awg.registers == {0: 2, 1: 8}
+	assert sequence.register_updates == 3
+	assert sequence.compiles == 0 and sequence.awg.uploads == 0
+
+
+def test_undeclared_parameters_recompile_with_warning(caplog):
+	sequence = DummySequence()
+	with caplog.at_level(logging.WARNING):
+		sequence.set_parameter('amplitude', 0.5)
+		sequence.set_parameter('amplitude', 0.6)
+	assert sequence.params['amplitude'] == 0.6
+	assert sequence.compiles == 2 and sequence.awg.uploads == 2
+	assert len([record for record in caplog.records if 'amplitude' in record.getMessage()]) == 1
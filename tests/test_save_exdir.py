@@ -0,0 +1,78 @@
+import time
+
+import exdir
+import numpy as np
+
+from qsweepy.ponyfiles import save_exdir
+from qsweepy.ponyfiles.data_structures import MeasurementState, MeasurementDataset, MeasurementParameter
+
+
+def make_state(tmp_path, rows=10, columns=5):
+	x = MeasurementParameter(np.arange(rows), None, 'x')
+	y = MeasurementParameter(np.arange(columns), None, 'y')
+	state = MeasurementState(measurement_type='test', sample_name='sample', filename=str(tmp_path / 'measurement'))
+	state.datasets['Voltage'] = MeasurementDataset([x, y], np.full((rows, columns), np.nan, dtype=complex))
+	return state
+
+
+def store(state, row, column):
+	state.datasets['Voltage'].data[row, column] = row + 1j*column
+	return [row, column]
+
+
+def wait_for(condition, timeout=2.):
+	start = time.time()
+	while not condition() and time.time() - start < timeout:
+		time.sleep(1e-3)
+	return condition()
+
+
+def test_writer_flushes_after_flush_points(tmp_path):
+	state = make_state(tmp_path)
+	save_exdir.save_exdir(state, keep_open=True)
+	writer = save_exdir.ExdirWriter(state, flush_points=10, flush_interval=1000.)
+	data_exdir = state.datasets['Voltage'].data_exdir
+	try:
+		for column in range(5):
+			writer.update(store(state, 3, column))
+		for column in range(4):
+			writer.update(store(state, 4, column))
+		# 9 of 10 points: nothing has been written yet
+		time.sleep(0.05)
+		assert writer.flushes == 0
+		assert np.all(np.isnan(data_exdir[3:5]))
+		writer.update(store(state, 4, 4))
+		assert wait_for(lambda: writer.flushes == 1)
+		np.testing.assert_array_equal(data_exdir[3:5], state.datasets['Voltage'].data[3:5])
+		# only the slab of dirty rows has been copied
+		assert np.all(np.isnan(data_exdir[:3])) and np.all(np.isnan(data_exdir[5:]))
+	finally:
+		writer.close()
+
+
+def test_writer_flushes_after_flush_interval(tmp_path):
+	state = make_state(tmp_path)
+	save_exdir.save_exdir(state, keep_open=True)
+	writer = save_exdir.ExdirWriter(state, flush_points=1000, flush_interval=0.02)
+	try:
+		writer.update(store(state, 7, 2))
+		assert wait_for(lambda: writer.flushes == 1)
+		assert state.datasets['Voltage'].data_exdir[7, 2] == 7 + 2j
+	finally:
+		writer.close()
+
+
+def test_close_exdir_writes_remaining_points_and_attributes(tmp_path):
+	state = make_state(tmp_path)
+	save_exdir.save_exdir(state, keep_open=True, buffered=True)
+	writer = state.exdir_writer
+	for row in range(10):
+		for column in range(5):
+			save_exdir.update_exdir(state, store(state, row, column))
+	state.metadata['comment'] = 'done'
+	save_exdir.close_exdir(state)
+	assert not writer.thread.is_alive()
+	assert not hasattr(state, 'exdir_writer') and not hasattr(state, 'exdir')
+	with exdir.File(state.filename, 'r') as f:
+		np.testing.assert_array_equal(f['Voltage']['data'][...], state.datasets['Voltage'].data)
+		assert f.attrs['comment'] == 'done'
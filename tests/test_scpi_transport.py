@@ -0,0 +1,45 @@
+import numpy as np
+
+from qsweepy.instrument_drivers.instrument import SCPITransport
+from qsweepy.instrument_drivers.dummy_visa import DummyVisaResource
+
+
+def test_unbatched_writes_are_sent_as_is():
+	resource = DummyVisaResource(latency=0)
+	transport = SCPITransport(resource)
+	transport.write('SENS1:SEGM:BWID:CONT ON;POW:CONT ON')
+	assert resource.log == ['SENS1:SEGM:BWID:CONT ON;POW:CONT ON']
+
+
+def test_batch_keeps_messages_and_resets_header_path_between_them():
+	resource = DummyVisaResource(latency=0)
+	transport = SCPITransport(resource)
+	with transport.batch():
+		transport.write('SENS1:SEGM:BWID:CONT ON;:SENS1:SEGM:POW:CONT ON')
+		transport.write('SENS1:FREQ:STAR 1e9;STOP 2e9')
+		transport.write('*CLS')
+		transport.write(':DISP:WIND1:TITL:DATA "a;b"\n')
+		transport.write('INIT:IMM')
+		assert resource.transactions == 0
+	assert resource.log == ['SENS1:SEGM:BWID:CONT ON;:SENS1:SEGM:POW:CONT ON;:SENS1:FREQ:STAR 1e9;STOP 2e9;*CLS;'
+							':DISP:WIND1:TITL:DATA "a;b";:INIT:IMM']
+	assert resource.transactions == 1
+
+
+def test_query_in_batch_flushes_first():
+	resource = DummyVisaResource(latency=0)
+	transport = SCPITransport(resource)
+	with transport.batch():
+		transport.write('SENS1:SWE:POIN 11')
+		assert transport.query('SENS1:SWE:POIN?') == '11'
+		transport.write('SENS1:SWE:POIN 21')
+	assert resource.log == ['SENS1:SWE:POIN 11', 'SENS1:SWE:POIN?', 'SENS1:SWE:POIN 21']
+	assert transport.get_statistics()['calls'] == 3
+
+
+def test_trace_query_selects_the_format_in_the_same_message():
+	resource = DummyVisaResource(latency=0)
+	resource.respond = lambda header, argument: np.arange(4.)
+	transport = SCPITransport(resource)
+	np.testing.assert_array_equal(transport.query_trace('CALC:DATA? SDATA'), np.arange(4.))
+	assert resource.log == ['FORM REAL,64;:FORM:BORD SWAP;:CALC:DATA? SDATA']
@@ -0,0 +1,49 @@
+import ctypes
+
+import numpy as np
+import pytest
+
+from qsweepy.instrument_drivers.dummy_spectrum import DummySpectrumDMA
+from qsweepy.instrument_drivers.spectrum_accumulator import SpectrumAccumulator
+
+
+def measure(source, averages, blocks):
+	'''
+	The acquisition loop of Spectrum_M4i22xx.measure() with the card replaced by source
+	'''
+	accumulator = SpectrumAccumulator(source.segments, source.nop, blocks)
+	try:
+		for i in range(averages):
+			for j in range(blocks):
+				accumulator.add(j, source.acquire())
+	finally:
+		accumulator.close()
+	assert accumulator.accumulated == averages*blocks
+	return accumulator.get_data(averages)
+
+
+@pytest.mark.parametrize('averages, blocks', [(1, 1), (7, 1), (5, 3)])
+def test_average_over_acquisitions(averages, blocks):
+	source = DummySpectrumDMA(segments=4, nop=32, dma_time=1e-3, seed=0)
+	data = measure(source, averages, blocks)
+
+	records = np.asarray(source.records, dtype=float).reshape(averages, blocks, 4, 32, 2)
+	expected = np.mean(records, axis=0).reshape(blocks*4, 32, 2)
+	assert data.shape == (blocks*4, 32)
+	np.testing.assert_allclose(data.real, expected[:, :, 0])
+	np.testing.assert_allclose(data.imag, expected[:, :, 1])
+
+
+def test_full_scale_samples_do_not_overflow():
+	accumulator = SpectrumAccumulator(1, 4, queue_size=8)
+	for i in range(1000):
+		accumulator.add(0, (ctypes.c_int8*8)(*([-128, 127]*4)))
+	data = accumulator.get_data(1000)
+	np.testing.assert_array_equal(data, np.full((1, 4), -128 + 127j))
+
+
+def test_short_buffer_raises():
+	accumulator = SpectrumAccumulator(2, 4)
+	accumulator.add(0, (ctypes.c_int8*8)())
+	with pytest.raises(ValueError):
+		accumulator.close()
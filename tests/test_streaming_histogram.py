@@ -0,0 +1,61 @@
+import threading
+import numpy as np
+import pytest
+
+from qsweepy.libraries.streaming_histogram import streaming_histogram
+
+
+def test_batches_equal_histogramdd():
+	random = np.random.RandomState(0)
+	samples = random.randn(30000, 2)
+	labels = random.randint(0, 3, len(samples))
+	reference, edges = np.histogramdd(samples, bins=20)
+	histogram = streaming_histogram.from_samples(samples, 20, classes=[0, 1, 2], chunk_size=5000)
+	for batch in np.array_split(np.arange(len(samples)), 7):
+		histogram.update(samples[batch], labels[batch])
+	np.testing.assert_array_equal(histogram.counts, reference)
+	for class_id in range(3):
+		np.testing.assert_array_equal(histogram.class_counts[class_id],
+									  np.histogramdd(samples[labels == class_id], bins=edges)[0])
+	assert histogram.outside == 0
+
+
+def test_one_dimensional_and_outside():
+	random = np.random.RandomState(1)
+	samples = random.randn(10000)
+	histogram = streaming_histogram([np.linspace(-1, 1, 11)])
+	histogram.update(samples)
+	np.testing.assert_array_equal(histogram.counts, np.histogram(samples, bins=np.linspace(-1, 1, 11))[0])
+	assert histogram.outside == np.sum(np.abs(samples) > 1)
+
+
+def test_merge():
+	random = np.random.RandomState(2)
+	samples = random.randn(2000, 2)
+	edges = [np.linspace(-3, 3, 7)]*2
+	first, second, whole = streaming_histogram(edges), streaming_histogram(edges), streaming_histogram(edges)
+	first.update(samples[:500])
+	second.update(samples[500:])
+	whole.update(samples)
+	np.testing.assert_array_equal(first.merge(second).counts, whole.counts)
+	with pytest.raises(ValueError):
+		first.merge(streaming_histogram([np.linspace(-3, 3, 8)]*2))
+
+
+def test_unknown_labels_count_in_total_only():
+	samples = np.asarray([0.1, 0.2, 0.3, 0.4])
+	histogram = streaming_histogram([[0, 0.5]], classes=[0, 1])
+	histogram.update(samples, [0, 1, 1, 7])
+	assert histogram.total == 4
+	np.testing.assert_array_equal(histogram.class_counts[:, 0], [1, 2])
+
+
+def test_concurrent_updates():
+	samples = np.random.RandomState(3).rand(1000)
+	histogram = streaming_histogram([np.linspace(0, 1, 11)])
+	threads = [threading.Thread(target=lambda: [histogram.update(samples) for i in range(20)]) for j in range(4)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert histogram.total == 80*len(samples)
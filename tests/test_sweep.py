@@ -0,0 +1,163 @@
+import itertools
+import threading
+import time
+import numpy as np
+import pytest
+
+from qsweepy.libraries import sweep
+from qsweepy.instrument_drivers.dummy_measurer import DummyMeasurer
+
+
+def test_pipelined_equals_serial():
+	serial = sweep.sweep(DummyMeasurer(nop=16, seed=1), (np.arange(5), lambda x: None, 'x'),
+						 (np.arange(3), lambda y: None, 'y'))
+	pipelined = sweep.sweep(DummyMeasurer(nop=16, seed=1), (np.arange(5), lambda x: None, 'x'),
+							(np.arange(3), lambda y: None, 'y'), pipelined=True, pipeline_depth=2)
+	np.testing.assert_array_equal(serial.datasets['Voltage'].data, pipelined.datasets['Voltage'].data)
+	assert pipelined.done_sweeps == 15
+
+
+def test_pipelined_callbacks_run_on_calling_thread():
+	threads = set()
+	sweep.sweep(DummyMeasurer(nop=4, reduction_time=1e-3), (np.arange(10), lambda x: None, 'x'),
+				pipelined=True, on_update=[(lambda state, indeces: threads.add(threading.current_thread()), ())])
+	assert threads == {threading.current_thread()}
+
+
+def test_pipelined_loop_exception_is_not_hidden():
+	measurer = DummyMeasurer(nop=4)
+	def broken_reduce(data):
+		# fails only after the loop has been interrupted
+		time.sleep(0.05)
+		raise ZeroDivisionError
+	measurer.reduce = broken_reduce
+	def setter(x):
+		if x == 1:
+			raise KeyboardInterrupt
+	with pytest.raises(KeyboardInterrupt):
+		sweep.sweep(measurer, (np.arange(5), setter, 'x'), pipelined=True)
+
+
+def test_pipelined_overlaps_acquisition_and_reduction():
+	# comparison against the serial loop: with equal acquisition and reduction times the pipeline
+	# should take close to half of the serial time
+	parameters = (np.arange(20), lambda x: None, 'x')
+	start = time.time()
+	sweep.sweep(DummyMeasurer(nop=4, acquisition_time=0.01, reduction_time=0.01), parameters)
+	serial_time = time.time() - start
+	start = time.time()
+	sweep.sweep(DummyMeasurer(nop=4, acquisition_time=0.01, reduction_time=0.01), parameters, pipelined=True)
+	pipelined_time = time.time() - start
+	assert pipelined_time < 0.8*serial_time
+
+
+def test_deferred_threads_record_timing_per_point():
+	from qsweepy.libraries import data_reduce
+	measurer = DummyMeasurer(nop=4)
+	reducer = data_reduce.data_reduce(measurer, thread_limit=4)
+	def slow_thru(x):
+		time.sleep(np.random.rand()*2e-3)
+		return x['Voltage']
+	reducer.filters['Voltage'] = {'filter': slow_thru, 'get_points': lambda: measurer.get_points()['Voltage'],
+								  'get_dtype': lambda: complex, 'get_opts': lambda: {}}
+	state = sweep.sweep(reducer, (np.arange(50), lambda x: None, 'x'), use_deferred=True)
+	assert state.done_sweeps == 50
+	store = state.timing.get_records()['store']
+	assert len(store) == 50 and np.all(store > 0)
+
+
+def test_deferred_on_update_gets_every_point_once():
+	from qsweepy.libraries import data_reduce
+	measurer = DummyMeasurer(nop=4)
+	reducer = data_reduce.data_reduce(measurer, thread_limit=4)
+	def slow_thru(x):
+		time.sleep(np.random.rand()*2e-3)
+		return x['Voltage']
+	reducer.filters['Voltage'] = {'filter': slow_thru, 'get_points': lambda: measurer.get_points()['Voltage'],
+								  'get_dtype': lambda: complex, 'get_opts': lambda: {}}
+	updates = []
+	def slow_update(state, indices):
+		# points stored by other threads while this runs must go to the next update
+		updates.append(list(indices))
+		time.sleep(1e-3)
+	state = sweep.sweep(reducer, (np.arange(50), lambda x: None, 'x'), use_deferred=True,
+						on_update=[(slow_update, ())], on_update_divider=3)
+	assert state.done_sweeps == 50
+	assert sorted(index for update in updates for index in update) == list(range(50))
+
+
+@pytest.mark.parametrize('buffered', [False, True])
+def test_resume_compressed_exdir(tmp_path, buffered):
+	import exdir
+	from qsweepy.ponyfiles import save_exdir
+	states = []
+	def interrupting_setter(x):
+		if x == 2:
+			raise KeyboardInterrupt
+	on_start = [(lambda state: states.append(state), ()),
+				(lambda state: setattr(state, 'filename', str(tmp_path / 'measurement')), ()),
+				(save_exdir.save_exdir, (True, buffered, True))]
+	on_update = [(save_exdir.update_exdir, ())]
+	on_finish = [(save_exdir.save_timing_exdir, ()), (save_exdir.close_exdir, ())]
+	parameters = (np.arange(4), interrupting_setter, 'x')
+	with pytest.raises(KeyboardInterrupt):
+		sweep.sweep(DummyMeasurer(nop=4096, seed=1), parameters, on_start=on_start, on_update=on_update,
+					on_finish=on_finish, ignore_callback_errors=False)
+	interrupted = states[0]
+	save_exdir.save_timing_exdir(interrupted)
+	save_exdir.close_exdir(interrupted)
+	with exdir.File(interrupted.filename, 'r') as f:
+		assert isinstance(f['Voltage']['data'], exdir.Raw)
+
+	resume_state = save_exdir.load_exdir(interrupted.filename)
+	resume_state.filename = interrupted.filename
+	resumed = sweep.sweep(DummyMeasurer(nop=4096, seed=2), (np.arange(4), lambda x: None, 'x'),
+						  resume_state=resume_state, on_start=[(save_exdir.reopen_exdir, (buffered, None))],
+						  on_update=on_update, on_finish=on_finish, ignore_callback_errors=False)
+	loaded = save_exdir.load_exdir(interrupted.filename)
+	data = loaded.datasets['Voltage'].data
+	assert not np.any(np.isnan(data))
+	np.testing.assert_array_equal(data[:2], interrupted.datasets['Voltage'].data[:2])
+	np.testing.assert_array_equal(data, resumed.datasets['Voltage'].data)
+	with exdir.File(interrupted.filename, 'r') as f:
+		assert isinstance(f['Voltage']['data'], exdir.Raw)
+
+
+@pytest.mark.parametrize('order', [None, [1, 0, 2], [2, 1, 0]])
+@pytest.mark.parametrize('snake', [False, True])
+def test_traversal_visits_every_point_once(order, snake):
+	dimensions = (3, 4, 2)
+	visited = list(sweep.traversal_indices(dimensions, order, snake=snake))
+	assert sorted(visited) == sorted(itertools.product(*(range(d) for d in dimensions)))
+	if snake:
+		# a snake traversal changes a single index by one between consecutive points
+		steps = np.abs(np.diff(np.asarray(visited), axis=0))
+		assert np.all(np.sum(steps, axis=1) == 1)
+	changes = np.sum(np.diff(np.asarray(visited), axis=0) != 0, axis=0)
+	np.testing.assert_array_equal(changes, sweep.traversal_changes(dimensions, order or [0, 1, 2], snake))
+
+
+def test_optimal_traversal_puts_slow_setters_outside():
+	values = {}
+	setter_calls = []
+	def setter(name):
+		def set_value(value):
+			setter_calls.append(name)
+			values[name] = value
+		return set_value
+	fast = sweep.MeasurementParameter(np.arange(5), setter('fast'), 'fast', setter_cost=1e-3)
+	slow = sweep.MeasurementParameter(np.arange(3), setter('slow'), 'slow', setter_cost=1.)
+	assert sweep.plan_traversal([fast, slow]) == [1, 0]
+
+	class GridMeasurer:
+		def get_points(self):
+			return {'value': []}
+		def get_dtype(self):
+			return {'value': float}
+		def get_opts(self):
+			return {'value': {}}
+		def measure(self):
+			return {'value': np.asarray(10.*values['slow']+values['fast'])}
+	state = sweep.sweep(GridMeasurer(), fast, slow, traversal='optimal')
+	np.testing.assert_array_equal(state.datasets['value'].data, 10.*np.arange(3)[np.newaxis, :]+np.arange(5)[:, np.newaxis])
+	assert setter_calls.count('slow') == 3
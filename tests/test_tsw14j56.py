@@ -0,0 +1,129 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from qsweepy.instrument_drivers.dummy_tsw14j56 import DummyTSW14J56USB
+from qsweepy.instrument_drivers._ADS54J40.usb_intf import vend_req, vend_req_dir, mk_val_ind
+from qsweepy.instrument_drivers._ADS54J40.reg_intf import *
+
+
+@pytest.fixture
+def driver(monkeypatch):
+	# the FTDI and USB libraries are only used to open the real board
+	for module in ['ftd2xx', 'usb', 'usb.core']:
+		monkeypatch.setitem(sys.modules, module, types.ModuleType(module))
+	from qsweepy.instrument_drivers import TSW14J56driver
+	return TSW14J56driver
+
+
+def make_evm(driver, block_reads, **kwargs):
+	'''
+	TSW14J56_evm connected to a DummyTSW14J56USB, without the board initialization of __init__
+	'''
+	evm = object.__new__(driver.TSW14J56_evm)
+	evm.nsamp = 64
+	evm.nsegm = 1
+	evm.timeout = 3
+	evm.poll_interval_min = 1e-4
+	evm.poll_interval_max = 1e-2
+	evm.armed = False
+	evm.arm_time = None
+	evm.last_capture_time = None
+	evm.ram_size = 2048
+	evm.num_covariances = 4
+	evm.debug_print = False
+	evm.block_reads = block_reads
+	evm.capture_count = 0
+	evm.dev = DummyTSW14J56USB(**kwargs)
+	return evm
+
+
+def legacy_get_data_RAM(evm, ncov):
+	dty = np.dtype(np.int16).newbyteorder('>')
+	data_RAM = []
+	for i in range(evm.nsamp):
+		Value, Index = mk_val_ind((RAM_BASE + (i + ncov*evm.ram_size)*4) << 2)
+		data_RAM.append(np.frombuffer(evm.dev.ctrl_transfer(vend_req_dir.RD, vend_req.REG_READ, Value, Index, 4),
+									  dtype=dty))
+	return data_RAM
+
+
+@pytest.mark.parametrize('block_reads', [False, True])
+def test_read_reg_block_reads_consecutive_registers(driver, block_reads):
+	evm = make_evm(driver, block_reads)
+	for i in range(8):
+		evm.dev.put(CAP_BASE, COV_NUMB_BASE + i*4, 0x01020304*(i + 1))
+	data = evm.read_reg_block(CAP_BASE, COV_NUMB_BASE, 8)
+	assert data == np.asarray([0x01020304*(i + 1) for i in range(8)], dtype='>u4').tobytes()
+	assert evm.dev.transfers == (1 if block_reads else 8)
+
+
+@pytest.mark.parametrize('block_reads', [False, True])
+def test_int64_block_reads_match_register_reads(driver, block_reads):
+	evm = make_evm(driver, block_reads)
+	values = [5, -7, 2**40 + 3, -2**45 - 11]
+	for ncov, value in enumerate(values):
+		for base, subbase in [(COV_RES_BASE, COV_RES_SUBBASE), (COV_RESAVG_BASE, COV_RESAVG_SUBBASE)]:
+			evm.dev.put(CAP_BASE, base + ncov*4, value)
+			evm.dev.put(CAP_BASE, base + subbase + ncov*4, value >> 32)
+	for ncov in range(4):
+		evm.dev.put(CAP_BASE, COV_NUMB_BASE + ncov*4, 10 + ncov)
+
+	np.testing.assert_array_equal(evm.get_cov_results(), values)
+	np.testing.assert_array_equal(evm.get_cov_results_avg(), values)
+	assert [evm.get_cov_result(ncov) for ncov in range(4)] == values
+	assert [evm.get_cov_result_avg(ncov) for ncov in range(4)] == values
+	assert evm.get_resultnumbers() == [10, 11, 12, 13] + [0]*12
+
+
+@pytest.mark.parametrize('block_reads', [False, True])
+def test_get_data_RAM_reads_the_memory_of_the_discriminator(driver, block_reads):
+	evm = make_evm(driver, block_reads)
+	random = np.random.RandomState(0)
+	for ncov in range(2):
+		for i in range(evm.ram_size):
+			evm.dev.put(RAM_BASE, (i + ncov*evm.ram_size)*4, random.randint(2**32))
+	for ncov in range(2):
+		data = evm.get_data_RAM(ncov)
+		expected = legacy_get_data_RAM(evm, ncov)
+		assert type(data) is list and len(data) == evm.nsamp
+		np.testing.assert_array_equal(data, expected)
+
+
+def test_wait_capture(driver):
+	evm = make_evm(driver, True, capture_time=0.02)
+	with pytest.raises(RuntimeError):
+		evm.wait_capture()
+	evm.arm()
+	assert not evm.capture_done()
+	duration = evm.wait_capture()
+	assert duration >= 0.02
+	assert evm.capture_done() and not evm.armed
+	assert evm.capture_count == 1 and evm.dev.captures == 1
+
+
+def test_wait_capture_aborts_on_timeout(driver):
+	evm = make_evm(driver, True, capture_time=1.)
+	evm.arm()
+	with pytest.raises(TimeoutError):
+		evm.wait_capture(timeout=0.02)
+	assert not evm.armed
+	assert evm.dev.get(CAP_BASE, CAP_CTRL) == 0
+	assert evm.dev.captures == 0
+
+
+def test_reducer_arm_collect_returns_counter_differences(driver):
+	evm = make_evm(driver, True, capture_time=1e-3, seed=0)
+	evm.nsegm = 100
+	reducer = driver.TSW14J56_evm_reducer(evm)
+	reducer.output_raw = False
+	reducer.last_cov = False
+	reducer.trig = 'man'
+	for capture in range(3):
+		reducer.arm()
+		result = reducer.collect()
+		assert sum(result['resultnumbers']) == 100
+		assert len(result['resultnumbers']) == 16
+	assert evm.dev.captures == 3
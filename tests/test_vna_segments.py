@@ -0,0 +1,106 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from qsweepy.instrument_drivers.dummy_visa import DummyVNAResource
+from qsweepy.instrument_drivers.vna_segments import normalize_segments, segments_data, segments_points
+
+
+@pytest.fixture
+def vna(monkeypatch):
+	# 1 ms per transaction and 201-point sweeps of 4 ms, like a PNA-X on a LAN connection
+	resource = DummyVNAResource(latency=1e-3, point_time=2e-5, nop=201, seed=0)
+	visa = types.ModuleType('visa')
+	visa.ResourceManager = lambda: types.SimpleNamespace(open_resource=lambda address: resource)
+	monkeypatch.setitem(sys.modules, 'visa', visa)
+	monkeypatch.delitem(sys.modules, 'qsweepy.instrument_drivers.Agilent_N5242A', raising=False)
+	from qsweepy.instrument_drivers.Agilent_N5242A import Agilent_N5242A
+	return Agilent_N5242A('vna', 'dummy'), resource
+
+
+def traces(segments, nsweeps):
+	'''
+	Trace data DummyVNAResource(seed=0) returns for nsweeps sweeps of the given segments.
+	'''
+	random = np.random.RandomState(0)
+	npoints = sum(segment['nop'] for segment in segments)
+	data = [random.randn(2*npoints) for sweep in range(nsweeps)]
+	return [trace[0::2] + 1j*trace[1::2] for trace in data]
+
+
+def test_same_window_segments_are_measured_as_power_block(vna):
+	vna, resource = vna
+	powers = [-30., -20., -10.]
+	segments = [{'start': 6e9, 'stop': 7e9, 'nop': 201, 'power': power, 'bandwidth': 1e3} for power in powers]
+	vna.set_segments(segments)
+
+	assert resource.log[-1].startswith('SENS1:SEGM:BWID:CONT ON;:SENS1:SEGM:POW:CONT ON;:SENS1:SEGM:LIST SSTOP,3,')
+	assert resource.log[-1].endswith(';:SENS1:SWE:TYPE SEGM')
+	assert resource.segment_points == {0: 201, 1: 201, 2: 201}
+
+	(power, powers_axis, power_units), (frequency, frequencies, frequency_units) = vna.get_points()['S-parameter']
+	assert (power, power_units, frequency, frequency_units) == ('Power', 'dBm', 'Frequency', 'Hz')
+	np.testing.assert_array_equal(powers_axis, powers)
+	np.testing.assert_array_equal(frequencies, np.linspace(6e9, 7e9, 201))
+
+	nsweeps = 10
+	measured = [vna.measure()['S-parameter']]
+	# the first trace polls *ESR? until the sweep ends and gives the sweep duration estimate
+	resource.transactions = 0
+	measured += [vna.measure()['S-parameter'] for sweep in range(nsweeps - 1)]
+	assert resource.sweeps == nsweeps
+	# one write with *CLS, INIT and *OPC, one to three *ESR? polls and one binary trace query,
+	# instead of 7 transactions with separate writes
+	assert resource.transactions <= 5*(nsweeps - 1)
+	for block, trace in zip(measured, traces(segments, nsweeps)):
+		assert block.shape == (3, 201)
+		np.testing.assert_array_equal(block, trace.reshape(3, 201))
+		np.testing.assert_array_equal(block[1], trace[201:402])
+
+
+def test_different_windows_are_concatenated(vna):
+	vna, resource = vna
+	segments = [{'start': 6e9, 'stop': 6.1e9, 'nop': 21}, {'start': 7e9, 'stop': 7.2e9, 'nop': 41}]
+	vna.set_segments(segments)
+
+	assert resource.segment_points == {0: 21, 1: 41}
+	(frequency, frequencies, units), = vna.get_points()['S-parameter']
+	assert (frequency, units) == ('Frequency', 'Hz')
+	np.testing.assert_array_equal(frequencies, np.concatenate([np.linspace(6e9, 6.1e9, 21),
+															   np.linspace(7e9, 7.2e9, 41)]))
+
+	nsweeps = 10
+	measured = [vna.measure()['S-parameter']]
+	resource.transactions = 0
+	measured += [vna.measure()['S-parameter'] for sweep in range(nsweeps - 1)]
+	assert resource.transactions <= 5*(nsweeps - 1)
+	for data, trace in zip(measured, traces(segments, nsweeps)):
+		assert data.shape == (62,)
+		np.testing.assert_array_equal(data, trace)
+
+
+def test_clear_segments_returns_to_linear_sweep(vna):
+	vna, resource = vna
+	vna.set_segments([{'start': 6e9, 'stop': 7e9, 'nop': 11, 'power': power} for power in (-20, -10)])
+	vna.clear_segments()
+	assert resource.log[-1] == 'SENS1:SWE:TYPE LIN'
+	assert vna.get_segments() is None
+	assert vna.measure()['S-parameter'].shape == (201,)
+
+
+def test_segments_points_and_data():
+	segments = normalize_segments([{'start': 1e9, 'stop': 2e9, 'nop': 3, 'bandwidth': bandwidth}
+								   for bandwidth in (10., 100.)], power=-20)
+	assert [segment['power'] for segment in segments] == [-20, -20]
+	(name, values, units), (frequency, frequencies, _) = segments_points(segments)
+	assert (name, units, frequency) == ('Bandwidth', 'Hz', 'Frequency')
+	np.testing.assert_array_equal(values, [10., 100.])
+	np.testing.assert_array_equal(segments_data(segments, np.arange(6)), [[0, 1, 2], [3, 4, 5]])
+
+	# same window and same settings: the block axis is the segment index
+	segments = normalize_segments([{'start': 1e9, 'stop': 2e9, 'nop': 3}]*2, power=-20, bandwidth=10.)
+	(name, values, units), _ = segments_points(segments)
+	assert name == 'Segment'
+	np.testing.assert_array_equal(values, [0, 1])
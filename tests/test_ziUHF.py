@@ -0,0 +1,127 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from qsweepy.instrument_drivers import zi_readout
+from qsweepy.instrument_drivers.dummy_zi import DummyUHFDAQ
+
+
+@pytest.fixture
+def uhf(monkeypatch):
+	'''
+	ziUHF connected to a DummyUHFDAQ instead of a data server.
+	'''
+	daq = DummyUHFDAQ(shot_time=2e-6, start_latency=1e-3, num_channels=10, seed=0)
+	utils = types.ModuleType('zhinst.utils')
+	utils.create_api_session = lambda device_id, api_level, required_devtype=None: (daq, device_id, None)
+	utils.api_server_version_check = lambda daq: None
+	utils.disable_everything = lambda daq, device: None
+	zhinst = types.ModuleType('zhinst')
+	zhinst.utils = utils
+	monkeypatch.setitem(sys.modules, 'zhinst', zhinst)
+	monkeypatch.setitem(sys.modules, 'zhinst.utils', utils)
+	for module in ['qsweepy.instrument_drivers.zihdawg2', 'qsweepy.instrument_drivers.ziUHF']:
+		monkeypatch.delitem(sys.modules, module, raising=False)
+	from qsweepy.instrument_drivers.ziUHF import ziUHF
+	device = ziUHF(num_covariances=2)
+	daq.transactions = 0
+	return device, daq
+
+
+def legacy_count_states(int_res, thresholds, nres, num_covariances):
+	ro_res = np.asarray([(np.real(int_res[channel]) + np.imag(int_res[channel])) > thresholds[channel]
+						 for channel in range(num_covariances)]).T
+	disc = np.asarray([sum(v << i for i, v in enumerate(ro_res[sample])) for sample in range(nres)])
+	return np.asarray([list(disc).count(state) for state in range(int(2**num_covariances))])
+
+
+@pytest.mark.parametrize('dtype', [float, complex])
+def test_count_states_matches_legacy_loop(dtype):
+	random = np.random.RandomState(0)
+	num_covariances, nres = 4, 500
+	vectors = random.randn(num_covariances, nres+10)
+	if dtype is complex:
+		vectors = vectors + 1j*random.randn(num_covariances, nres+10)
+	thresholds = random.randn(num_covariances)*0.3
+	counts = zi_readout.count_states(list(vectors), thresholds, nres, num_covariances)
+	np.testing.assert_array_equal(counts, legacy_count_states(vectors, thresholds, nres, num_covariances))
+	assert np.sum(counts) == nres
+
+
+def test_count_states_with_unused_channels():
+	counts = zi_readout.count_states([np.asarray([1., -1., 1.])], [0., 0.], 3, num_channels=2)
+	np.testing.assert_array_equal(counts, [1, 2, 0, 0])
+
+
+def test_unchanged_weights_are_not_resent(uhf):
+	device, daq = uhf
+	weights = {0: (np.ones(16), np.zeros(16)), 1: (np.zeros(16), np.ones(16))}
+	assert device.set_weights(weights) == 2
+	assert daq.transactions == 1
+	np.testing.assert_array_equal(daq.values['/dev2491/qas/0/integration/weights/1/imag'], np.ones(16))
+
+	assert device.set_weights({0: (np.ones(16), np.zeros(16)), 1: (np.zeros(16), np.ones(16))}) == 0
+	assert daq.transactions == 1
+
+	assert device.set_weights({0: (np.ones(16), np.zeros(16)), 1: (np.ones(16), np.ones(16))}) == 1
+	assert daq.transactions == 2
+	np.testing.assert_array_equal(daq.values['/dev2491/qas/0/integration/weights/1/real'], np.ones(16))
+
+	# weights changed outside of the driver are resent after clear_shadow()
+	device.clear_shadow()
+	assert device.set_weights(weights) == 2
+	assert daq.transactions == 3
+
+
+def test_crosstalk_matrix_is_read_with_one_wildcard_get(uhf):
+	device, daq = uhf
+	expected = np.arange(100, dtype=float).reshape(10, 10)
+	for row in range(10):
+		for col in range(10):
+			daq.values['/dev2491/qas/0/crosstalk/rows/{}/cols/{}'.format(row, col)] = expected[row, col]
+	daq.values['/dev2491/qas/0/crosstalk/bypass'] = 1
+
+	np.testing.assert_array_equal(device.crosstalk_matrix, expected)
+	assert daq.transactions == 1
+
+
+def test_crosstalk_matrix_is_written_with_one_batched_set(uhf):
+	device, daq = uhf
+	device.crosstalk_matrix = np.eye(3)
+	assert daq.transactions == 1
+	assert daq.values['/dev2491/qas/0/crosstalk/rows/1/cols/1'] == 1
+	assert daq.values['/dev2491/qas/0/crosstalk/rows/1/cols/2'] == 0
+
+	device.crosstalk_matrix = np.eye(3)
+	assert daq.transactions == 1
+
+	written = []
+	daq.set = lambda items: written.append(list(items))
+	matrix = np.eye(3)
+	matrix[0, 2] = 0.5
+	device.crosstalk_matrix = matrix
+	assert written == [[('/dev2491/qas/0/crosstalk/rows/0/cols/2', 0.5)]]
+
+
+def test_measure_reads_completed_acquisition(uhf):
+	device, daq = uhf
+	device.nres = 4
+	result = device.measure()
+	assert daq.acquisitions == 1
+	assert set(result) == {'Voltage', 'Integration0', 'Integration1', 'resultnumbers'}
+	assert result['Integration0'].shape == (4,)
+	assert np.sum(result['resultnumbers']) == 4
+
+
+def test_measure_raises_on_timeout(uhf):
+	device, daq = uhf
+	daq.shot_time = 1.
+	device.nres = 1
+	device.timeout = 0.05
+	with pytest.raises(TimeoutError):
+		device.measure()
+	assert not device.armed
+	assert daq.values['/dev2491/awgs/0/enable'] == 0
+	assert daq.acquisitions == 0
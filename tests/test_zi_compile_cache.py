@@ -0,0 +1,32 @@
+import os
+
+from qsweepy.instrument_drivers.zi_compile_cache import SeqcCompileCache
+
+
+def counting_compiler(program, *context):
+	counting_compiler.calls += 1
+	return (program + repr(context)).encode()
+counting_compiler.calls = 0
+
+
+def test_context_is_part_of_the_key(tmp_path):
+	counting_compiler.calls = 0
+	cache = SeqcCompileCache(counting_compiler, directory=str(tmp_path))
+	program = 'playWave(w);'
+	cache.get(program, 0, ('21.08', 1), 'HDAWG8', 0)
+	cache.get(program, 0, ('21.08', 1), 'HDAWG8', 0)
+	cache.get(program, 0, ('22.02', 1), 'HDAWG8', 0)
+	cache.get(program, 0, ('22.02', 1), 'HDAWG4', 0)
+	assert counting_compiler.calls == 3 and cache.hits == 1
+	# binaries on disk survive a new cache instance
+	assert SeqcCompileCache(counting_compiler, directory=str(tmp_path)).get(program, 0, ('22.02', 1), 'HDAWG4', 0) \
+		== counting_compiler(program, 0, ('22.02', 1), 'HDAWG4', 0)
+
+
+def test_remove(tmp_path):
+	cache = SeqcCompileCache(counting_compiler, directory=str(tmp_path))
+	cache.get('wait(1);', 1)
+	key = cache.key('wait(1);', 1)
+	assert os.path.isfile(cache.path(key))
+	cache.remove(key)
+	assert key not in cache.binaries and not os.path.isfile(cache.path(key))
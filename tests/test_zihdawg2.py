@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import types
+
+import pytest
+
+from qsweepy.instrument_drivers.dummy_zi import DummyZIDAQ
+
+
+class Sequence:
+	def __init__(self, program):
+		self.program = program
+
+	def zicode(self):
+		return self.program
+
+
+@pytest.fixture
+def hdawg(monkeypatch, tmp_path):
+	'''
+	HDAWG8 in 4x2 mode (four sequencers) connected to a DummyZIDAQ instead of a data server. events records
+	the sequencer stops/starts and the ELF uploads in the order they are sent.
+	'''
+	daq = DummyZIDAQ(compile_latency=0.3, upload_latency=1e-3, directory=str(tmp_path / 'awg'))
+	utils = types.ModuleType('zhinst.utils')
+	utils.create_api_session = lambda device_id, api_level, required_devtype=None: (daq, device_id, None)
+	utils.api_server_version_check = lambda daq: None
+	utils.disable_everything = lambda daq, device: None
+	zhinst = types.ModuleType('zhinst')
+	zhinst.utils = utils
+	monkeypatch.setitem(sys.modules, 'zhinst', zhinst)
+	monkeypatch.setitem(sys.modules, 'zhinst.utils', utils)
+	monkeypatch.delitem(sys.modules, 'qsweepy.instrument_drivers.zihdawg2', raising=False)
+	from qsweepy.instrument_drivers.zihdawg2 import ZIDevice
+	device = ZIDevice('dev8000', 'HDAWG', config=0, compile_cache_directory=str(tmp_path / 'cache'))
+
+	events = []
+	set_int = daq.setInt
+	def record_enable(path, value):
+		if path.startswith('/dev8000/awgs/') and path.endswith('/enable'):
+			events.append(('start' if value else 'stop', int(path.split('/')[3])))
+		set_int(path, value)
+	daq.setInt = record_enable
+	module_set = device.awgModule.set
+	def record_upload(path, value):
+		if path == 'awgModule/elf/upload':
+			events.append(('upload', device.awgModule.getInt('awgModule/index')))
+		module_set(path, value)
+	device.awgModule.set = record_upload
+	return device, daq, events
+
+
+def test_programs_are_compiled_concurrently_and_cached(hdawg):
+	device, daq, events = hdawg
+	sequences = {sequencer_id: Sequence('wait({});'.format(sequencer_id)) for sequencer_id in range(4)}
+	start = time.perf_counter()
+	device.set_sequences(sequences)
+	# four compilations of 0.3 s each take about the time of one (plus four uploads of about 0.1 s);
+	# compiling one after another would take 1.2 s
+	assert time.perf_counter() - start < 1.2
+	assert daq.compilations() == 4
+	assert len(device.compile_modules) == 4
+
+	device.set_sequences(sequences)
+	assert daq.compilations() == 4
+	assert device.compile_cache.hits == 4
+
+
+def test_sequencers_are_stopped_uploaded_and_started_together(hdawg):
+	device, daq, events = hdawg
+	device.set_sequences({0: Sequence('wait(1);'), 2: Sequence('wait(2);')})
+	assert [event for event, sequencer_id in events] == ['stop']*2 + ['upload']*2 + ['start']*2
+	assert sorted(sequencer_id for event, sequencer_id in events if event == 'upload') == [0, 2]
+	assert sorted(sequencer_id for event, sequencer_id in events if event == 'start') == [0, 2]
+
+	del events[:]
+	device.set_sequences({1: Sequence('wait(3);')}, start=False)
+	assert events == [('stop', 1), ('upload', 1)]
+
+
+def test_close_finishes_and_clears_compile_modules(hdawg):
+	device, daq, events = hdawg
+	device.set_sequences({0: Sequence('wait(1);'), 1: Sequence('wait(2);')})
+	modules = list(device.compile_modules.values())
+	device.close()
+	assert device.compile_modules == {}
+	assert all(module.finished and module.cleared for module in modules)
+
+	# the next compilation creates a new module
+	device.set_sequences({0: Sequence('wait(4);')})
+	assert list(device.compile_modules.keys()) == [0]
+	assert device.compile_modules[0] not in modules
+
+
+def test_remove_awg_program(hdawg):
+	device, daq, events = hdawg
+	device.set_sequences({0: Sequence('wait(1);'), 1: Sequence('wait(1);'), 2: Sequence('wait(2);')})
+	assert len(device.programs()) == 3
+
+	device.remove_awg_program(Sequence('wait(1);'))
+	assert len(device.programs()) == 1
+	key, = device.programs()
+	assert os.path.isfile(device.compile_cache.path(key))
+	# keys returned by programs() are accepted as well
+	device.remove_awg_program(key)
+	assert device.programs() == set()
+	assert not os.path.isfile(device.compile_cache.path(key))
+
+	device.set_sequences({2: Sequence('wait(2);')})
+	assert daq.compilations() == 4